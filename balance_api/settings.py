@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wallet.middleware.ReplicaRoutingMiddleware',
     'wallet.middleware.SecurityLoggingMiddleware',
     'wallet.middleware.RateLimitingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -98,6 +99,56 @@ DATABASES = {
     }
 }
 
+# Режим соединений с базой (DB_CONN_MODE):
+#   none       - новое соединение на каждый запрос (по умолчанию)
+#   persistent - постоянные соединения на поток, пересоздаются через DB_CONN_MAX_AGE секунд
+#   pool       - пул соединений процесса (psycopg 3) с размерами DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE
+# В режимах persistent и pool соединение проверяется перед использованием.
+DB_CONN_MODE = os.getenv('DB_CONN_MODE', 'none')
+
+if DB_CONN_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONN_MODE == 'pool':
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'max_lifetime': float(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1,replica2:5433
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()):
+    replica_host, _, replica_port = replica_host.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['wallet.routers.PrimaryReplicaRouter']
+
+# Окно read-your-writes после изменяющего запроса и пауза перед повторной проверкой упавшей реплики
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+# Кэш Django. По умолчанию - память процесса; закреплению за основной базой по пользователю
+# и общему кэшу токенов нужен кэш, общий для всех процессов:
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://redis:6379/0
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -143,9 +194,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'wallet.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'wallet.authentication.CachedBasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -154,6 +205,80 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Кэш проверенных токенов: размер LRU-кэша процесса, время жизни записи и использование общего кэша Django
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.getenv('TOKEN_AUTH_CACHE_SIZE', '10000')),
+    'TTL': int(os.getenv('TOKEN_AUTH_CACHE_TTL', '60')),
+    'SHARED': os.getenv('TOKEN_AUTH_CACHE_SHARED', 'False') == 'True',
+}
+
+# Кэш проверенных учетных данных Basic-аутентификации (0 - без кэша)
+BASIC_AUTH_CACHE = {
+    'MAX_SIZE': int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1000')),
+    'TTL': int(os.getenv('BASIC_AUTH_CACHE_TTL', '30')),
+}
+
+# Объединение одновременных одинаковых GET-запросов и время раздачи готового ответа
+COALESCE_READS = os.getenv('COALESCE_READS', 'True') == 'True'
+COALESCE_WINDOW_SECONDS = float(os.getenv('COALESCE_WINDOW_SECONDS', '0.05'))
+
+# Режим изменения балансов: pessimistic (SELECT ... FOR UPDATE) или optimistic (колонка version и повторы)
+BALANCE_WRITE_MODE = os.getenv('BALANCE_WRITE_MODE', 'pessimistic')
+BALANCE_OPTIMISTIC_RETRIES = int(os.getenv('BALANCE_OPTIMISTIC_RETRIES', '5'))
+
+# Outbox событий изменения балансов и получатель, которому их доставляет dispatch_outbox
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'True') == 'True'
+# После стольких неудачных попыток событие паркуется и больше не отправляется
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '20'))
+if os.getenv('OUTBOX_WEBHOOK_URL'):
+    OUTBOX_SINK = {
+        'BACKEND': 'wallet.outbox.HttpSink',
+        'OPTIONS': {
+            'url': os.getenv('OUTBOX_WEBHOOK_URL'),
+            'timeout': float(os.getenv('OUTBOX_WEBHOOK_TIMEOUT', '10')),
+        },
+    }
+else:
+    OUTBOX_SINK = {
+        'BACKEND': 'wallet.outbox.FileSink',
+        'OPTIONS': {'path': os.getenv('OUTBOX_FILE', os.path.join(BASE_DIR, 'logs', 'outbox.ndjson'))},
+    }
+
+# SQLite-индекс событий логов для analyze_logs
+LOG_ANALYSIS_INDEX = os.getenv('LOG_ANALYSIS_INDEX', os.path.join(BASE_DIR, 'logs', 'analytics.sqlite3'))
+
+# Уведомления об изменении баланса (/api/wallet/events/): local - только в своем процессе,
+# postgres - через LISTEN/NOTIFY между всеми процессами
+WALLET_EVENTS = {
+    'BACKEND': os.getenv('WALLET_EVENTS_BACKEND', 'local'),
+    'HEARTBEAT_SECONDS': float(os.getenv('WALLET_EVENTS_HEARTBEAT_SECONDS', '15')),
+    'STREAM_SECONDS': float(os.getenv('WALLET_EVENTS_STREAM_SECONDS', '300')),
+    'POLL_TIMEOUT_SECONDS': float(os.getenv('WALLET_EVENTS_POLL_TIMEOUT_SECONDS', '25')),
+}
+
+# Журнал событий безопасности в базе (AuditEvent): запись пачками из фонового потока
+AUDIT_LOG = {
+    'ENABLED': os.getenv('AUDIT_LOG_ENABLED', 'True') == 'True',
+    'BATCH_SIZE': int(os.getenv('AUDIT_LOG_BATCH_SIZE', '200')),
+    'FLUSH_INTERVAL_MS': float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL_MS', '500')),
+    'QUEUE_SIZE': int(os.getenv('AUDIT_LOG_QUEUE_SIZE', '10000')),
+}
+
+# Массовое удаление транзакций в админке: чанки по id с паузой, большие выборки - в фоне
+BULK_DELETE = {
+    'CHUNK_SIZE': int(os.getenv('BULK_DELETE_CHUNK_SIZE', '1000')),
+    'PAUSE_MS': float(os.getenv('BULK_DELETE_PAUSE_MS', '100')),
+    'BACKGROUND_THRESHOLD': int(os.getenv('BULK_DELETE_BACKGROUND_THRESHOLD', '10000')),
+}
+
+# Групповая фиксация пополнений и переводов: размер пачки, ожидание пачки и потолок задержки запроса
+GROUP_COMMIT = {
+    'ENABLED': os.getenv('GROUP_COMMIT_ENABLED', 'False') == 'True',
+    'MAX_BATCH': int(os.getenv('GROUP_COMMIT_MAX_BATCH', '100')),
+    'MAX_WAIT_MS': float(os.getenv('GROUP_COMMIT_MAX_WAIT_MS', '5')),
+    'LATENCY_CEILING_MS': float(os.getenv('GROUP_COMMIT_LATENCY_CEILING_MS', '50')),
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -236,6 +361,10 @@ LOGGING = {
             'backupCount': 20,
             'formatter': 'detailed',
         },
+        'audit_db': {
+            'level': 'WARNING',
+            'class': 'wallet.audit.AuditHandler',
+        },
     },
     'loggers': {
         'django': {
@@ -264,7 +393,7 @@ LOGGING = {
             'propagate': False,
         },
         'wallet.security': {
-            'handlers': ['file_security', 'console'],
+            'handlers': ['file_security', 'console', 'audit_db'],
             'level': 'WARNING',
             'propagate': False,
         },
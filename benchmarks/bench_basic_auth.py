@@ -0,0 +1,58 @@
+"""
+Нагрузочный тест GET /api/wallet/balance/ с HTTP Basic-аутентификацией
+без кэша проверенных учетных данных и с ним.
+
+    python -m benchmarks.bench_basic_auth --threads 1 --duration 10
+
+По умолчанию нагрузка идет в один поток: хеширование пароля упирается
+в CPU, и ops_per_sec при --threads 1 - это запросы в секунду на ядро.
+Кэш отключается через BASIC_AUTH_CACHE_TTL=0.
+"""
+import argparse
+import base64
+import json
+
+from benchmarks.harness import create_users, print_table, run_load, run_variants, setup_django
+
+
+def child(args):
+    setup_django()
+    from django.test import Client
+
+    users = create_users(args.threads, prefix='bench_basic', balance_kopecks=10000)
+    clients = []
+    for user, _ in users:
+        credentials = base64.b64encode(f'{user.username}:benchpass123'.encode()).decode()
+        clients.append(Client(HTTP_AUTHORIZATION=f'Basic {credentials}'))
+
+    def worker(index):
+        return clients[index].get('/api/wallet/balance/').status_code == 200
+
+    run_load(worker, args.threads, min(args.duration, 1))
+    print(json.dumps(run_load(worker, args.threads, args.duration)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = run_variants(
+        'benchmarks.bench_basic_auth',
+        [
+            ('no_cache', {'BASIC_AUTH_CACHE_TTL': '0'}),
+            ('cache', {'BASIC_AUTH_CACHE_TTL': '30'}),
+        ],
+        extra_args=['--threads', str(args.threads), '--duration', str(args.duration)],
+    )
+    print_table(results, ['variant', 'threads', 'ok', 'errors', 'ops_per_sec', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
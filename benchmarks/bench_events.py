@@ -0,0 +1,57 @@
+"""
+Стоимость ожидающих подписок на /api/wallet/events/ в одном процессе.
+
+    python -m benchmarks.bench_events --connections 1000 5000 10000
+
+Открывает N потоков событий (event_stream) на одном цикле событий,
+как это делает ASGI-сервер, и измеряет память на соединение
+(tracemalloc) и задержку доставки сообщения всем подпискам одного
+пользователя после publish.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.harness import print_table, setup_django
+
+
+async def measure(connections):
+    from wallet.events import broker, event_stream
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = [event_stream(index % 100) for index in range(connections)]
+    # Первый фрагмент (retry) оформляет подписку, дальше поток ждет сообщения
+    await asyncio.gather(*(anext(stream) for stream in streams))
+    pending = [asyncio.ensure_future(anext(stream)) for stream in streams]
+    await asyncio.sleep(0.1)
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for user_id in range(100):
+        broker.publish(user_id, {'type': 'balance', 'user_id': user_id, 'balance_kopecks': 0})
+    await asyncio.gather(*pending)
+    fanout_ms = (time.perf_counter() - started) * 1000
+
+    await asyncio.gather(*(stream.aclose() for stream in streams))
+    return {
+        'connections': connections,
+        'bytes_per_connection': round(per_connection),
+        'fanout_ms': round(fanout_ms, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, nargs='+', default=[1000, 5000, 10000])
+    args = parser.parse_args()
+
+    setup_django()
+    results = [asyncio.run(measure(count)) for count in args.connections]
+    print_table(results, ['connections', 'bytes_per_connection', 'fanout_ms'])
+
+
+if __name__ == '__main__':
+    main()
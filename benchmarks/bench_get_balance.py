@@ -0,0 +1,55 @@
+"""
+Нагрузочный тест GET /api/wallet/balance/ в разных режимах соединений с базой.
+
+    python -m benchmarks.bench_get_balance --threads 8 --duration 10
+
+Каждый режим (DB_CONN_MODE=none/persistent/pool) запускается в отдельном
+процессе; запросы идут через тестовый клиент Django, поэтому на каждый
+запрос срабатывают request_started/request_finished и соединения
+закрываются или переиспользуются так же, как под сервером приложений.
+"""
+import argparse
+import json
+
+from benchmarks.harness import create_users, print_table, run_load, run_variants, setup_django
+
+
+def child(args):
+    setup_django()
+    from django.test import Client
+
+    users = create_users(args.threads, prefix='bench_balance', balance_kopecks=10000, with_tokens=True)
+    clients = [Client(HTTP_AUTHORIZATION=f'Token {token}') for user, token in users]
+
+    def worker(index):
+        return clients[index].get('/api/wallet/balance/').status_code == 200
+
+    run_load(worker, args.threads, min(args.duration, 1))
+    print(json.dumps(run_load(worker, args.threads, args.duration)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = run_variants(
+        'benchmarks.bench_get_balance',
+        [
+            ('none', {'DB_CONN_MODE': 'none'}),
+            ('persistent', {'DB_CONN_MODE': 'persistent'}),
+            ('pool', {'DB_CONN_MODE': 'pool', 'DB_POOL_MAX_SIZE': str(args.threads)}),
+        ],
+        extra_args=['--threads', str(args.threads), '--duration', str(args.duration)],
+    )
+    print_table(results, ['variant', 'threads', 'ok', 'errors', 'ops_per_sec', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Нагрузочный тест переводов без групповой фиксации и с ней.
+
+    python -m benchmarks.bench_group_commit --threads 32 --duration 10
+
+Каждый поток переводит по копейке со своего счета на счет соседа через
+POST /api/wallet/transfer/. Кроме переводов в секунду на PostgreSQL
+выводится число коммитов в секунду по pg_stat_database.
+"""
+import argparse
+import json
+
+from benchmarks.harness import create_users, print_table, run_load, run_variants, setup_django
+
+
+def commit_count():
+    from django.db import connection
+
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+def child(args):
+    setup_django()
+    from django.db import connection
+    from django.test import Client
+
+    users = create_users(args.threads, prefix='bench_group', balance_kopecks=10 ** 9, with_tokens=True)
+    clients = [Client(HTTP_AUTHORIZATION=f'Token {token}') for user, token in users]
+    payloads = [
+        json.dumps({'recipient_id': users[(index + 1) % len(users)][0].id, 'amount_kopecks': 1})
+        for index in range(len(users))
+    ]
+
+    def worker(index):
+        response = clients[index].post('/api/wallet/transfer/', payloads[index], content_type='application/json')
+        return response.status_code == 200
+
+    run_load(worker, args.threads, min(args.duration, 1))
+    commits_before = commit_count()
+    connection.close()
+    result = run_load(worker, args.threads, args.duration)
+    commits_after = commit_count()
+    if commits_before is not None:
+        # pg_stat_database обновляется с задержкой до PGSTAT_STAT_INTERVAL
+        result['commits_per_sec'] = round((commits_after - commits_before) / result['seconds'], 1)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = run_variants(
+        'benchmarks.bench_group_commit',
+        [
+            ('direct', {'GROUP_COMMIT_ENABLED': 'False'}),
+            ('group_commit', {'GROUP_COMMIT_ENABLED': 'True'}),
+        ],
+        extra_args=['--threads', str(args.threads), '--duration', str(args.duration)],
+    )
+    print_table(results, ['variant', 'threads', 'ok', 'errors', 'ops_per_sec', 'commits_per_sec', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
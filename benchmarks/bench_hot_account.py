@@ -0,0 +1,63 @@
+"""
+Нагрузочный тест переводов на один горячий счет при разном количестве слотов.
+
+    python -m benchmarks.bench_hot_account --threads 16 --duration 10 --shards 0 4 16
+
+Каждый поток переводит по копейке со своего счета на общий счет получателя
+через POST /api/wallet/transfer/. При shard_count = 0 все переводы ждут
+блокировки одной строки UserBalance получателя, со слотами зачисления
+расходятся по K строкам. Имеет смысл только на PostgreSQL: SQLite
+блокирует всю базу на запись.
+"""
+import argparse
+import json
+import os
+
+from benchmarks.harness import create_users, print_table, run_load, run_variants, setup_django
+
+
+def child(args):
+    setup_django()
+    from django.db import transaction
+    from django.test import Client
+    from wallet.services import configure_shards, rebalance
+
+    senders = create_users(args.threads, prefix='bench_hot_sender', balance_kopecks=10 ** 9, with_tokens=True)
+    (merchant, _), = create_users(1, prefix='bench_hot_merchant')
+    with transaction.atomic():
+        merchant_balance = configure_shards(merchant.balance, int(os.environ['BENCH_SHARDS']))
+        rebalance(merchant_balance)
+
+    clients = [Client(HTTP_AUTHORIZATION=f'Token {token}') for user, token in senders]
+    payload = json.dumps({'recipient_id': merchant.id, 'amount_kopecks': 1})
+
+    def worker(index):
+        response = clients[index].post('/api/wallet/transfer/', payload, content_type='application/json')
+        return response.status_code == 200
+
+    run_load(worker, args.threads, min(args.duration, 1))
+    print(json.dumps(run_load(worker, args.threads, args.duration)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 4, 16])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = run_variants(
+        'benchmarks.bench_hot_account',
+        [(f'shards={count}', {'BENCH_SHARDS': str(count)}) for count in args.shards],
+        extra_args=['--threads', str(args.threads), '--duration', str(args.duration)],
+    )
+    print_table(results, ['variant', 'threads', 'ok', 'errors', 'ops_per_sec', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Скорость разбора строк формата detailed одним процессом.
+
+    python -m benchmarks.bench_log_parsing --lines 1000000
+
+Строки генерируются в памяти, чтобы замер не зависел от диска: отдельно
+строки, которые отбрасываются по типу события (BALANCE_VIEW), отдельно
+переводы с десятью полями и смесь с долей --relevant нужных событий.
+tokenize - только Tokenizer (ts, level, logger, event, fields),
+parse - событие индекса целиком, с переводом суммы в копейки.
+
+Цель - 1 млн строк/с на ядро - ставится только для строк, отбрасываемых
+по типу события (skipped): в логах их подавляющее большинство, и для них
+строка делится только до типа события. Строки с полями (transfers) этой
+цели не достигают: в CPython время уходит на разбор ~10 полей в dict,
+и даже один regex по целому чанку дает лишь ~300 тыс. строк/с. Для них
+и для смеси выводится фактическая скорость, а столбец target_met
+показывает выполнение цели только для skipped.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.harness import print_table
+from wallet.loganalysis.parsing import TRANSACTION_TOKENIZER, parse_transaction_line
+
+
+TS = '2026-10-19 08:00:00'
+
+TARGET_LINES_PER_SEC = 1000000
+TARGET_WORKLOADS = ('skipped',)
+
+
+def skipped_line(index):
+    return f'{TS} | INFO | wallet.transactions | get_balance:69 | BALANCE_VIEW | user=user{index % 1000} | balance=100.0'
+
+
+def deposit_line(index):
+    return (
+        f'{TS} | INFO | wallet.transactions | deposit_money:210 | DEPOSIT_SUCCESS | user=user{index % 1000} | '
+        f'amount=12.50 | old_balance=100.0 | new_balance=112.5 | transaction_id={index}'
+    )
+
+
+def transfer_line(index):
+    return (
+        f'{TS} | INFO | wallet.transactions | transfer_money:369 | TRANSFER_SUCCESS | sender=user{index % 1000} | '
+        f'recipient=user{(index + 1) % 1000} | amount=12.50 | sender_old_balance=100.0 | sender_new_balance=87.5 | '
+        f'recipient_old_balance=1.0 | recipient_new_balance=13.5 | out_transaction_id={index} | in_transaction_id={index + 1}'
+    )
+
+
+def mixed_lines(count, relevant):
+    generator = random.Random(0)
+    lines = []
+    for index in range(count):
+        roll = generator.random()
+        if roll >= relevant:
+            lines.append(skipped_line(index))
+        elif roll < relevant / 2:
+            lines.append(deposit_line(index))
+        else:
+            lines.append(transfer_line(index))
+    return lines
+
+
+def lines_per_sec(function, lines):
+    started = time.perf_counter()
+    for line in lines:
+        function(line)
+    return round(len(lines) / (time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--relevant', type=float, default=0.1, help='Доля DEPOSIT/TRANSFER_SUCCESS в смеси')
+    args = parser.parse_args()
+
+    workloads = [
+        ('skipped', [skipped_line(index) for index in range(args.lines)]),
+        ('transfers', [transfer_line(index) for index in range(args.lines)]),
+        (f'mixed {args.relevant:.0%}', mixed_lines(args.lines, args.relevant)),
+    ]
+    results = []
+    for name, lines in workloads:
+        parse_rate = lines_per_sec(parse_transaction_line, lines)
+        results.append({
+            'workload': name,
+            'lines': len(lines),
+            'tokenize_lines_per_sec': lines_per_sec(TRANSACTION_TOKENIZER, lines),
+            'parse_lines_per_sec': parse_rate,
+            'target_met': parse_rate >= TARGET_LINES_PER_SEC if name in TARGET_WORKLOADS else '-',
+        })
+    print_table(results, ['workload', 'lines', 'tokenize_lines_per_sec', 'parse_lines_per_sec', 'target_met'])
+
+
+if __name__ == '__main__':
+    main()
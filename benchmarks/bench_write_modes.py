@@ -0,0 +1,61 @@
+"""
+Нагрузочный тест пополнений в режимах pessimistic и optimistic
+при низкой и высокой конкуренции за строки балансов.
+
+    python -m benchmarks.bench_write_modes --threads 16 --duration 10
+
+low  - каждый поток пополняет свой счет;
+high - все потоки пополняют один общий счет.
+Ответы 409 (конфликт не разрешился за BALANCE_OPTIMISTIC_RETRIES повторов)
+считаются ошибками.
+"""
+import argparse
+import json
+import os
+
+from benchmarks.harness import create_users, print_table, run_load, run_variants, setup_django
+
+
+def child(args):
+    setup_django()
+    from django.test import Client
+
+    users = create_users(args.threads, prefix='bench_write', with_tokens=True)
+    if os.environ['BENCH_CONTENTION'] == 'high':
+        users = [users[0]] * args.threads
+    clients = [Client(HTTP_AUTHORIZATION=f'Token {token}') for user, token in users]
+    payload = json.dumps({'amount_kopecks': 1})
+
+    def worker(index):
+        response = clients[index].post('/api/wallet/deposit/', payload, content_type='application/json')
+        return response.status_code == 200
+
+    run_load(worker, args.threads, min(args.duration, 1))
+    print(json.dumps(run_load(worker, args.threads, args.duration)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = run_variants(
+        'benchmarks.bench_write_modes',
+        [
+            (f'{mode}/{contention}', {'BALANCE_WRITE_MODE': mode, 'BENCH_CONTENTION': contention})
+            for contention in ('low', 'high')
+            for mode in ('pessimistic', 'optimistic')
+        ],
+        extra_args=['--threads', str(args.threads), '--duration', str(args.duration)],
+    )
+    print_table(results, ['variant', 'threads', 'ok', 'errors', 'ops_per_sec', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
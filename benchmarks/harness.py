@@ -0,0 +1,133 @@
+"""
+Общие функции нагрузочных тестов.
+
+Скрипты запускаются из корня проекта против базы из настроек (.env):
+    python -m benchmarks.bench_get_balance
+"""
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(with_logging=False):
+    """
+    Инициализация Django для запуска вне manage.py.
+    DEBUG отключается, чтобы connection.queries не рос во время замера.
+    """
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'balance_api.settings')
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DEBUG = False
+    if 'testserver' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS.append('testserver')
+    if not with_logging:
+        logging.disable(logging.CRITICAL)
+
+
+def create_users(count, prefix='bench', balance_kopecks=0, with_tokens=False):
+    """
+    Создание (или повторное использование) пользователей для нагрузки.
+    Возвращает список (user, token_key или None).
+    """
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+    from wallet.models import UserBalance
+
+    users = []
+    for index in range(count):
+        user, created = User.objects.get_or_create(username=f'{prefix}_{index}')
+        if created:
+            user.set_password('benchpass123')
+            user.save()
+        UserBalance.objects.update_or_create(user=user, defaults={'balance_kopecks': balance_kopecks})
+        token = Token.objects.get_or_create(user=user)[0].key if with_tokens else None
+        users.append((user, token))
+    return users
+
+
+def run_load(worker, threads, duration):
+    """
+    Запускает worker(thread_index) в threads потоках в течение duration секунд.
+    worker выполняет одну операцию и возвращает True при успехе.
+    """
+    from django.db import connections
+
+    stop_at = time.monotonic() + duration
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+
+    def loop(index):
+        try:
+            while time.monotonic() < stop_at:
+                started = time.monotonic()
+                try:
+                    ok = worker(index)
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies[index].append(time.monotonic() - started)
+                else:
+                    errors[index] += 1
+        finally:
+            connections.close_all()
+
+    started = time.monotonic()
+    pool = [threading.Thread(target=loop, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    samples = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    return {
+        'threads': threads,
+        'ok': len(samples),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 2),
+        'ops_per_sec': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(statistics.median(samples) * 1000, 2) if samples else None,
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1] * 1000, 2) if samples else None,
+    }
+
+
+def run_variants(module, variants, extra_args=()):
+    """
+    Запускает module в отдельном процессе для каждого варианта окружения:
+    настройки базы читаются при старте, поэтому режимы нельзя сменить на лету.
+    variants: [(название, {переменная окружения: значение})]
+    """
+    results = []
+    for name, env in variants:
+        child_env = {**os.environ, **env}
+        output = subprocess.run(
+            [sys.executable, '-m', module, '--child', *extra_args],
+            cwd=PROJECT_ROOT,
+            env=child_env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append({'variant': name, **result})
+    return results
+
+
+def print_table(rows, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column))) for row in rows)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row.get(column)).ljust(widths[column]) for column in columns))
@@ -1,7 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import UserBalance, Transaction
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from .audit import AUDIT_EVENT_TYPES
+from .bulk_delete import delete_in_chunks, delete_or_start_job
+from .changelist import CreatedAtRangeFilter, EstimatedCountPaginator, LargeTableAdminMixin, estimated_count
+from .models import ACTIVITY_FIELDS, AuditEvent, BulkDeleteJob, UserBalance, Transaction
+from .search import description_matches, search_users
 import logging
 
 
@@ -13,7 +20,10 @@ class UserBalanceInline(admin.StackedInline):
     model = UserBalance
     can_delete = False
     verbose_name_plural = 'Баланс'
-    readonly_fields = ('created_at', 'updated_at')
+    # Число слотов меняется только через configure_shards (команда rebalance_shards),
+    # которая переносит средства слотов и создает их строки; версию меняют только
+    # записи баланса, иначе оптимистичная запись со старой версией прошла бы проверку
+    readonly_fields = ('shard_count', 'version', 'created_at', 'updated_at', *ACTIVITY_FIELDS)
 
 
 class UserAdmin(BaseUserAdmin):
@@ -25,7 +35,7 @@ class UserAdmin(BaseUserAdmin):
         """
         action = "изменен" if change else "создан"
         logger.info(f"Пользователь {obj.username} {action} администратором {request.user.username}")
-        security_logger.info(f"ADMIN_USER_ACTION | admin={request.user.username} | target={obj.username} | action={action}")
+        security_logger.warning(f"ADMIN_USER_ACTION | admin={request.user.username} | target={obj.username} | action={action}")
         super().save_model(request, obj, form, change)
 
 
@@ -34,7 +44,16 @@ class UserBalanceAdmin(admin.ModelAdmin):
     list_display = ('user', 'balance_kopecks', 'get_balance_rubles', 'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('shard_count', 'version', 'created_at', 'updated_at', *ACTIVITY_FIELDS)
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск подстроки в имени или почте по триграммным индексам (см. wallet.search)
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return search_users(queryset, term, prefix='user__'), False
     
     def get_balance_rubles(self, obj):
         return f"{obj.get_balance_rubles()} ₽"
@@ -69,18 +88,45 @@ class UserBalanceAdmin(admin.ModelAdmin):
             )
         else:
             logger.info(f"Баланс пользователя {obj.user.username} {action} администратором {request.user.username}")
-            security_logger.info(
+            security_logger.warning(
                 f"ADMIN_BALANCE_ACTION | admin={request.user.username} | user={obj.user.username} | action={action}"
             )
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Список рассчитан на сотни миллионов строк: число строк оценивается,
+    страницы листаются по ключу (created_at, id), фильтр по дате работает
+    диапазонами, пользователи загружаются тем же запросом, что и строки
+    """
     list_display = ('id', 'get_from_user', 'to_user', 'amount_kopecks', 'get_amount_rubles', 'transaction_type', 'created_at')
-    list_filter = ('transaction_type', 'created_at')
-    search_fields = ('from_user__username', 'to_user__username', 'description')
+    list_filter = ('transaction_type', CreatedAtRangeFilter)
+    list_select_related = ('from_user', 'to_user')
+    search_fields = ('=from_user__username', '=to_user__username', 'description')
+    search_help_text = 'Точное имя отправителя или получателя, номер транзакции или слова из описания'
     readonly_fields = ('id', 'created_at')
-    date_hierarchy = 'created_at'
+    ordering = ('-created_at', '-id')
+    raw_id_fields = ('from_user', 'to_user', 'account')
+    actions = ('delete_transactions',)
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Имя переводится в id пользователя отдельным запросом по уникальному индексу,
+        чтобы выборка шла по индексам (from_user, id) и (to_user, id), а не через
+        JOIN с auth_user и сравнение UPPER(username) для каждой строки.
+        Описание ищется полнотекстово по GIN-индексу (см. wallet.search)
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = description_matches(term, queryset.db)
+        if term.isdigit():
+            condition |= Q(pk=int(term))
+        user_id = User.objects.filter(username=term).values_list('id', flat=True).first()
+        if user_id is not None:
+            condition |= Q(from_user_id=user_id) | Q(to_user_id=user_id)
+        return queryset.filter(condition), False
     
     def get_from_user(self, obj):
         return obj.from_user.username if obj.from_user else "Система"
@@ -127,16 +173,123 @@ class TransactionAdmin(admin.ModelAdmin):
     
     def delete_queryset(self, request, queryset):
         """
-        Логирование массового удаления транзакций в админке
+        Массовое удаление чанками по id; каждый чанк записывается в журнал безопасности
         """
-        transaction_count = queryset.count()
-        logger.error(
-            f"Массовое удаление {transaction_count} транзакций администратором {request.user.username}"
-        )
-        security_logger.error(
-            f"ADMIN_BULK_TRANSACTION_DELETE | admin={request.user.username} | count={transaction_count}"
-        )
-        super().delete_queryset(request, queryset)
+        delete_in_chunks(queryset, request.user.username)
+    
+    def get_actions(self, request):
+        """
+        Стандартное delete_selected загружает всю выборку в память и выводит ее
+        на странице подтверждения, вместо него - delete_transactions
+        """
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+    
+    @admin.action(permissions=['delete'], description='Удалить выбранные транзакции')
+    def delete_transactions(self, request, queryset):
+        """
+        Подтверждение показывает только оценку числа строк; большая выборка
+        удаляется в фоне, небольшая - сразу, в обоих случаях чанками
+        """
+        if request.POST.get('post'):
+            deleted, job = delete_or_start_job(queryset, request.user)
+            if job is not None:
+                self.message_user(
+                    request,
+                    f"Удаление запущено в фоне: задача #{job.pk}, около {job.estimated_total} транзакций. "
+                    f"Ход выполнения - в разделе «{BulkDeleteJob._meta.verbose_name_plural}»",
+                    messages.WARNING
+                )
+            else:
+                self.message_user(request, f"Удалено транзакций: {deleted}", messages.SUCCESS)
+            return None
+
+        select_across = request.POST.get('select_across') == '1'
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Удаление транзакций',
+            'opts': self.opts,
+            'count': estimated_count(queryset),
+            'select_across': select_across,
+            'selected': [] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'media': self.media,
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/wallet/transaction/delete_selected_confirmation.html', context)
+
+
+class AuditEventTypeFilter(admin.SimpleListFilter):
+    """
+    Фильтр по типу события с фиксированным списком вариантов: стандартный
+    list_filter по полю без choices строил бы его через SELECT DISTINCT по всей таблице
+    """
+    title = 'Тип события'
+    parameter_name = 'event_type'
+
+    def lookups(self, request, model_admin):
+        return [(event_type, event_type) for event_type in AUDIT_EVENT_TYPES]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event_type=self.value())
+        return queryset
+
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    """
+    Журнал только для чтения. Фильтры и поиск опираются на индексы
+    (event_type, created_at) и (user, created_at), общее число записей
+    не считается на каждой странице, а число строк выборки оценивается
+    """
+    list_display = ('created_at', 'event_type', 'level', 'username', 'ip')
+    list_filter = (AuditEventTypeFilter, 'level')
+    search_fields = ('=user__username',)
+    search_help_text = 'Точное имя пользователя'
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(BulkDeleteJob)
+class BulkDeleteJobAdmin(admin.ModelAdmin):
+    """
+    Ход фоновых удалений транзакций, только для чтения
+    """
+    list_display = ('id', 'admin', 'status', 'deleted', 'estimated_total', 'get_progress', 'chunks', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    list_select_related = ('admin',)
+    readonly_fields = ('error',)
+
+    def get_progress(self, obj):
+        if obj.status == BulkDeleteJob.Status.DONE:
+            return "100%"
+        if not obj.estimated_total:
+            return "-"
+        return f"~{min(100 * obj.deleted // obj.estimated_total, 99)}%"
+    get_progress.short_description = 'Прогресс'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.unregister(User)
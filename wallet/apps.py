@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WalletConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wallet'
+
+    def ready(self):
+        # Регистрация обработчиков сигналов для сброса кэшей аутентификации и чтения
+        from . import authentication, coalescing  # noqa: F401
@@ -0,0 +1,166 @@
+"""
+Журнал событий безопасности в базе (AuditEvent).
+
+AuditHandler подключается в LOGGING к логгеру wallet.security рядом
+с файловым обработчиком. emit только кладет сообщение в очередь процесса
+и не ждет базу; поток-писатель забирает до BATCH_SIZE сообщений
+(или все, что пришло за FLUSH_INTERVAL_MS после первого), разбирает
+'EVENT | key=value | ...', находит пользователей пачки одним запросом
+и записывает пачку одним bulk_create. Если очередь переполнена
+(база недоступна или не успевает), новые события отбрасываются
+и учитываются в счетчике dropped - запрос не блокируется никогда.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+
+from .loganalysis.parsing import SEPARATOR, split_fields
+
+
+logger = logging.getLogger('wallet')
+
+# Поля сообщения, из которых берется пользователь события, в порядке приоритета
+USER_FIELDS = ('admin', 'user', 'username', 'sender')
+
+AUDIT_EVENT_TYPES = (
+    'LOGIN_FAILED', 'LOGOUT', 'RATE_LIMIT_EXCEEDED',
+    'ADMIN_USER_ACTION', 'ADMIN_BALANCE_ACTION', 'ADMIN_BALANCE_CHANGE', 'ADMIN_TRANSACTION_ACTION',
+    'ADMIN_TRANSACTION_DELETE', 'ADMIN_BULK_TRANSACTION_DELETE', 'ADMIN_BULK_TRANSACTION_DELETE_STARTED',
+    'LARGE_DEPOSIT_ATTEMPT', 'LARGE_TRANSFER_ATTEMPT', 'SELF_TRANSFER_ATTEMPT',
+    'INSUFFICIENT_FUNDS', 'SLOW_REQUEST', 'ERROR_RESPONSE',
+)
+
+
+def _config():
+    return {
+        'ENABLED': True,
+        'BATCH_SIZE': 200,
+        'FLUSH_INTERVAL_MS': 500,
+        'QUEUE_SIZE': 10000,
+        **getattr(settings, 'AUDIT_LOG', {}),
+    }
+
+
+def parse_message(message):
+    """'EVENT | key=value | ...' -> (event, fields)"""
+    event, _, rest = message.partition(SEPARATOR)
+    fields = split_fields(rest) if rest else {}
+    return event.strip()[:64], {str(key): value for key, value in fields.items()}
+
+
+class AuditHandler(logging.Handler):
+    """
+    Обработчик логов, пишущий записи в AuditEvent пачками из фонового потока
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def emit(self, record):
+        config = _config()
+        if not config['ENABLED']:
+            return
+        try:
+            self.ensure_started(config)
+            self._queue.put_nowait((record.created, record.levelname, record.getMessage()))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def ensure_started(self, config):
+        # После fork поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self.run, name='wallet-audit', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        from django.db import connection
+
+        while True:
+            batch = self.collect(self._queue.get())
+            try:
+                self.write(batch)
+            finally:
+                # Соединение потока не держится между пачками
+                connection.close()
+
+    def collect(self, first):
+        """Пачка: первое сообщение и все, что успело прийти за FLUSH_INTERVAL_MS"""
+        config = _config()
+        batch = [first]
+        deadline = time.monotonic() + config['FLUSH_INTERVAL_MS'] / 1000
+        while len(batch) < config['BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Запись всех сообщений из очереди в текущем потоке"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write(batch)
+
+    def write(self, batch):
+        from django.contrib.auth.models import User
+        from .models import AuditEvent
+
+        with self._write_lock:
+            try:
+                events = []
+                for created, level, message in batch:
+                    event_type, fields = parse_message(message)
+                    username = next((fields[name] for name in USER_FIELDS if fields.get(name)), '')
+                    events.append(AuditEvent(
+                        event_type=event_type,
+                        level=level,
+                        username=username[:150],
+                        ip=fields.get('ip', '')[:45],
+                        details=fields,
+                        created_at=datetime.fromtimestamp(created, tz=dt_timezone.utc),
+                    ))
+                user_ids = dict(
+                    User.objects.filter(username__in={event.username for event in events if event.username})
+                    .values_list('username', 'id')
+                )
+                for event in events:
+                    event.user_id = user_ids.get(event.username)
+                AuditEvent.objects.bulk_create(events)
+                self.written += len(events)
+            except Exception as e:
+                self.dropped += len(batch)
+                # Не в wallet.security: ошибка записи журнала не должна снова попасть в журнал
+                logger.error(f"Ошибка записи {len(batch)} событий аудита: {str(e)}")
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -0,0 +1,207 @@
+"""
+Классы аутентификации DRF с кэшированием проверенных учетных данных
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш процесса с ограничением размера и временем жизни записей
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Удаление записей, значение которых удовлетворяет условию"""
+        with self._lock:
+            for key in [key for key, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def _cache_settings():
+    return {
+        'MAX_SIZE': 10000,
+        'TTL': 60,
+        'SHARED': False,
+        **getattr(settings, 'TOKEN_AUTH_CACHE', {}),
+    }
+
+
+def _basic_cache_settings():
+    return {
+        'MAX_SIZE': 1000,
+        'TTL': 30,
+        **getattr(settings, 'BASIC_AUTH_CACHE', {}),
+    }
+
+
+token_cache = TTLCache(_cache_settings()['MAX_SIZE'], _cache_settings()['TTL'])
+basic_auth_cache = TTLCache(_basic_cache_settings()['MAX_SIZE'], _basic_cache_settings()['TTL'])
+
+# Ключ HMAC живет только в памяти процесса: содержимое кэша нельзя
+# использовать для подбора паролей даже при утечке SECRET_KEY
+_BASIC_AUTH_KEY = secrets.token_bytes(32)
+
+
+def _shared_key(token_key):
+    return f'auth:token:{hashlib.sha256(token_key.encode()).hexdigest()}'
+
+
+def invalidate_token(token_key):
+    """
+    Удаление токена из кэшей процесса и общего кэша Django
+    """
+    token_cache.delete(token_key)
+    if _cache_settings()['SHARED']:
+        cache.delete(_shared_key(token_key))
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Удаление из кэшей всех токенов пользователя
+    """
+    for token_key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(token_key)
+
+
+def invalidate_user_credentials(user_id):
+    """
+    Удаление из кэша проверенных паролей Basic-аутентификации пользователя
+    """
+    basic_auth_cache.delete_where(lambda user: user.pk == user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который не обращается к базе для недавно проверенных токенов.
+
+    Пара токен -> пользователь хранится в ограниченном LRU-кэше процесса
+    (TOKEN_AUTH_CACHE['MAX_SIZE'], время жизни TOKEN_AUTH_CACHE['TTL'] секунд)
+    и, при TOKEN_AUTH_CACHE['SHARED'], в общем кэше Django. Записи удаляются
+    при удалении токена (выход через djoser) и при сохранении пользователя
+    (в том числе деактивации). Кэши других процессов без общего кэша
+    устаревают не дольше чем через TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None and _cache_settings()['SHARED']:
+            user = cache.get(_shared_key(key))
+            if user is not None:
+                token_cache.set(key, user)
+
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            self.remember(key, user)
+            return user, token
+
+        if not user.is_active:
+            invalidate_token(key)
+            return super().authenticate_credentials(key)
+
+        return user, Token(key=key, user=user)
+
+    def remember(self, key, user):
+        settings_ = _cache_settings()
+        token_cache.set(key, user)
+        if settings_['SHARED']:
+            cache.set(_shared_key(key), user, timeout=settings_['TTL'])
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication без полного хеширования пароля на каждый запрос.
+
+    После успешной проверки пароля пользователь запоминается под ключом
+    HMAC-SHA256(имя:пароль) на BASIC_AUTH_CACHE['TTL'] секунд; повторный
+    запрос с теми же учетными данными сверяет только HMAC. Сам пароль
+    в кэше не хранится. Записи пользователя удаляются при его сохранении
+    (смена пароля, деактивация). TTL = 0 отключает кэш.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        if _basic_cache_settings()['TTL'] <= 0:
+            return super().authenticate_credentials(userid, password, request)
+
+        key = hmac.new(
+            _BASIC_AUTH_KEY,
+            f'{userid}:{password}'.encode(),
+            hashlib.sha256
+        ).hexdigest()
+        user = basic_auth_cache.get(key)
+        if user is not None and user.is_active:
+            return user, None
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        basic_auth_cache.set(key, user)
+        return user, auth
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance.pk)
+        invalidate_user_credentials(instance.pk)
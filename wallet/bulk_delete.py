@@ -0,0 +1,134 @@
+"""
+Массовое удаление транзакций чанками.
+
+Выборка удаляется частями по CHUNK_SIZE строк в порядке id: каждый чанк -
+отдельная короткая транзакция, после нее пауза PAUSE_MS, чтобы удаление
+не держало блокировки и не забирало весь ввод-вывод. Следующий чанк
+выбирается по условию id > последнего удаленного, поэтому уже пройденная
+часть таблицы не перечитывается. Чанк удаляется с условием на диапазон
+created_at своих строк, что на секционированной таблице оставляет в плане
+только нужные секции.
+
+Каждый чанк записывается в wallet.security (ADMIN_BULK_TRANSACTION_DELETE
+с номером чанка, числом удаленных строк и итогом), общий COUNT заранее
+не выполняется. Выборки больше BACKGROUND_THRESHOLD (по оценке) удаляются
+в фоновом потоке, прогресс которого сохраняется в BulkDeleteJob. Поток
+не переживает перезапуск процесса: уже удаленные чанки остаются
+удаленными, задача остается в статусе «Выполняется», и удаление
+нужно запустить повторно.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .changelist import estimated_count
+
+
+logger = logging.getLogger('wallet')
+security_logger = logging.getLogger('wallet.security')
+
+
+def _config():
+    return {
+        'CHUNK_SIZE': 1000,
+        'PAUSE_MS': 100,
+        'BACKGROUND_THRESHOLD': 10000,
+        **getattr(settings, 'BULK_DELETE', {}),
+    }
+
+
+def delete_in_chunks(queryset, admin_name, job=None):
+    """
+    Удаление выборки чанками по id; возвращает число удаленных строк.
+    Если передана задача, после каждого чанка в ней сохраняется прогресс
+    """
+    config = _config()
+    model = queryset.model
+    deleted = 0
+    chunks = 0
+    last_id = None
+    while True:
+        pending = queryset if last_id is None else queryset.filter(pk__gt=last_id)
+        rows = list(pending.order_by('pk').values_list('pk', 'created_at')[:config['CHUNK_SIZE']])
+        if not rows:
+            break
+        ids = [pk for pk, created_at in rows]
+        stamps = [created_at for pk, created_at in rows]
+        with transaction.atomic():
+            count, per_model = model._base_manager.filter(
+                pk__in=ids, created_at__gte=min(stamps), created_at__lte=max(stamps)
+            ).delete()
+        count = per_model.get(model._meta.label, 0)
+        last_id = ids[-1]
+        deleted += count
+        chunks += 1
+
+        job_field = f" | job={job.pk}" if job is not None else ""
+        security_logger.error(
+            f"ADMIN_BULK_TRANSACTION_DELETE | admin={admin_name} | chunk={chunks} | count={count} | "
+            f"total={deleted}{job_field}"
+        )
+        if job is not None:
+            job.deleted = deleted
+            job.chunks = chunks
+            job.save(update_fields=['deleted', 'chunks', 'updated_at'])
+
+        if len(rows) < config['CHUNK_SIZE']:
+            break
+        time.sleep(config['PAUSE_MS'] / 1000)
+
+    logger.error(f"Массовое удаление {deleted} транзакций администратором {admin_name} ({chunks} чанков)")
+    return deleted
+
+
+def run_job(job, queryset, admin_name):
+    """Выполнение фоновой задачи удаления с записью итога в BulkDeleteJob"""
+    from .models import BulkDeleteJob
+
+    try:
+        delete_in_chunks(queryset, admin_name, job)
+        job.status = BulkDeleteJob.Status.DONE
+    except Exception as e:
+        job.status = BulkDeleteJob.Status.FAILED
+        job.error = str(e)
+        logger.error(f"Ошибка фонового удаления #{job.pk}: {str(e)}")
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+
+
+def _run_in_thread(job, queryset, admin_name):
+    try:
+        run_job(job, queryset, admin_name)
+    finally:
+        connection.close()
+
+
+def start_job(queryset, admin, estimate):
+    """Запуск удаления в фоновом потоке; возвращает созданную BulkDeleteJob"""
+    from .models import BulkDeleteJob
+
+    job = BulkDeleteJob.objects.create(admin=admin, estimated_total=estimate)
+    security_logger.error(
+        f"ADMIN_BULK_TRANSACTION_DELETE_STARTED | admin={admin.username} | job={job.pk} | estimated={estimate}"
+    )
+    threading.Thread(
+        target=_run_in_thread,
+        args=(job, queryset, admin.username),
+        name=f'wallet-bulk-delete-{job.pk}',
+        daemon=True,
+    ).start()
+    return job
+
+
+def delete_or_start_job(queryset, admin):
+    """
+    Удаление выборки: небольшой - сразу чанками, большой - в фоновом потоке.
+    Возвращает (удалено строк, None) или (None, задача)
+    """
+    estimate = estimated_count(queryset)
+    if estimate > _config()['BACKGROUND_THRESHOLD']:
+        return None, start_job(queryset, admin, estimate)
+    return delete_in_chunks(queryset, admin.username), None
@@ -0,0 +1,237 @@
+"""
+Списки админки для больших таблиц (транзакции, журнал аудита).
+
+Стандартный ChangeList на каждой странице считает COUNT(*) по выборке,
+строит date_hierarchy через SELECT DISTINCT по датам и листает через
+OFFSET, который на дальних страницах читает и отбрасывает все строки
+перед ними. Здесь вместо этого:
+
+- число строк оценивается по статистике планировщика PostgreSQL
+  (pg_class.reltuples всех секций или оценка плана для отфильтрованной
+  выборки); точный COUNT выполняется, только если оценка мала;
+- при сортировке по умолчанию страницы листаются по ключу
+  (created_at, id): следующая страница - строки старше последней
+  показанной, что читается по индексу с любого места таблицы;
+- фильтр по дате строит варианты по календарю без запросов к базе
+  и фильтрует диапазоном created_at, который попадает в индекс
+  и отсекает лишние секции.
+"""
+import json
+from datetime import datetime, timedelta
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+
+CURSOR_VAR = 'cursor'
+
+# Оценка меньше порога заменяется точным COUNT: он быстрый и не вводит в заблуждение
+EXACT_COUNT_THRESHOLD = 10000
+
+MONTHS_IN_FILTER = 12
+
+
+def table_estimate(connection, table):
+    """Оценка числа строк таблицы вместе со всеми ее секциями по pg_class.reltuples"""
+    with connection.cursor() as cursor:
+        # reltuples = -1 у таблицы, по которой еще не собиралась статистика
+        cursor.execute(
+            "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint FROM pg_class c "
+            "WHERE c.oid = to_regclass(%s) "
+            "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))",
+            [table, table]
+        )
+        return cursor.fetchone()[0]
+
+
+def plan_estimate(connection, queryset):
+    """Оценка числа строк выборки по плану запроса (EXPLAIN без выполнения)"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimated_count(queryset, exact_below=EXACT_COUNT_THRESHOLD):
+    """
+    Число строк выборки: на PostgreSQL - оценка, если она не меньше
+    exact_below, иначе и на других СУБД - точный COUNT
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    if queryset.query.where:
+        estimate = plan_estimate(connection, queryset)
+    else:
+        estimate = table_estimate(connection, queryset.model._meta.db_table)
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор с оценкой числа строк вместо COUNT(*)
+    """
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+def encode_cursor(obj):
+    return f'{obj.created_at.isoformat()}_{obj.pk}'
+
+
+def decode_cursor(value):
+    """'<created_at в ISO>_<id>' -> (created_at, id)"""
+    created_at, _, pk = value.rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError:
+        raise IncorrectLookupParameters(f'Неверный курсор: {value}')
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список с листанием по ключу (created_at, id) по убыванию.
+
+    Включается, когда пользователь не выбрал сортировку по колонке;
+    при выбранной сортировке работает обычное листание по номеру
+    страницы, но с оценкой числа строк
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        super().__init__(request, *args, **kwargs)
+        # Ссылки фильтров и сортировки открывают первую страницу
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params and not self.show_all
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset.order_by('-created_at', '-pk')
+        if self.cursor:
+            created_at, pk = decode_cursor(self.cursor)
+            queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+        rows = list(queryset[:self.list_per_page + 1])
+        page = rows[:self.list_per_page]
+
+        self.result_count = paginator.count
+        self.count_is_estimate = (
+            connections[self.queryset.db].vendor == 'postgresql' and self.result_count >= EXACT_COUNT_THRESHOLD
+        )
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = bool(self.result_count)
+        self.result_list = page
+        self.can_show_all = False
+        self.next_cursor = encode_cursor(page[-1]) if len(rows) > self.list_per_page else None
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = paginator
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    @property
+    def next_page_url(self):
+        if not self.next_cursor:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class LargeTableAdminMixin:
+    """
+    ModelAdmin для больших таблиц с полем created_at: оценка числа строк
+    и листание по ключу. Сортировка по умолчанию должна быть ('-created_at', '-id')
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+def local_day(value):
+    return timezone.make_aware(datetime(value.year, value.month, value.day))
+
+
+def shift_month(day, count):
+    index = day.year * 12 + day.month - 1 + count
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+class CreatedAtRangeFilter(admin.SimpleListFilter):
+    """
+    Фильтр по дате создания: сегодня, 7 и 30 дней, последние месяцы,
+    а внутри выбранного месяца - его дни. Варианты строятся по календарю
+    без запросов к базе, каждый фильтрует диапазоном [начало, конец)
+    """
+    title = 'Дата создания'
+    parameter_name = 'created'
+
+    def lookups(self, request, model_admin):
+        today = timezone.localdate()
+        choices = [('today', 'Сегодня'), ('7d', 'Последние 7 дней'), ('30d', 'Последние 30 дней')]
+        month = today.replace(day=1)
+        for _ in range(MONTHS_IN_FILTER):
+            choices.append((f'{month:%Y-%m}', f'{month:%m.%Y}'))
+            month = shift_month(month, -1)
+
+        # Выбранный месяц или день раскрывается по дням месяца
+        if self.value() and self.value()[:4].isdigit():
+            day = self.period()[0].replace(day=1)
+            end = shift_month(day, 1)
+            while day < end and day <= today:
+                choices.append((f'{day:%Y-%m-%d}', f'{day:%d.%m.%Y}'))
+                day += timedelta(days=1)
+        return choices
+
+    def period(self):
+        """(первый день, день после последнего) выбранного периода или None"""
+        value = self.value()
+        if not value:
+            return None
+        today = timezone.localdate()
+        if value == 'today':
+            return today, today + timedelta(days=1)
+        if value == '7d':
+            return today - timedelta(days=6), today + timedelta(days=1)
+        if value == '30d':
+            return today - timedelta(days=29), today + timedelta(days=1)
+        try:
+            if len(value) == 7:
+                month = datetime.strptime(value, '%Y-%m').date()
+                return month, shift_month(month, 1)
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise IncorrectLookupParameters(f'Неверный период: {value}')
+        return day, day + timedelta(days=1)
+
+    def queryset(self, request, queryset):
+        selected = self.period()
+        if selected is None:
+            return queryset
+        start, end = selected
+        return queryset.filter(created_at__gte=local_day(start), created_at__lt=local_day(end))
@@ -0,0 +1,154 @@
+"""
+Объединение одновременных одинаковых запросов на чтение (single-flight).
+
+Пока первый запрос с ключом (user_id, endpoint, параметры) вычисляет
+ответ, остальные запросы с тем же ключом ждут и получают его результат
+вместо повторных запросов к базе. Готовый результат дополнительно
+раздается еще COALESCE_WINDOW_SECONDS секунд. Любое изменение баланса
+или операций пользователя сбрасывает его записи сразу и после коммита.
+"""
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Transaction, UserBalance
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'finished_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class _FlightStats:
+    """Счетчики вызовов: executions - реальные вычисления, shared - ответы из чужого вычисления"""
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0
+
+    def stats(self):
+        calls = self.executions + self.shared
+        return {
+            'calls': calls,
+            'executions': self.executions,
+            'shared': self.shared,
+            'coalescing_ratio': round(self.shared / calls, 4) if calls else 0.0,
+        }
+
+
+class SingleFlight(_FlightStats):
+    """
+    Single-flight для потоков (WSGI)
+    """
+
+    PRUNE_THRESHOLD = 1024
+
+    def __init__(self, window=0.0):
+        super().__init__()
+        self.window = window
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.finished_at is not None and call.finished_at + self.window <= now:
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                if len(self._calls) > self.PRUNE_THRESHOLD:
+                    self._prune(now)
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                call.finished_at = time.monotonic()
+                if (call.error is not None or self.window <= 0) and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def forget(self, predicate):
+        """Удаление записей, ключ которых удовлетворяет условию"""
+        with self._lock:
+            for key in [key for key in self._calls if predicate(key)]:
+                del self._calls[key]
+
+    def _prune(self, now):
+        for key in [
+            key for key, call in self._calls.items()
+            if call.finished_at is not None and call.finished_at + self.window <= now
+        ]:
+            del self._calls[key]
+
+
+reads = SingleFlight(window=getattr(settings, 'COALESCE_WINDOW_SECONDS', 0.0))
+
+
+def request_key(request, endpoint):
+    params = tuple((name, tuple(values)) for name, values in sorted(request.query_params.lists()))
+    return (request.user.pk, endpoint, params)
+
+
+def coalesce(request, endpoint, fn):
+    """
+    Вычисление данных ответа через общий single-flight процесса
+    """
+    if not getattr(settings, 'COALESCE_READS', True):
+        return fn()
+    return reads.do(request_key(request, endpoint), fn)
+
+
+def forget_user(*user_ids):
+    """
+    Сброс записей пользователей сразу и после коммита текущей транзакции:
+    чтение, начатое до коммита, не должно раздаваться после него
+    """
+    user_ids = set(user_ids)
+
+    def forget():
+        reads.forget(lambda key: key[0] in user_ids)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+@receiver(post_save, sender=User)
+def forget_user_reads(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=UserBalance)
+@receiver(post_delete, sender=UserBalance)
+def forget_balance_reads(sender, instance, **kwargs):
+    forget_user(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def forget_transaction_reads(sender, instance, **kwargs):
+    forget_user(*(user_id for user_id in (instance.from_user_id, instance.to_user_id) if user_id))
@@ -0,0 +1,213 @@
+"""
+Уведомления клиентов об изменении баланса (GET /api/wallet/events/).
+
+Представления записи после успешной операции вызывают balance_changed,
+которое через transaction.on_commit публикует сообщение в брокер
+процесса. Подписка - это asyncio.Queue на цикле событий ASGI-сервера:
+ожидающее соединение не держит ни потока, ни соединения с базой.
+
+При WALLET_EVENTS['BACKEND'] = 'postgres' сообщения идут через
+NOTIFY в канал CHANNEL, а поток-слушатель каждого процесса с подписчиками
+выполняет LISTEN и раздает их своим подписчикам - так уведомление
+доходит до клиента, подключенного к другому воркеру.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger('wallet')
+
+
+def _config():
+    return {
+        'BACKEND': 'local',
+        'CHANNEL': 'wallet_balance',
+        'QUEUE_SIZE': 16,
+        'HEARTBEAT_SECONDS': 15,
+        'STREAM_SECONDS': 300,
+        'POLL_TIMEOUT_SECONDS': 25,
+        **getattr(settings, 'WALLET_EVENTS', {}),
+    }
+
+
+class Subscription:
+    """
+    Очередь сообщений одного соединения. Сообщения кладутся из любого
+    потока через цикл событий подписчика; при переполнении вытесняется
+    самое старое - клиенту важен последний баланс.
+    """
+
+    def __init__(self, broker, user_id, queue_size):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Цикл событий уже закрыт, соединение отпишется само
+            pass
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.broker.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Следующее сообщение или None, если за timeout секунд его не было"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker:
+    """
+    Pub/sub процесса: подписки по user_id
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        """Вызывается из корутины соединения"""
+        if _config()['BACKEND'] == 'postgres':
+            self.ensure_listener()
+        subscription = Subscription(self, user_id, _config()['QUEUE_SIZE'])
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, message):
+        """Раздача сообщения подписчикам этого процесса"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        self.published += 1
+        for subscription in subscribers:
+            subscription.deliver(message)
+        self.delivered += len(subscribers)
+
+    def ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self.listen, name='wallet-events-listen', daemon=True)
+                self._listener.start()
+
+    def listen(self):
+        """
+        LISTEN на отдельном соединении psycopg с переподключением при обрыве
+        """
+        import psycopg
+
+        db = settings.DATABASES['default']
+        channel = _config()['CHANNEL']
+        while True:
+            try:
+                with psycopg.connect(
+                    dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+                    host=db['HOST'], port=db['PORT'] or None, autocommit=True
+                ) as listen_connection:
+                    listen_connection.execute(f'LISTEN "{channel}"')
+                    logger.info(f"Подписка на уведомления канала {channel}")
+                    for notify in listen_connection.notifies():
+                        message = json.loads(notify.payload)
+                        self.publish(message['user_id'], message)
+            except Exception as e:
+                logger.error(f"Ошибка слушателя уведомлений канала {channel}: {str(e)}")
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            connections = sum(len(subscribers) for subscribers in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            'backend': _config()['BACKEND'],
+            'connections': connections,
+            'users': users,
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+
+broker = Broker()
+
+
+def send(message):
+    # Операция уже зафиксирована: ошибка уведомления не должна превращаться в ошибку запроса
+    try:
+        if _config()['BACKEND'] == 'postgres':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [_config()['CHANNEL'], json.dumps(message)])
+        else:
+            broker.publish(message['user_id'], message)
+    except Exception as e:
+        logger.error(f"Ошибка отправки уведомления пользователю {message['user_id']}: {str(e)}")
+
+
+def balance_changed(user_id, balance_kopecks):
+    """
+    Уведомление подписчиков пользователя после коммита текущей транзакции
+    """
+    message = {'type': 'balance', 'user_id': user_id, 'balance_kopecks': balance_kopecks}
+    transaction.on_commit(lambda: send(message))
+
+
+async def next_message(user_id, timeout=None):
+    """
+    Long-poll: первое сообщение пользователя или None через timeout секунд
+    (не больше POLL_TIMEOUT_SECONDS)
+    """
+    limit = _config()['POLL_TIMEOUT_SECONDS']
+    with broker.subscribe(user_id) as subscription:
+        return await subscription.get(limit if timeout is None else max(min(timeout, limit), 0))
+
+
+async def event_stream(user_id):
+    """
+    Поток server-sent events: сообщения пользователя и комментарии-пинги
+    каждые HEARTBEAT_SECONDS; через STREAM_SECONDS поток завершается
+    """
+    config = _config()
+    with broker.subscribe(user_id) as subscription:
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + config['STREAM_SECONDS']
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await subscription.get(min(config['HEARTBEAT_SECONDS'], remaining))
+            if message is None:
+                yield ': ping\n\n'
+            else:
+                yield f"event: balance\ndata: {json.dumps(message)}\n\n"
@@ -0,0 +1,335 @@
+"""
+Групповая фиксация изменений балансов (group commit).
+
+При GROUP_COMMIT['ENABLED'] пополнения и переводы не открывают
+собственную транзакцию: запрос ставит операцию в очередь процесса
+и ждет future. Поток-фиксатор забирает до MAX_BATCH операций (или все,
+что пришло за MAX_WAIT_MS после первой), применяет их в одной транзакции
+базы - балансы блокируются одним SELECT ... FOR UPDATE в порядке user_id
+и обновляются вместе со счетчиками операций одним bulk_update, операции
+и события outbox пишутся через bulk_create - и после коммита завершает
+future каждого запроса его результатом или ошибкой. Вместо коммита
+и fsync на каждый запрос получается один на пачку.
+
+Если пачка не забрала операцию за LATENCY_CEILING_MS, запрос отменяет
+ее и выполняется напрямую через wallet.services. Операции с горячими
+счетами (shard_count > 0) и операции из неудавшейся пачки тоже
+выполняются напрямую.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import outbox, services
+from .coalescing import forget_user
+from .models import ACTIVITY_FIELDS, UserBalance, Transaction
+
+
+logger = logging.getLogger('wallet')
+
+
+class NotBatchable(Exception):
+    """Операцию нельзя применить в пачке, ее нужно выполнить напрямую"""
+
+
+class _Mutation:
+    __slots__ = ('kind', 'sender', 'recipient', 'amount_kopecks', 'future')
+
+    def __init__(self, kind, sender, recipient, amount_kopecks):
+        self.kind = kind
+        self.sender = sender
+        self.recipient = recipient
+        self.amount_kopecks = amount_kopecks
+        self.future = Future()
+
+    def user_ids(self):
+        return {user.pk for user in (self.sender, self.recipient) if user is not None}
+
+
+def _config():
+    return {
+        'ENABLED': False,
+        'MAX_BATCH': 100,
+        'MAX_WAIT_MS': 5,
+        'LATENCY_CEILING_MS': 50,
+        **getattr(settings, 'GROUP_COMMIT', {}),
+    }
+
+
+class GroupCommitter:
+    """
+    Очередь операций и поток, фиксирующий их пачками
+    """
+
+    def __init__(self, max_batch=None, max_wait_ms=None, latency_ceiling_ms=None):
+        config = _config()
+        self.max_batch = max_batch or config['MAX_BATCH']
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config['MAX_WAIT_MS']) / 1000
+        self.latency_ceiling = (
+            latency_ceiling_ms if latency_ceiling_ms is not None else config['LATENCY_CEILING_MS']
+        ) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.batched = 0
+        self.direct = 0
+
+    def deposit(self, user, amount_kopecks):
+        if not _config()['ENABLED']:
+            return services.deposit(user, amount_kopecks)
+        return self.execute(_Mutation('deposit', None, user, amount_kopecks))
+
+    def transfer(self, sender, recipient, amount_kopecks):
+        if not _config()['ENABLED']:
+            return services.transfer(sender, recipient, amount_kopecks)
+        return self.execute(_Mutation('transfer', sender, recipient, amount_kopecks))
+
+    def execute(self, mutation):
+        """
+        Постановка операции в очередь и ожидание результата не дольше
+        потолка задержки; операцию, которую пачка не успела забрать,
+        запрос выполняет сам
+        """
+        if transaction.get_connection().in_atomic_block:
+            # Внутри чужой транзакции результат пачки не был бы в нее включен
+            return self.apply_directly(mutation)
+
+        self.ensure_started()
+        self._queue.put(mutation)
+        try:
+            return mutation.future.result(timeout=self.latency_ceiling)
+        except FutureTimeoutError:
+            if mutation.future.cancel():
+                return self.apply_directly(mutation)
+            return self.wait(mutation)
+        except NotBatchable:
+            return self.apply_directly(mutation)
+
+    def wait(self, mutation):
+        try:
+            return mutation.future.result()
+        except NotBatchable:
+            return self.apply_directly(mutation)
+
+    def apply_directly(self, mutation):
+        self.direct += 1
+        if mutation.kind == 'deposit':
+            return services.deposit(mutation.recipient, mutation.amount_kopecks)
+        return services.transfer(mutation.sender, mutation.recipient, mutation.amount_kopecks)
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='wallet-group-commit', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.process(self.collect(self._queue.get()))
+            except Exception as e:
+                logger.error(f"Ошибка потока групповой фиксации: {str(e)}")
+
+    def collect(self, first):
+        """Пачка: первая операция и все, что успело прийти за MAX_WAIT_MS"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def drain(self):
+        """Применение всех операций из очереди в текущем потоке"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.process(batch)
+
+    def process(self, batch):
+        # Отмененные запросом операции уже выполнены напрямую
+        batch = [mutation for mutation in batch if mutation.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        if not transaction.get_connection().in_atomic_block:
+            close_old_connections()
+        try:
+            with transaction.atomic():
+                outcomes = self.apply_batch(batch)
+        except Exception as e:
+            logger.error(f"Ошибка групповой фиксации пачки из {len(batch)} операций: {str(e)}")
+            # Пачка откатилась целиком, каждая операция будет выполнена напрямую
+            outcomes = [NotBatchable()] * len(batch)
+        else:
+            self.batches += 1
+            self.batched += sum(1 for outcome in outcomes if not isinstance(outcome, Exception))
+
+        for mutation, outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                mutation.future.set_exception(outcome)
+            else:
+                mutation.future.set_result(outcome)
+
+    def apply_batch(self, batch):
+        """
+        Применение пачки в открытой транзакции.
+        Возвращает результат или исключение для каждой операции.
+        """
+        user_ids = sorted(set().union(*(mutation.user_ids() for mutation in batch)))
+        existing = set(UserBalance.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        UserBalance.objects.bulk_create(
+            [UserBalance(user_id=user_id) for user_id in user_ids if user_id not in existing],
+            ignore_conflicts=True
+        )
+        balances = {
+            balance.user_id: balance
+            for balance in UserBalance.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+        }
+
+        outcomes = []
+        records = []
+        changed = {}
+        for mutation in batch:
+            sender = balances.get(mutation.sender.pk) if mutation.sender else None
+            recipient = balances[mutation.recipient.pk]
+            amount = mutation.amount_kopecks
+
+            if recipient.shard_count or (sender and sender.shard_count):
+                outcomes.append(NotBatchable())
+                continue
+
+            if mutation.kind == 'deposit':
+                recipient.balance_kopecks += amount
+                changed[recipient.user_id] = recipient
+                records.append(Transaction(
+                    to_user=mutation.recipient,
+                    amount_kopecks=amount,
+                    transaction_type=Transaction.TransactionType.DEPOSIT,
+                    description=f"Пополнение баланса на {amount} копеек",
+                    account=mutation.recipient,
+                    balance_after_kopecks=recipient.balance_kopecks
+                ))
+                outcomes.append({
+                    'old_balance_kopecks': recipient.balance_kopecks - amount,
+                    'new_balance_kopecks': recipient.balance_kopecks,
+                    'transaction_ids': [len(records) - 1],
+                })
+                continue
+
+            if sender.balance_kopecks < amount:
+                outcomes.append(services.InsufficientFunds(sender.balance_kopecks))
+                continue
+
+            sender.balance_kopecks -= amount
+            recipient.balance_kopecks += amount
+            changed[sender.user_id] = sender
+            changed[recipient.user_id] = recipient
+            records.append(Transaction(
+                from_user=mutation.sender,
+                to_user=mutation.recipient,
+                amount_kopecks=amount,
+                transaction_type=Transaction.TransactionType.TRANSFER_OUT,
+                description=f"Перевод {amount} копеек пользователю {mutation.recipient.username}",
+                account=mutation.sender,
+                balance_after_kopecks=sender.balance_kopecks
+            ))
+            records.append(Transaction(
+                from_user=mutation.sender,
+                to_user=mutation.recipient,
+                amount_kopecks=amount,
+                transaction_type=Transaction.TransactionType.TRANSFER_IN,
+                description=f"Получен перевод {amount} копеек от пользователя {mutation.sender.username}",
+                account=mutation.recipient,
+                balance_after_kopecks=recipient.balance_kopecks
+            ))
+            outcomes.append({
+                'sender_old_balance_kopecks': sender.balance_kopecks + amount,
+                'sender_new_balance_kopecks': sender.balance_kopecks,
+                'recipient_old_balance_kopecks': recipient.balance_kopecks - amount,
+                'recipient_new_balance_kopecks': recipient.balance_kopecks,
+                'transaction_ids': [len(records) - 2, len(records) - 1],
+            })
+
+        Transaction.objects.bulk_create(records)
+
+        # Счетчики операций считаются по записям после вставки, когда известны их id
+        for record in records:
+            balance = balances[record.account_id]
+            balance.transaction_count += 1
+            total = services.TOTAL_COUNTERS[record.transaction_type]
+            setattr(balance, total, getattr(balance, total) + record.amount_kopecks)
+            balance.last_transaction_id = record.id
+            balance.last_transaction_at = record.created_at
+        if changed:
+            now = timezone.now()
+            for balance in changed.values():
+                balance.updated_at = now
+                balance.version += 1
+            UserBalance.objects.bulk_update(
+                list(changed.values()), ['balance_kopecks', 'version', 'updated_at', *ACTIVITY_FIELDS]
+            )
+
+        # Индексы записей заменяются на id, присвоенные при вставке
+        events = []
+        for mutation, outcome in zip(batch, outcomes):
+            if not isinstance(outcome, dict):
+                continue
+            outcome['transaction_ids'] = [records[index].id for index in outcome['transaction_ids']]
+            if mutation.kind == 'deposit':
+                events.append(outbox.deposit_event(
+                    mutation.recipient.pk, mutation.amount_kopecks,
+                    outcome['transaction_ids'], outcome['new_balance_kopecks']
+                ))
+            else:
+                events.append(outbox.transfer_event(
+                    mutation.sender.pk, mutation.recipient.pk, mutation.amount_kopecks, outcome['transaction_ids']
+                ))
+        outbox.publish(*events)
+
+        # bulk-операции не отправляют сигналы, кэш чтения сбрасывается явно
+        if changed:
+            forget_user(*changed)
+        logger.debug(f"Групповая фиксация: {len(batch)} операций, {len(records)} записей")
+        return outcomes
+
+    def stats(self):
+        return {
+            'enabled': _config()['ENABLED'],
+            'batches': self.batches,
+            'batched': self.batched,
+            'direct': self.direct,
+            'avg_batch_size': round(self.batched / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+committer = GroupCommitter()
+
+
+def deposit(user, amount_kopecks):
+    """
+    Пополнение баланса: через групповую фиксацию, если она включена
+    """
+    return committer.deposit(user, amount_kopecks)
+
+
+def transfer(sender, recipient, amount_kopecks):
+    """
+    Перевод между пользователями: через групповую фиксацию, если она включена
+    """
+    return committer.transfer(sender, recipient, amount_kopecks)
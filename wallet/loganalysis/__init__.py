@@ -0,0 +1,3 @@
+"""
+Разбор и анализ логов security.log и transactions.log (команда analyze_logs)
+"""
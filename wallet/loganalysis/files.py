@@ -0,0 +1,180 @@
+"""
+Файлы логов: поколения RotatingFileHandler и разбиение на участки.
+
+RotatingFileHandler переименовывает log -> log.1 -> ... -> log.N, поэтому
+чем больше номер, тем старше поколение. Поколения, сжатые в .gz, читаются
+целиком, несжатые делятся на участки по chunk_size байт с границами
+на концах строк и разбираются параллельно.
+"""
+import gzip
+import mmap
+import os
+import re
+from collections import Counter
+
+from .parsing import PARSERS
+from .rollups import Rollup
+
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+TIMESTAMP_WIDTH = len('YYYY-MM-DD HH:MM:SS')
+
+
+def generations(path):
+    """
+    Существующие файлы лога от самого старого к текущему: [log.N(.gz), ..., log.1, log]
+    """
+    directory, name = os.path.split(path)
+    pattern = re.compile(rf'^{re.escape(name)}\.(\d+)(\.gz)?$')
+    rotated = []
+    for entry in os.listdir(directory or '.'):
+        match = pattern.match(entry)
+        if match:
+            rotated.append((int(match.group(1)), os.path.join(directory, entry)))
+    rotated.sort(reverse=True)
+    return [rotated_path for number, rotated_path in rotated] + ([path] if os.path.exists(path) else [])
+
+
+def is_compressed(path):
+    return path.endswith('.gz')
+
+
+def has_timestamp(line):
+    """Строка начинается с 'YYYY-MM-DD HH:MM:SS' (а не продолжает многострочное сообщение)"""
+    return len(line) >= TIMESTAMP_WIDTH and line[4:5] == b'-' and line[10:11] == b' ' and line[13:14] == b':'
+
+
+def seek_time(path, ts, lo=0, hi=None):
+    """
+    Смещение первой строки с временем не раньше ts (строка 'YYYY-MM-DD HH:MM:SS')
+    в пределах [lo, hi) или hi, если таких нет.
+
+    Строки дописываются в порядке времени, поэтому граница ищется двоичным
+    поиском по смещениям в mmap: на каждой пробе читается только время
+    в начале ближайшей строки с меткой времени, сравнением байтовых срезов
+    фиксированной ширины. Сжатые файлы не поддерживают произвольный доступ,
+    для них возвращается lo.
+    """
+    if is_compressed(path):
+        return lo
+    target = ts.encode()
+    with open(path, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        hi = size if hi is None else min(hi, size)
+        if lo >= hi:
+            return hi
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+            def stamped_line_at_or_after(position):
+                """Начало и время первой строки с меткой времени, начинающейся не раньше position"""
+                if position > lo:
+                    position = data.find(b'\n', position - 1, hi) + 1 or hi
+                while position < hi:
+                    line_end = data.find(b'\n', position, hi)
+                    line_end = hi if line_end < 0 else line_end
+                    line = data[position:min(line_end, position + TIMESTAMP_WIDTH)]
+                    if has_timestamp(line):
+                        return position, line
+                    position = line_end + 1
+                return hi, None
+
+            left, right = lo, hi
+            while left < right:
+                middle = (left + right) // 2
+                position, stamp = stamped_line_at_or_after(middle)
+                if stamp is None or stamp >= target:
+                    right = middle
+                else:
+                    left = position + 1
+            return stamped_line_at_or_after(left)[0]
+
+
+def split_chunks(path, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Деление [start, end) на участки, каждый из которых начинается с начала строки
+    """
+    if is_compressed(path):
+        return [(path, 0, None)]
+
+    bounds = [start]
+    with open(path, 'rb') as log_file:
+        position = start + chunk_size
+        while position < end:
+            log_file.seek(position)
+            log_file.readline()
+            boundary = log_file.tell()
+            if boundary >= end:
+                break
+            bounds.append(boundary)
+            position = boundary + chunk_size
+    bounds.append(end)
+    return [(path, lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def in_window(ts, window):
+    """
+    Попадает ли время строки в окно (after, since, until): после after,
+    не раньше since и раньше until; None - граница не задана
+    """
+    after, since, until = window
+    return (after is None or ts > after) and (since is None or ts >= since) and (until is None or ts < until)
+
+
+class Partial:
+    """
+    Частичные итоги разбора участка; итоги участков складываются через merge
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.events = Counter()
+        self.rollup = Rollup()
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.bytes += other.bytes
+        self.events.update(other.events)
+        self.rollup.merge(other.rollup)
+        return self
+
+
+def read_chunk(path, lo, hi):
+    """
+    Байты участка без недописанной последней строки и смещение ее начала
+    """
+    if is_compressed(path):
+        with gzip.open(path, 'rb') as log_file:
+            data = log_file.read()
+        lo = 0
+    else:
+        with open(path, 'rb') as log_file:
+            log_file.seek(lo)
+            data = log_file.read(hi - lo)
+    complete = data.rfind(b'\n') + 1
+    return data[:complete], lo + complete
+
+
+def parse_chunk(source, path, lo, hi, window=None):
+    """
+    Разбор участка [lo, hi) файла (выполняется в процессе пула).
+    События вне окна времени window отбрасываются, по остальным в том же
+    проходе считаются агрегаты. Возвращает (строки индекса, частичные итоги,
+    смещение после последней целой строки).
+    """
+    parse = PARSERS[source]
+    data, end = read_chunk(path, lo, hi)
+    partial = Partial()
+    partial.bytes = len(data)
+    rows = []
+    # Участок декодируется целиком: data заканчивается переводом строки, последний элемент пуст
+    lines = data.decode('utf-8', errors='replace').split('\n')
+    lines.pop()
+    partial.lines = len(lines)
+    for line in lines:
+        row = parse(line)
+        if row is not None and (window is None or in_window(row[1], window)):
+            rows.append(row)
+            partial.events[row[0]] += 1
+            partial.rollup.add(row)
+    return rows, partial, end
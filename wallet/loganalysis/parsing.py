@@ -0,0 +1,152 @@
+"""
+Разбор строк логов формата detailed в события индекса.
+
+Запись detailed: 'ts | LEVEL | logger | func:lineno | EVENT | key=value | ...'.
+Tokenizer разбирает ее за один проход в (ts, level, logger, event, fields);
+парсеры security и transactions построены на нем и превращают записи
+в события индекса - кортежи (event, ts, user, counterparty, amount_kopecks,
+message, duration_ms). ts - префикс строки 'YYYY-MM-DD HH:MM:SS', который сравнивается
+и группируется как строка без strptime.
+"""
+from decimal import Decimal, InvalidOperation
+
+
+SEPARATOR = ' | '
+TIMESTAMP_WIDTH = len('YYYY-MM-DD HH:MM:SS')
+
+SUSPICIOUS_EVENTS = (
+    'LARGE_DEPOSIT_ATTEMPT', 'LARGE_TRANSFER_ATTEMPT',
+    'SELF_TRANSFER_ATTEMPT', 'INSUFFICIENT_FUNDS',
+)
+
+
+def scaled_integer(value, digits):
+    """Десятичная строка -> целое в 10^-digits долях: ('12.34', 2) -> 1234 без потери точности через float"""
+    whole, _, fraction = (value or '').partition('.')
+    if whole.isdecimal() and len(fraction) <= digits and (not fraction or fraction.isdecimal()):
+        # Частый случай - без Decimal
+        return int(whole) * 10 ** digits + int(fraction.ljust(digits, '0'))
+    try:
+        return int(Decimal(value).scaleb(digits))
+    except (InvalidOperation, TypeError):
+        return None
+
+
+def rubles_to_kopecks(value):
+    """'12.34' -> 1234"""
+    return scaled_integer(value, 2)
+
+
+def seconds_to_ms(value):
+    """'1.234s' -> 1234"""
+    return scaled_integer((value or '').rstrip('s'), 3)
+
+
+def field_kopecks(fields, name):
+    """
+    Сумма поля в копейках: точное значение name_kopecks, а в строках,
+    записанных до его появления, - перевод рублей из name
+    """
+    value = fields.get(f'{name}_kopecks')
+    if value is not None and value.lstrip('-').isdecimal():
+        return int(value)
+    return rubles_to_kopecks(fields.get(name))
+
+
+def split_fields(rest):
+    """
+    Сегменты 'key=value' после типа события -> dict. Сегменты без '='
+    (например 'POST /api/...' в SLOW_REQUEST) сохраняются под своим номером.
+    """
+    items = rest.replace(SEPARATOR, '=').split('=')
+    if rest.count('=') * 2 == len(items):
+        # Каждый сегмент - ровно один key=value: поля собираются без цикла на Python
+        return dict(zip(items[::2], items[1::2]))
+    fields = {}
+    for position, segment in enumerate(rest.split(SEPARATOR)):
+        key, sep, value = segment.partition('=')
+        if sep:
+            fields[key] = value
+        else:
+            fields[position] = segment
+    return fields
+
+
+class Tokenizer:
+    """
+    Разбор записи detailed за один проход: строка -> (ts, level, logger, event, fields)
+    или None. Записи, тип события которых не начинается ни с одного из prefixes,
+    отбрасываются до разбора полей - для них строка делится только до типа события.
+    """
+
+    def __init__(self, prefixes=None):
+        self.prefixes = tuple(prefixes) if prefixes else ('',)
+
+    def __call__(self, line):
+        # Строка делится только до типа события: у отбрасываемых записей поля не трогаются
+        parts = line.split(SEPARATOR, 4)
+        if len(parts) < 5 or not parts[4].startswith(self.prefixes):
+            return None
+        ts = parts[0]
+        if len(ts) != TIMESTAMP_WIDTH or ts[4] != '-':
+            # Продолжение многострочного сообщения
+            return None
+        event, sep, rest = parts[4].rstrip('\n').partition(SEPARATOR)
+        return ts, parts[1], parts[2], event, split_fields(rest) if sep else {}
+
+
+SECURITY_TOKENIZER = Tokenizer(('LOGIN_', 'RATE_LIMIT_EXCEEDED', 'SLOW_REQUEST', 'ADMIN_', *SUSPICIOUS_EVENTS))
+TRANSACTION_TOKENIZER = Tokenizer(('DEPOSIT_SUCCESS', 'TRANSFER_SUCCESS'))
+
+
+def parse_security_line(line):
+    record = SECURITY_TOKENIZER(line)
+    if record is None:
+        return None
+    ts, level, logger, event, fields = record
+
+    if event == 'LOGIN_SUCCESS':
+        user = fields.get('user')
+        if user:
+            return ('LOGIN_SUCCESS', ts, user, None, None, None, None)
+    elif event == 'LOGIN_FAILED':
+        user = fields.get('username')
+        if user:
+            return ('LOGIN_FAILED', ts, user, None, None, None, None)
+    elif event == 'RATE_LIMIT_EXCEEDED':
+        return ('RATE_LIMIT_EXCEEDED', ts, None, None, None, line.strip(), None)
+    elif event == 'SLOW_REQUEST':
+        duration = seconds_to_ms(fields.get('duration'))
+        if duration is not None:
+            return ('SLOW_REQUEST', ts, fields.get('user'), None, None, line.strip(), duration)
+    elif event.startswith('ADMIN_'):
+        return ('ADMIN_ACTION', ts, None, None, None, line.strip(), None)
+    elif event in SUSPICIOUS_EVENTS:
+        return ('SUSPICIOUS', ts, None, None, None, line.strip(), None)
+    return None
+
+
+def parse_transaction_line(line):
+    record = TRANSACTION_TOKENIZER(line)
+    if record is None:
+        return None
+    ts, level, logger, event, fields = record
+
+    if event == 'DEPOSIT_SUCCESS':
+        user = fields.get('user')
+        amount = field_kopecks(fields, 'amount')
+        if user and amount is not None:
+            return ('DEPOSIT_SUCCESS', ts, user, None, amount, None, None)
+    elif event == 'TRANSFER_SUCCESS':
+        sender = fields.get('sender')
+        recipient = fields.get('recipient')
+        amount = field_kopecks(fields, 'amount')
+        if sender and recipient and amount is not None:
+            return ('TRANSFER_SUCCESS', ts, sender, recipient, amount, None, None)
+    return None
+
+
+PARSERS = {
+    'security': parse_security_line,
+    'transactions': parse_transaction_line,
+}
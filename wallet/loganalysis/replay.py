@@ -0,0 +1,170 @@
+"""
+Восстановление балансов по transactions.log.
+
+События DEPOSIT_SUCCESS и TRANSFER_SUCCESS всех поколений лога
+превращаются в проводки: пополнение - одна проводка (+сумма получателю),
+перевод - две (-сумма отправителю, +сумма получателю). Участки файлов
+разбираются в пуле процессов в столбцы NumPy: номер пользователя в словаре
+участка, изменение баланса и баланс до проводки в копейках (int64) и время
+(datetime64[s]). Словари участков сводятся в общий, после чего балансы
+считаются без циклов на Python: проводки группируются по пользователю
+(argsort), накопленная сумма внутри группы (cumsum) дает баланс после каждой
+проводки, итоговый баланс - последний элемент группы, баланс на момент
+времени - последний элемент группы не позже этого момента.
+
+Лог не обязательно начинается с создания счетов (старые поколения удаляются
+при ротации), поэтому начальный баланс пользователя - баланс до его первой
+проводки из самой строки лога.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from .files import DEFAULT_CHUNK_SIZE, generations, is_compressed, read_chunk, split_chunks
+from .parsing import TRANSACTION_TOKENIZER, field_kopecks
+
+
+UNKNOWN_BALANCE = -1
+
+
+def event_postings(event, fields):
+    """[(имя, изменение баланса, баланс до)] проводок события лога"""
+    amount = field_kopecks(fields, 'amount')
+    if amount is None:
+        return []
+    if event == 'DEPOSIT_SUCCESS':
+        return [(fields.get('user'), amount, field_kopecks(fields, 'old_balance'))]
+    if event == 'TRANSFER_SUCCESS':
+        return [
+            (fields.get('sender'), -amount, field_kopecks(fields, 'sender_old_balance')),
+            (fields.get('recipient'), amount, field_kopecks(fields, 'recipient_old_balance')),
+        ]
+    return []
+
+
+def posting_chunk(path, lo, hi):
+    """
+    Проводки участка [lo, hi) файла (выполняется в процессе пула):
+    (имена пользователей участка, номера в этом списке, изменения, балансы до, время)
+    """
+    data, end = read_chunk(path, lo, hi)
+    names = {}
+    users, deltas, before, stamps = [], [], [], []
+    for line in data.decode('utf-8', errors='replace').split('\n'):
+        record = TRANSACTION_TOKENIZER(line)
+        if record is None:
+            continue
+        ts, level, logger, event, fields = record
+        for name, delta, balance in event_postings(event, fields):
+            if not name:
+                continue
+            users.append(names.setdefault(name, len(names)))
+            deltas.append(delta)
+            before.append(UNKNOWN_BALANCE if balance is None else balance)
+            stamps.append(ts)
+    return (
+        list(names),
+        np.array(users, dtype=np.int64),
+        np.array(deltas, dtype=np.int64),
+        np.array(before, dtype=np.int64),
+        np.array(stamps, dtype='datetime64[s]'),
+    )
+
+
+class Ledger:
+    """
+    Столбцы проводок в порядке лога и балансы, посчитанные по ним.
+    В словарь попадают только пользователи с проводками, поэтому группа
+    каждого пользователя непуста.
+    """
+
+    def __init__(self, names, users, deltas, before, stamps):
+        self.names = names
+        self.users = users
+        self.deltas = deltas
+        self.before = before
+        self.stamps = stamps
+
+        # Проводки по пользователям, внутри пользователя - в порядке лога
+        self.order = np.argsort(users, kind='stable')
+        counts = np.bincount(users, minlength=len(names))
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+
+        first = before[self.order[self.starts]]
+        self.unknown_opening = first == UNKNOWN_BALANCE
+        self.opening = np.where(self.unknown_opening, 0, first)
+
+        # Баланс после каждой проводки: начальный + накопленная сумма внутри группы пользователя
+        running = np.cumsum(deltas[self.order])
+        group_base = np.concatenate(([0], running))[self.starts]
+        self.after = running + np.repeat(self.opening - group_base, counts)
+
+    @classmethod
+    def from_log(cls, path, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Разбор всех поколений лога, от самого старого"""
+        chunks = []
+        for file_path in generations(path):
+            end = None if is_compressed(file_path) else os.path.getsize(file_path)
+            chunks.extend(split_chunks(file_path, 0, end, chunk_size))
+        if workers == 1 or len(chunks) < 2:
+            return cls.from_parts([posting_chunk(*chunk) for chunk in chunks])
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            return cls.from_parts(list(executor.map(posting_chunk, *zip(*chunks))))
+
+    @classmethod
+    def from_parts(cls, parts):
+        """Сведение словарей участков в общий: номера участка переводятся через массив соответствия"""
+        vocabulary = {}
+        users = [np.array([], dtype=np.int64)]
+        deltas = [np.array([], dtype=np.int64)]
+        before = [np.array([], dtype=np.int64)]
+        stamps = [np.array([], dtype='datetime64[s]')]
+        for part_names, part_users, part_deltas, part_before, part_stamps in parts:
+            mapping = np.array(
+                [vocabulary.setdefault(name, len(vocabulary)) for name in part_names], dtype=np.int64
+            )
+            users.append(mapping[part_users] if len(part_users) else part_users)
+            deltas.append(part_deltas)
+            before.append(part_before)
+            stamps.append(part_stamps)
+        return cls(
+            list(vocabulary),
+            np.concatenate(users), np.concatenate(deltas), np.concatenate(before), np.concatenate(stamps)
+        )
+
+    def final_balances(self):
+        """Баланс каждого пользователя после его последней проводки"""
+        return self.after[self.ends - 1]
+
+    def balances_at(self, moment):
+        """Баланс каждого пользователя на момент moment (наивный datetime в местном времени лога, включительно)"""
+        if not self.names:
+            return self.opening
+        due = (self.stamps[self.order] <= np.datetime64(moment.strftime('%Y-%m-%dT%H:%M:%S'), 's')).astype(np.int64)
+        # Внутри группы проводки идут в порядке лога, поэтому попавшие в срок - ее начало
+        due_counts = np.add.reduceat(due, self.starts)
+        balances = self.opening.copy()
+        reached = due_counts > 0
+        balances[reached] = self.after[self.starts[reached] + due_counts[reached] - 1]
+        return balances
+
+
+def database_balances(usernames, batch_size=1000):
+    """
+    {имя: баланс в копейках со слотами} из UserBalance запросами по batch_size имен
+    """
+    from wallet.models import UserBalance
+
+    balances = {}
+    for start in range(0, len(usernames), batch_size):
+        batch = usernames[start:start + batch_size]
+        balances.update(
+            UserBalance.objects.filter(user__username__in=batch)
+            .annotate(total=F('balance_kopecks') + Coalesce(Sum('shards__balance_kopecks'), 0))
+            .values_list('user__username', 'total')
+        )
+    return balances
@@ -0,0 +1,106 @@
+"""
+Потоковые агрегаты по событиям: пропускная способность по секундам
+и квантили значений (суммы переводов и пополнений в копейках,
+длительность SLOW_REQUEST в миллисекундах).
+
+Оба агрегата аддитивны: счетчики секунд складываются, а квантили
+считаются по DDSketch - гистограмме с логарифмическими корзинами,
+где корзины двух эскизов складываются поштучно. Поэтому итоги участков,
+разобранных в разных процессах, и итоги разных запусков объединяются
+без потери точности, а в индексе хранятся как строки со счетчиками
+(секунда; минута и корзина эскиза), к которым прибавляются новые.
+"""
+import math
+from collections import Counter
+
+
+RELATIVE_ACCURACY = 0.01
+
+# Метрика -> единица значения; значение строки события берется из колонки
+METRICS = {
+    'DEPOSIT_SUCCESS': 'kopecks',
+    'TRANSFER_SUCCESS': 'kopecks',
+    'SLOW_REQUEST': 'ms',
+}
+VALUE_COLUMN = {
+    'kopecks': 4,
+    'ms': 6,
+}
+
+
+class DDSketch:
+    """
+    Эскиз квантилей с относительной погрешностью RELATIVE_ACCURACY:
+    значение v попадает в корзину ceil(log_gamma(v)), gamma = (1 + a) / (1 - a).
+    Значения меньше 1 учитываются в корзине единицы.
+    """
+
+    gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    log_gamma = math.log(gamma)
+
+    def __init__(self, bins=None):
+        self.bins = Counter(bins or {})
+
+    @property
+    def count(self):
+        return sum(self.bins.values())
+
+    def add(self, value, count=1):
+        self.bins[math.ceil(math.log(max(value, 1)) / self.log_gamma)] += count
+
+    def merge(self, other):
+        self.bins.update(other.bins)
+        return self
+
+    def quantile(self, q):
+        """Значение квантиля q (0..1) или None для пустого эскиза"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        # Середина корзины (gamma^(i-1), gamma^i] с погрешностью не больше RELATIVE_ACCURACY
+        return round(2 * self.gamma ** index / (self.gamma + 1))
+
+
+class Rollup:
+    """
+    Агрегаты участка: {(метрика, секунда): [событий, сумма значений]}
+    и {(метрика, минута): DDSketch}
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.sketches = {}
+
+    def add(self, row):
+        event, ts = row[0], row[1]
+        unit = METRICS.get(event)
+        if unit is None:
+            return
+        value = row[VALUE_COLUMN[unit]]
+        if value is None:
+            return
+        bucket = self.seconds.get((event, ts))
+        if bucket is None:
+            self.seconds[(event, ts)] = [1, value]
+        else:
+            bucket[0] += 1
+            bucket[1] += value
+        sketch = self.sketches.get((event, ts[:16]))
+        if sketch is None:
+            sketch = self.sketches[(event, ts[:16])] = DDSketch()
+        sketch.add(value)
+
+    def merge(self, other):
+        for key, (count, total) in other.seconds.items():
+            bucket = self.seconds.setdefault(key, [0, 0])
+            bucket[0] += count
+            bucket[1] += total
+        for key, sketch in other.sketches.items():
+            self.sketches.setdefault(key, DDSketch()).merge(sketch)
+        return self
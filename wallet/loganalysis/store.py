@@ -0,0 +1,298 @@
+"""
+Локальный SQLite-индекс событий из логов.
+
+Для каждого лога хранится контрольная точка (inode файла и смещение
+после последней целиком прочитанной строки), поэтому повторный запуск
+разбирает только дописанные строки. Если файл с тех пор был ротирован,
+дочитывается хвост поколения с тем же inode и все более новые поколения.
+Первый запуск разбирает все поколения, включая сжатые .gz, начиная
+с начала запрошенного окна (covered_from); если позже запрошено более
+раннее окно, недостающие строки дочитываются. Границы окна в файлах
+находятся двоичным поиском по времени (files.seek_time). Файлы делятся
+на участки, которые разбираются в пуле процессов. Отчеты - SQL-агрегаты
+по индексу (event, ts). В том же проходе считаются агрегаты rollups:
+счетчики событий по секундам и эскизы квантилей по минутам, которые
+прибавляются к уже сохраненным.
+"""
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .files import DEFAULT_CHUNK_SIZE, Partial, generations, is_compressed, parse_chunk, seek_time, split_chunks
+from .rollups import METRICS, DDSketch
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    event TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    user TEXT,
+    counterparty TEXT,
+    amount_kopecks INTEGER,
+    message TEXT,
+    duration_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_event_ts_idx ON events (event, ts);
+CREATE TABLE IF NOT EXISTS throughput (
+    metric TEXT NOT NULL,
+    second TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (metric, second)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sketch_bins (
+    metric TEXT NOT NULL,
+    minute TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (metric, minute, bin)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS checkpoints (
+    source TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    last_ts TEXT,
+    covered_from TEXT
+);
+"""
+
+
+class LogIndex:
+    """
+    Индекс событий security.log и transactions.log
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        for table, column, column_type in (
+            ('checkpoints', 'last_ts', 'TEXT'),
+            ('checkpoints', 'covered_from', 'TEXT'),
+            ('events', 'duration_ms', 'INTEGER'),
+        ):
+            if column not in {row[1] for row in self.db.execute(f'PRAGMA table_info({table})')}:
+                # Индекс, созданный до появления колонки
+                self.db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def close(self):
+        self.db.close()
+
+    def reset(self):
+        with self.db:
+            for table in ('events', 'checkpoints', 'throughput', 'sketch_bins'):
+                self.db.execute(f'DELETE FROM {table}')
+
+    def checkpoint(self, source):
+        return self.db.execute(
+            'SELECT inode, offset, last_ts, covered_from FROM checkpoints WHERE source = ?', [source]
+        ).fetchone()
+
+    def pending_segments(self, source, path, since=None):
+        """
+        Участки поколений лога, которые еще не попали в индекс:
+        ([(путь, начало)], окно времени строк (after, since, until) или None)
+        """
+        files = generations(path)
+        checkpoint = self.checkpoint(source)
+        if checkpoint is None:
+            if since is None:
+                return [(file_path, 0) for file_path in files], None
+            # Первый разбор начинается с начала окна; сжатые поколения фильтруются построчно
+            return [(file_path, seek_time(file_path, since)) for file_path in files], (None, since, None)
+
+        checkpoint_inode, offset, last_ts, covered_from = checkpoint
+        for position, file_path in enumerate(files):
+            if not is_compressed(file_path) and os.stat(file_path).st_ino == checkpoint_inode:
+                if os.path.getsize(file_path) < offset:
+                    # Файл короче контрольной точки - его перезаписали, читаем заново
+                    offset = 0
+                return [(file_path, offset)] + [(newer, 0) for newer in files[position + 1:]], None
+
+        # Файл контрольной точки ротирован за пределы найденных поколений или сжат:
+        # читаются все поколения, строки не новее last_ts отбрасываются
+        return [(file_path, 0) for file_path in files], (last_ts, None, None)
+
+    def backfill_segments(self, path, since, until):
+        """
+        Участки поколений со строками с since (включительно) до until - двоичный поиск по времени
+        """
+        segments = []
+        for file_path in generations(path):
+            lo = seek_time(file_path, since)
+            hi = None if is_compressed(file_path) else seek_time(file_path, until, lo)
+            segments.append((file_path, lo, hi))
+        return segments
+
+    def ingest(self, source, path, since=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Разбор новых строк всех поколений лога в индекс.
+        С since первый разбор начинается с начала окна, а если окно шире
+        уже проиндексированного, недостающее начало дочитывается из поколений.
+        Возвращает статистику разбора.
+        """
+        started = time.monotonic()
+        inode = os.stat(path).st_ino
+        checkpoint = self.checkpoint(source)
+        segments, window = self.pending_segments(source, path, since)
+
+        # Участки: (путь, начало, конец, окно времени, продолжает ли участок основной разбор)
+        chunks = []
+        offset = 0
+        for segment_path, start in segments:
+            end = None if is_compressed(segment_path) else os.path.getsize(segment_path)
+            chunks.extend((*chunk, window, True) for chunk in split_chunks(segment_path, start, end, chunk_size))
+            if segment_path == path:
+                offset = start
+
+        covered_from = (checkpoint[3] or '') if checkpoint else (since or '')
+        if checkpoint is not None and since is not None and since < covered_from:
+            until = covered_from
+            backfill = (None, since, until)
+            for segment_path, lo, hi in self.backfill_segments(path, since, until):
+                chunks.extend((*chunk, backfill, False) for chunk in split_chunks(segment_path, lo, hi, chunk_size))
+            covered_from = since
+
+        total = Partial()
+        rows = []
+        results = self.parse_chunks(source, [chunk[:4] for chunk in chunks], workers)
+        for (chunk_path, lo, hi, _window, forward), (chunk_rows, partial, end) in zip(chunks, results):
+            total.merge(partial)
+            rows.extend(chunk_rows)
+            if forward and chunk_path == path:
+                offset = end
+
+        known = [checkpoint[2]] if checkpoint and checkpoint[2] else []
+        last_ts = max([row[1] for row in rows] + known, default=None)
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO events (event, ts, user, counterparty, amount_kopecks, message, duration_ms) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self.db.executemany(
+                'INSERT INTO throughput (metric, second, count, total) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (metric, second) DO UPDATE SET '
+                'count = count + excluded.count, total = total + excluded.total',
+                [(metric, second, count, value) for (metric, second), (count, value) in total.rollup.seconds.items()]
+            )
+            self.db.executemany(
+                'INSERT INTO sketch_bins (metric, minute, bin, count) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (metric, minute, bin) DO UPDATE SET count = count + excluded.count',
+                [
+                    (metric, minute, index, count)
+                    for (metric, minute), sketch in total.rollup.sketches.items()
+                    for index, count in sketch.bins.items()
+                ]
+            )
+            self.db.execute(
+                'INSERT OR REPLACE INTO checkpoints (source, inode, offset, last_ts, covered_from) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [source, inode, offset, last_ts, covered_from]
+            )
+
+        seconds = time.monotonic() - started
+        return {
+            'files': len({chunk[0] for chunk in chunks}),
+            'chunks': len(chunks),
+            'lines': total.lines,
+            'bytes': total.bytes,
+            'events': len(rows),
+            'seconds': seconds,
+            'lines_per_sec': total.lines / seconds if seconds else 0.0,
+        }
+
+    def parse_chunks(self, source, chunks, workers):
+        """Разбор участков; результаты возвращаются в порядке участков"""
+        if workers == 1 or len(chunks) < 2:
+            return [parse_chunk(source, *chunk) for chunk in chunks]
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            return list(executor.map(parse_chunk, [source] * len(chunks), *zip(*chunks)))
+
+    def top_users(self, event, since, column='user', total='COUNT(*)', limit=10):
+        return self.db.execute(
+            f'SELECT {column}, {total} FROM events WHERE event = ? AND ts >= ? '
+            f'GROUP BY {column} ORDER BY 2 DESC LIMIT ?',
+            [event, since, limit]
+        ).fetchall()
+
+    def recent_messages(self, event, since, limit):
+        count, = self.db.execute(
+            'SELECT COUNT(*) FROM events WHERE event = ? AND ts >= ?', [event, since]
+        ).fetchone()
+        messages = self.db.execute(
+            'SELECT message FROM events WHERE event = ? AND ts >= ? ORDER BY ts DESC, id DESC LIMIT ?',
+            [event, since, limit]
+        ).fetchall()
+        return count, [message for message, in reversed(messages)]
+
+    def security_report(self, since):
+        return {
+            'logins': self.top_users('LOGIN_SUCCESS', since),
+            'failed_logins': self.top_users('LOGIN_FAILED', since),
+            'suspicious': self.recent_messages('SUSPICIOUS', since, 5),
+            'rate_limit': self.recent_messages('RATE_LIMIT_EXCEEDED', since, 3),
+            'admin_actions': self.recent_messages('ADMIN_ACTION', since, 5),
+        }
+
+    def transaction_report(self, since):
+        count, volume = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(amount_kopecks), 0) FROM events "
+            "WHERE event IN ('DEPOSIT_SUCCESS', 'TRANSFER_SUCCESS') AND ts >= ?",
+            [since]
+        ).fetchone()
+        amount = 'SUM(amount_kopecks)'
+        return {
+            'count': count,
+            'volume_kopecks': volume,
+            'deposits': self.top_users('DEPOSIT_SUCCESS', since, total=amount, limit=5),
+            'senders': self.top_users('TRANSFER_SUCCESS', since, total=amount, limit=5),
+            'recipients': self.top_users('TRANSFER_SUCCESS', since, column='counterparty', total=amount, limit=5),
+        }
+
+    def rollups(self, metrics, since, bucket='hour'):
+        """
+        Агрегаты по интервалам bucket ('minute' или 'hour') и за все окно (bucket 'all'):
+        событий, сумма значений, пик событий в секунду и p50/p95/p99 значения.
+        Эскизы хранятся по минутам, поэтому квантили учитывают минуту начала окна целиком.
+        """
+        width = {'minute': 16, 'hour': 13}[bucket]
+        metrics = [metric for metric in metrics if metric in METRICS]
+        placeholders = ', '.join('?' * len(metrics))
+        stats = {}
+        for metric, key, count, total, peak in self.db.execute(
+            f'SELECT metric, substr(second, 1, {width}), SUM(count), SUM(total), MAX(count) FROM throughput '
+            f'WHERE metric IN ({placeholders}) AND second >= ? GROUP BY 1, 2',
+            [*metrics, since]
+        ):
+            for bucket_key in (key, 'all'):
+                row = stats.setdefault((metric, bucket_key), {'count': 0, 'total': 0, 'peak_per_second': 0})
+                row['count'] += count
+                row['total'] += total
+                row['peak_per_second'] = max(row['peak_per_second'], peak)
+
+        sketches = {}
+        for metric, key, index, count in self.db.execute(
+            f'SELECT metric, substr(minute, 1, {width}), bin, SUM(count) FROM sketch_bins '
+            f'WHERE metric IN ({placeholders}) AND minute >= ? GROUP BY 1, 2, 3',
+            [*metrics, since[:16]]
+        ):
+            for bucket_key in (key, 'all'):
+                sketches.setdefault((metric, bucket_key), DDSketch()).bins[index] += count
+
+        result = []
+        for metric, key in sorted(stats, key=lambda item: (item[1] == 'all', item[1], item[0])):
+            sketch = sketches.get((metric, key), DDSketch())
+            result.append({
+                'bucket': key,
+                'metric': metric,
+                'unit': METRICS[metric],
+                **stats[(metric, key)],
+                'p50': sketch.quantile(0.5),
+                'p95': sketch.quantile(0.95),
+                'p99': sketch.quantile(0.99),
+            })
+        return result
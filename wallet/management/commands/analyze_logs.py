@@ -1,10 +1,16 @@
+import csv
+import json
 import os
-import re
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 
+from wallet.loganalysis.rollups import METRICS
+from wallet.loganalysis.store import LogIndex
+
+
+ROLLUP_COLUMNS = ['bucket', 'metric', 'unit', 'count', 'total', 'peak_per_second', 'p50', 'p95', 'p99']
+
 
 class Command(BaseCommand):
     help = 'Анализ логов безопасности и транзакций'
@@ -22,33 +28,123 @@ class Command(BaseCommand):
             default='all',
             help='Тип анализа логов'
         )
+        parser.add_argument(
+            '--index',
+            help='Файл SQLite-индекса событий (по умолчанию: LOG_ANALYSIS_INDEX или logs/analytics.sqlite3)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество процессов для разбора логов (по умолчанию: 4)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Очистить индекс и разобрать логи заново'
+        )
+        parser.add_argument(
+            '--rollup',
+            choices=['minute', 'hour'],
+            help='Нагрузка и квантили сумм и длительностей SLOW_REQUEST по минутам или часам'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['table', 'json', 'csv'],
+            default='table',
+            help='Формат вывода: table - отчеты и таблица агрегатов, json и csv - только агрегаты (по умолчанию: table)'
+        )
 
     def handle(self, *args, **options):
         days = options['days']
         analysis_type = options['type']
-        
+        output_format = options['format']
+
         logs_dir = os.path.join(settings.BASE_DIR, 'logs')
-        
+
         if not os.path.exists(logs_dir):
-            self.stdout.write(
+            write = self.stdout.write if output_format == 'table' else self.stderr.write
+            write(
                 self.style.ERROR('Директория логов не найдена. Убедитесь, что логирование настроено.')
             )
             return
 
+        if output_format == 'table':
+            self.stdout.write(
+                self.style.SUCCESS(f'Анализ логов за последние {days} дней...\n')
+            )
+
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть положительным')
+        self.workers = options['workers']
+
+        index = LogIndex(
+            options['index']
+            or getattr(settings, 'LOG_ANALYSIS_INDEX', None)
+            or os.path.join(logs_dir, 'analytics.sqlite3')
+        )
+        if options['rebuild']:
+            index.reset()
+        # Время в логах записано строкой 'YYYY-MM-DD HH:MM:SS' и сравнивается как строка
+        since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+        sources = [source for source in ('security', 'transactions') if analysis_type in [source, 'all']]
+        metrics = [
+            metric for metric in METRICS
+            if ('security' if metric == 'SLOW_REQUEST' else 'transactions') in sources
+        ]
+        try:
+            if output_format != 'table':
+                # Машиночитаемый вывод: только агрегаты, без отчетов и статистики разбора
+                for source in sources:
+                    path = os.path.join(logs_dir, f'{source}.log')
+                    if os.path.exists(path):
+                        index.ingest(source, path, since=since, workers=self.workers)
+                self.write_rollups(index.rollups(metrics, since, options['rollup'] or 'hour'), output_format)
+                return
+
+            if 'security' in sources:
+                self.analyze_security_logs(index, logs_dir, since)
+
+            if 'transactions' in sources:
+                self.analyze_transaction_logs(index, logs_dir, since)
+
+            if options['rollup']:
+                title = {'minute': 'МИНУТАМ', 'hour': 'ЧАСАМ'}[options['rollup']]
+                self.stdout.write(self.style.SUCCESS(f'\n=== НАГРУЗКА ПО {title} ==='))
+                self.write_rollups(index.rollups(metrics, since, options['rollup']), output_format)
+        finally:
+            index.close()
+
+    def write_rollups(self, rows, output_format):
+        """Вывод агрегатов: суммы в копейках, длительности в миллисекундах"""
+        if output_format == 'json':
+            self.stdout.write(json.dumps(rows, ensure_ascii=False, indent=2))
+        elif output_format == 'csv':
+            writer = csv.DictWriter(self.stdout, fieldnames=ROLLUP_COLUMNS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            table = [ROLLUP_COLUMNS] + [
+                ['' if row[column] is None else str(row[column]) for column in ROLLUP_COLUMNS] for row in rows
+            ]
+            widths = [max(len(line[position]) for line in table) for position in range(len(ROLLUP_COLUMNS))]
+            for line in table:
+                self.stdout.write('  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip())
+
+    def ingest(self, index, source, path, since):
+        """Добавление в индекс строк окна из всех поколений лога, которых в нем еще нет"""
+        stats = index.ingest(source, path, since=since, workers=self.workers)
         self.stdout.write(
-            self.style.SUCCESS(f'Анализ логов за последние {days} дней...\n')
+            f'Проиндексировано новых строк {os.path.basename(path)}: {stats["lines"]}, '
+            f'событий: {stats["events"]} (файлов: {stats["files"]}, участков: {stats["chunks"]}) '
+            f'за {stats["seconds"]:.2f} с, {stats["lines_per_sec"]:.0f} строк/с'
         )
 
-        if analysis_type in ['security', 'all']:
-            self.analyze_security_logs(logs_dir, days)
-            
-        if analysis_type in ['transactions', 'all']:
-            self.analyze_transaction_logs(logs_dir, days)
-
-    def analyze_security_logs(self, logs_dir, days):
+    def analyze_security_logs(self, index, logs_dir, since):
         """Анализ логов безопасности"""
         security_log_path = os.path.join(logs_dir, 'security.log')
-        
+
         if not os.path.exists(security_log_path):
             self.stdout.write(
                 self.style.WARNING('Файл security.log не найден')
@@ -56,83 +152,48 @@ class Command(BaseCommand):
             return
 
         self.stdout.write(self.style.SUCCESS('=== АНАЛИЗ БЕЗОПАСНОСТИ ==='))
-        
-        login_attempts = defaultdict(int)
-        failed_logins = defaultdict(int)
-        suspicious_activities = []
-        rate_limit_violations = []
-        admin_actions = []
-        
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        try:
-            with open(security_log_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if not line.strip():
-                        continue
-                    
-                    date_match = re.match(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', line)
-                    if date_match:
-                        log_date = datetime.strptime(date_match.group(1), '%Y-%m-%d %H:%M:%S')
-                        if log_date < cutoff_date:
-                            continue
-                    
-                    if 'LOGIN_SUCCESS' in line:
-                        user_match = re.search(r'user=(\w+)', line)
-                        if user_match:
-                            login_attempts[user_match.group(1)] += 1
-                    
-                    elif 'LOGIN_FAILED' in line:
-                        user_match = re.search(r'username=(\w+)', line)
-                        if user_match:
-                            failed_logins[user_match.group(1)] += 1
-                    
-                    elif 'RATE_LIMIT_EXCEEDED' in line:
-                        rate_limit_violations.append(line.strip())
-                    
-                    elif 'ADMIN_' in line:
-                        admin_actions.append(line.strip())
-                    
-                    elif any(suspicious in line for suspicious in [
-                        'LARGE_DEPOSIT_ATTEMPT', 'LARGE_TRANSFER_ATTEMPT',
-                        'SELF_TRANSFER_ATTEMPT', 'INSUFFICIENT_FUNDS'
-                    ]):
-                        suspicious_activities.append(line.strip())
 
+        try:
+            self.ingest(index, 'security', security_log_path, since)
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Ошибка при чтении security.log: {str(e)}')
             )
             return
 
+        report = index.security_report(since)
+
         self.stdout.write(f'\n📊 Статистика входов в систему:')
-        for user, count in sorted(login_attempts.items(), key=lambda x: x[1], reverse=True)[:10]:
+        for user, count in report['logins']:
             self.stdout.write(f'  {user}: {count} успешных входов')
 
-        if failed_logins:
+        if report['failed_logins']:
             self.stdout.write(f'\n⚠️  Неудачные попытки входа:')
-            for user, count in sorted(failed_logins.items(), key=lambda x: x[1], reverse=True)[:10]:
+            for user, count in report['failed_logins']:
                 self.stdout.write(f'  {user}: {count} неудачных попыток')
 
-        if suspicious_activities:
-            self.stdout.write(f'\n🚨 Подозрительная активность ({len(suspicious_activities)} событий):')
-            for activity in suspicious_activities[-5:]:
+        count, activities = report['suspicious']
+        if count:
+            self.stdout.write(f'\n🚨 Подозрительная активность ({count} событий):')
+            for activity in activities:
                 self.stdout.write(f'  {activity}')
 
-        if rate_limit_violations:
-            self.stdout.write(f'\n⚡ Превышения лимита запросов ({len(rate_limit_violations)} событий):')
-            for violation in rate_limit_violations[-3:]:
+        count, violations = report['rate_limit']
+        if count:
+            self.stdout.write(f'\n⚡ Превышения лимита запросов ({count} событий):')
+            for violation in violations:
                 self.stdout.write(f'  {violation}')
 
-        if admin_actions:
-            self.stdout.write(f'\n👤 Действия администраторов ({len(admin_actions)} событий):')
-            for action in admin_actions[-5:]:
+        count, actions = report['admin_actions']
+        if count:
+            self.stdout.write(f'\n👤 Действия администраторов ({count} событий):')
+            for action in actions:
                 self.stdout.write(f'  {action}')
 
-    def analyze_transaction_logs(self, logs_dir, days):
+    def analyze_transaction_logs(self, index, logs_dir, since):
         """Анализ логов транзакций"""
         transaction_log_path = os.path.join(logs_dir, 'transactions.log')
-        
+
         if not os.path.exists(transaction_log_path):
             self.stdout.write(
                 self.style.WARNING('Файл transactions.log не найден')
@@ -140,77 +201,38 @@ class Command(BaseCommand):
             return
 
         self.stdout.write(self.style.SUCCESS('\n=== АНАЛИЗ ТРАНЗАКЦИЙ ==='))
-        
-        user_deposits = defaultdict(float)
-        user_transfers_out = defaultdict(float)
-        user_transfers_in = defaultdict(float)
-        total_volume = 0.0
-        transaction_count = 0
-        
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        try:
-            with open(transaction_log_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if not line.strip():
-                        continue
-                    
-                    date_match = re.match(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', line)
-                    if date_match:
-                        log_date = datetime.strptime(date_match.group(1), '%Y-%m-%d %H:%M:%S')
-                        if log_date < cutoff_date:
-                            continue
-                    
-                    if 'DEPOSIT_SUCCESS' in line:
-                        user_match = re.search(r'user=(\w+)', line)
-                        amount_match = re.search(r'amount=([0-9.]+)', line)
-                        if user_match and amount_match:
-                            user = user_match.group(1)
-                            amount = float(amount_match.group(1))
-                            user_deposits[user] += amount
-                            total_volume += amount
-                            transaction_count += 1
-                    
-                    elif 'TRANSFER_SUCCESS' in line:
-                        sender_match = re.search(r'sender=(\w+)', line)
-                        recipient_match = re.search(r'recipient=(\w+)', line)
-                        amount_match = re.search(r'amount=([0-9.]+)', line)
-                        
-                        if sender_match and recipient_match and amount_match:
-                            sender = sender_match.group(1)
-                            recipient = recipient_match.group(1)
-                            amount = float(amount_match.group(1))
-                            
-                            user_transfers_out[sender] += amount
-                            user_transfers_in[recipient] += amount
-                            total_volume += amount
-                            transaction_count += 1
 
+        try:
+            self.ingest(index, 'transactions', transaction_log_path, since)
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Ошибка при чтении transactions.log: {str(e)}')
             )
             return
 
+        report = index.transaction_report(since)
+        transaction_count = report['count']
+        total_volume = report['volume_kopecks'] / 100
+
         self.stdout.write(f'\n📈 Общая статистика:')
         self.stdout.write(f'  Всего транзакций: {transaction_count}')
         self.stdout.write(f'  Общий объем: {total_volume:.2f} ₽')
         if transaction_count > 0:
             self.stdout.write(f'  Средняя сумма: {total_volume/transaction_count:.2f} ₽')
 
-        if user_deposits:
+        if report['deposits']:
             self.stdout.write(f'\n💰 Топ пополнений:')
-            for user, amount in sorted(user_deposits.items(), key=lambda x: x[1], reverse=True)[:5]:
-                self.stdout.write(f'  {user}: {amount:.2f} ₽')
+            for user, amount in report['deposits']:
+                self.stdout.write(f'  {user}: {amount / 100:.2f} ₽')
 
-        if user_transfers_out:
+        if report['senders']:
             self.stdout.write(f'\n📤 Топ отправителей:')
-            for user, amount in sorted(user_transfers_out.items(), key=lambda x: x[1], reverse=True)[:5]:
-                self.stdout.write(f'  {user}: {amount:.2f} ₽ отправлено')
+            for user, amount in report['senders']:
+                self.stdout.write(f'  {user}: {amount / 100:.2f} ₽ отправлено')
 
-        if user_transfers_in:
+        if report['recipients']:
             self.stdout.write(f'\n📥 Топ получателей:')
-            for user, amount in sorted(user_transfers_in.items(), key=lambda x: x[1], reverse=True)[:5]:
-                self.stdout.write(f'  {user}: {amount:.2f} ₽ получено')
+            for user, amount in report['recipients']:
+                self.stdout.write(f'  {user}: {amount / 100:.2f} ₽ получено')
 
-        self.stdout.write('\n✅ Анализ завершен') 
\ No newline at end of file
+        self.stdout.write('\n✅ Анализ завершен')
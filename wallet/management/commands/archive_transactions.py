@@ -0,0 +1,235 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from wallet.models import LedgerSnapshot, Transaction
+from wallet.partitions import drop_partition, ensure_partitions, is_partitioned, list_partitions
+from wallet.services import TOTAL_COUNTERS
+
+
+ARCHIVE_FIELDS = (
+    'id', 'from_user_id', 'to_user_id', 'account_id', 'amount_kopecks',
+    'transaction_type', 'description', 'balance_after_kopecks', 'created_at',
+)
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка старых транзакций в архив (NDJSON + gzip) с сохранением итогов по счетам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            required=True,
+            help='Архивировать операции, созданные раньше этой даты (ISO 8601)'
+        )
+        parser.add_argument(
+            '--output-dir',
+            default=os.path.join(settings.BASE_DIR, 'archive'),
+            help='Каталог для архивных файлов (по умолчанию: archive/)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Размер чанка при чтении и удалении строк (по умолчанию: 5000)'
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='Сколько будущих месячных секций создать заранее (только PostgreSQL, по умолчанию: 3)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только выгрузить файлы, ничего не удаляя'
+        )
+
+    def handle(self, *args, **options):
+        before = self.parse_before(options['before'])
+        output_dir = options['output_dir']
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        os.makedirs(output_dir, exist_ok=True)
+
+        started = time.monotonic()
+        archived = 0
+
+        if is_partitioned(connection):
+            ensure_partitions(connection, timezone.now(), options['months_ahead'])
+            for name, lower, upper in list_partitions(connection):
+                if upper > before:
+                    break
+                archived += self.archive_partition(name, upper, output_dir, chunk_size, dry_run)
+
+        # Оставшиеся строки: SQLite, секция по умолчанию или граница внутри месяца
+        archived += self.archive_rows(before, output_dir, chunk_size, dry_run)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Заархивировано операций: {archived} за {time.monotonic() - started:.1f} с'
+            + (' (пробный запуск, данные не удалены)' if dry_run else '')
+        ))
+
+    def archive_partition(self, name, upper, output_dir, chunk_size, dry_run):
+        """Выгрузка целой месячной секции и ее удаление вместе с записью итогов"""
+        path = os.path.join(output_dir, f'{name}.ndjson.gz')
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {name} IN SHARE MODE")
+            totals, count = self.export(self.partition_rows(name, chunk_size), path, chunk_size)
+            if not dry_run:
+                self.save_snapshots(totals, upper)
+                with connection.cursor() as cursor:
+                    drop_partition(cursor, name)
+
+        self.stdout.write(f'  {name}: {count} операций -> {path}')
+        return count
+
+    def archive_rows(self, before, output_dir, chunk_size, dry_run):
+        """Выгрузка отдельных строк до границы и их удаление чанками по id"""
+        queryset = Transaction.objects.filter(created_at__lt=before)
+        if not queryset.exists():
+            return 0
+
+        path = os.path.join(
+            output_dir,
+            f'wallet_transaction_before_{before:%Y%m%dT%H%M%S}_{int(time.time())}.ndjson.gz'
+        )
+        # Выгрузка, удаление и итоги - одна транзакция: удаляются ровно выгруженные строки,
+        # а при ошибке выгрузки ничего не удаляется
+        with transaction.atomic():
+            totals, count = self.export(self.locked_rows(queryset, chunk_size, not dry_run), path, chunk_size)
+            if not dry_run:
+                self.save_snapshots(totals, before)
+
+        self.stdout.write(f'  отдельные строки: {count} операций -> {path}')
+        return count
+
+    def locked_rows(self, queryset, chunk_size, delete):
+        """
+        Чтение строк чанками по id под select_for_update; если delete,
+        чанк удаляется по своим id после того, как выгрузка его прочитала
+        """
+        last_id = 0
+        while True:
+            rows = list(
+                queryset.select_for_update().filter(id__gt=last_id).order_by('id')
+                .values_list(*ARCHIVE_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                break
+            yield from rows
+            ids = [row[0] for row in rows]
+            last_id = ids[-1]
+            if delete:
+                queryset.filter(id__in=ids).delete()
+
+    def partition_rows(self, name, chunk_size):
+        """Потоковое чтение секции серверным курсором"""
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(ARCHIVE_FIELDS)} FROM {name} ORDER BY created_at, id")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def export(self, rows, path, chunk_size):
+        """
+        Запись строк в NDJSON.gz и подсчет итогов по счетам:
+        {account_id: [сумма со знаком, количество, последняя операция (created_at, id), баланс после нее,
+                      {поле суммы по типу операции: сумма}]}
+        """
+        totals = {}
+        count = 0
+        buffer = []
+        tmp_path = f'{path}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+            for row in rows:
+                record = dict(zip(ARCHIVE_FIELDS, row))
+                account_id = record['account_id'] or (
+                    record['from_user_id']
+                    if record['transaction_type'] == Transaction.TransactionType.TRANSFER_OUT
+                    else record['to_user_id']
+                )
+                signed = (
+                    -record['amount_kopecks']
+                    if record['transaction_type'] == Transaction.TransactionType.TRANSFER_OUT
+                    else record['amount_kopecks']
+                )
+                entry = totals.setdefault(account_id, [0, 0, None, None, dict.fromkeys(TOTAL_COUNTERS.values(), 0)])
+                entry[0] += signed
+                entry[1] += 1
+                entry[4][TOTAL_COUNTERS[record['transaction_type']]] += record['amount_kopecks']
+                position = (record['created_at'], record['id'])
+                if entry[2] is None or position > entry[2]:
+                    entry[2] = position
+                    entry[3] = record['balance_after_kopecks']
+
+                record['created_at'] = record['created_at'].isoformat()
+                buffer.append(json.dumps(record, ensure_ascii=False))
+                count += 1
+                if len(buffer) >= chunk_size:
+                    archive.write('\n'.join(buffer) + '\n')
+                    buffer = []
+            if buffer:
+                archive.write('\n'.join(buffer) + '\n')
+        os.replace(tmp_path, path)
+        return totals, count
+
+    def save_snapshots(self, totals, archived_before):
+        """Накопление итогов архива по счетам"""
+        snapshots = {
+            snapshot.account_id: snapshot
+            for snapshot in LedgerSnapshot.objects.select_for_update().filter(account_id__in=list(totals))
+        }
+        to_create = []
+        for account_id, (net, count, last_position, last_balance, type_totals) in totals.items():
+            snapshot = snapshots.get(account_id)
+            if snapshot is None:
+                snapshot = LedgerSnapshot(account_id=account_id, archived_before=archived_before)
+                to_create.append(snapshot)
+            snapshot.net_kopecks += net
+            snapshot.transaction_count += count
+            for name, amount in type_totals.items():
+                # NULL остается NULL: часть архива выгружена до появления сумм по типам
+                if getattr(snapshot, name) is not None:
+                    setattr(snapshot, name, getattr(snapshot, name) + amount)
+            snapshot.archived_before = max(snapshot.archived_before, archived_before)
+            if snapshot.last_transaction_at is None or last_position[0] >= snapshot.last_transaction_at:
+                snapshot.last_transaction_at, snapshot.last_transaction_id = last_position
+                snapshot.balance_after_kopecks = last_balance
+
+        LedgerSnapshot.objects.bulk_create(to_create)
+        LedgerSnapshot.objects.bulk_update(
+            list(snapshots.values()),
+            [
+                'net_kopecks', 'transaction_count', 'archived_before', 'last_transaction_at',
+                'last_transaction_id', 'balance_after_kopecks', *TOTAL_COUNTERS.values(),
+            ]
+        )
+
+    def parse_before(self, value):
+        try:
+            before = parse_datetime(value)
+            if before is None:
+                date = parse_date(value)
+                before = datetime.combine(date, datetime.min.time()) if date else None
+        except ValueError:
+            # Формат верный, но такой даты нет (например, 2024-02-30)
+            before = None
+        if before is None:
+            raise CommandError(f'Некорректное значение --before: {value}')
+        if timezone.is_naive(before):
+            before = timezone.make_aware(before)
+        if before > timezone.now():
+            # Иначе в архив попадали бы операции, которые еще продолжают записываться
+            raise CommandError(f'--before не может быть позже текущего момента: {value}')
+        return before
@@ -0,0 +1,122 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+
+from wallet.models import LedgerSnapshot, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Заполнение account и balance_after_kopecks для существующих транзакций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Количество строк/пользователей, обрабатываемых за одну транзакцию (по умолчанию: 5000)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Пауза между чанками в секундах, чтобы не нагружать базу (по умолчанию: 0)'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        pause = options['sleep']
+
+        started = time.monotonic()
+        accounts_filled = self.backfill_accounts(chunk_size, pause)
+        balances_filled = self.backfill_balances(chunk_size, pause)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: account заполнен у {accounts_filled} строк, '
+            f'balance_after_kopecks - у {balances_filled} строк '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    def backfill_accounts(self, chunk_size, pause):
+        """Заполнение account диапазонами id: одно UPDATE на тип операции и чанк"""
+        bounds = Transaction.objects.filter(account__isnull=True).aggregate(lo=Min('id'), hi=Max('id'))
+        if bounds['lo'] is None:
+            return 0
+
+        updated = 0
+        for lo in range(bounds['lo'], bounds['hi'] + 1, chunk_size):
+            chunk = Transaction.objects.filter(
+                account__isnull=True,
+                id__gte=lo,
+                id__lt=lo + chunk_size
+            )
+            with transaction.atomic():
+                updated += chunk.filter(
+                    transaction_type=Transaction.TransactionType.TRANSFER_OUT
+                ).update(account=F('from_user'))
+                updated += chunk.exclude(
+                    transaction_type=Transaction.TransactionType.TRANSFER_OUT
+                ).update(account=F('to_user'))
+            if pause:
+                time.sleep(pause)
+
+        self.stdout.write(f'  account: обновлено {updated} строк')
+        return updated
+
+    def backfill_balances(self, chunk_size, pause):
+        """
+        Пересчет баланса после каждой операции проигрыванием истории счета.
+        Счета обрабатываются по одному, обновления пишутся пачками по chunk_size.
+        """
+        account_ids = (
+            Transaction.objects
+            .filter(balance_after_kopecks__isnull=True, account__isnull=False)
+            .values_list('account_id', flat=True)
+            .distinct()
+            .order_by('account_id')
+        )
+
+        updated = 0
+        for account_id in account_ids.iterator(chunk_size=chunk_size):
+            updated += self.backfill_account(account_id, chunk_size)
+            if pause:
+                time.sleep(pause)
+
+        self.stdout.write(f'  balance_after_kopecks: обновлено {updated} строк')
+        return updated
+
+    def backfill_account(self, account_id, chunk_size):
+        """
+        Проигрывание истории одного счета с начала (или с границы архива);
+        уже заполненные строки служат опорными
+        """
+        rows = (
+            Transaction.objects
+            .filter(account_id=account_id)
+            .order_by('created_at', 'id')
+            .only('id', 'transaction_type', 'amount_kopecks', 'balance_after_kopecks')
+        )
+
+        snapshot = LedgerSnapshot.objects.filter(account_id=account_id).first()
+        running = snapshot.net_kopecks if snapshot else 0
+        pending = []
+        updated = 0
+        for row in rows.iterator(chunk_size=chunk_size):
+            if row.balance_after_kopecks is not None:
+                running = row.balance_after_kopecks
+                continue
+            running += row.get_signed_amount_kopecks()
+            row.balance_after_kopecks = running
+            pending.append(row)
+            if len(pending) >= chunk_size:
+                updated += self.flush(pending)
+                pending = []
+
+        if pending:
+            updated += self.flush(pending)
+        return updated
+
+    def flush(self, rows):
+        with transaction.atomic():
+            Transaction.objects.bulk_update(rows, ['balance_after_kopecks'])
+        return len(rows)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from wallet.partitions import add_months, ensure_partitions, is_partitioned, month_start
+
+
+class Command(BaseCommand):
+    help = 'Создание месячных секций wallet_transaction на будущие месяцы (запускать по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='На сколько месяцев вперед должны существовать секции (по умолчанию: 3)'
+        )
+
+    def handle(self, *args, **options):
+        months_ahead = options['months_ahead']
+        if months_ahead < 0:
+            raise CommandError('--months-ahead не может быть отрицательным')
+        if not is_partitioned(connection):
+            self.stdout.write(self.style.WARNING('Таблица wallet_transaction не секционирована, секции не нужны'))
+            return
+
+        now = timezone.now()
+        checked = ensure_partitions(connection, now, months_ahead)
+        last = add_months(month_start(now), months_ahead)
+        self.stdout.write(self.style.SUCCESS(f'Проверено секций: {checked}, последняя - {last:%Y-%m}'))
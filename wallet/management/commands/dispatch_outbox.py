@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from wallet.outbox import Dispatcher, get_sink, requeue_parked
+
+
+class Command(BaseCommand):
+    help = 'Доставка событий outbox получателю из настройки OUTBOX_SINK'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество событий в одной пачке (по умолчанию: 500)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Пауза при пустой очереди в секундах (по умолчанию: 1)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Доставить накопленные события и завершиться'
+        )
+        parser.add_argument(
+            '--requeue-parked',
+            action='store_true',
+            help='Вернуть в очередь события, исчерпавшие попытки доставки, и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_parked']:
+            self.stdout.write(self.style.SUCCESS(f"Возвращено в очередь событий: {requeue_parked()}"))
+            return
+
+        dispatcher = Dispatcher(get_sink(), batch_size=options['batch_size'])
+        try:
+            dispatcher.run(interval=0 if options['once'] else options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        stats = dispatcher.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Доставлено событий: {stats['delivered']}, неудачных пачек: {stats['failed_batches']}, "
+            f"припарковано: {stats['parked']}, "
+            f"{stats['delivered_per_sec']} событий/с"
+        ))
@@ -0,0 +1,71 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from wallet.models import UserBalance
+from wallet.services import configure_shards, rebalance
+
+
+class Command(BaseCommand):
+    help = 'Перенос средств из слотов горячих счетов в основную строку и настройка количества слотов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='ID пользователя (можно указать несколько раз); по умолчанию - все горячие счета'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            help='Задать количество слотов для счетов из --user (0 - отключить шардирование)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.0,
+            help='Повторять перенос каждые N секунд до остановки (по умолчанию: один проход)'
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        shard_count = options['shards']
+
+        if shard_count is not None:
+            if not users:
+                raise CommandError('--shards требует указать счета через --user')
+            if shard_count < 0:
+                raise CommandError('--shards не может быть отрицательным')
+            for user_id in users:
+                user_balance, created = UserBalance.objects.get_or_create(user_id=user_id)
+                with transaction.atomic():
+                    configure_shards(user_balance, shard_count)
+                self.stdout.write(f'  пользователь {user_id}: слотов {shard_count}')
+            return
+
+        while True:
+            moved, accounts = self.rebalance_all(users)
+            self.stdout.write(self.style.SUCCESS(
+                f'Перенесено {moved} коп. из слотов {accounts} счетов'
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def rebalance_all(self, users):
+        queryset = UserBalance.objects.filter(shard_count__gt=0)
+        if users:
+            queryset = queryset.filter(user_id__in=users)
+
+        moved = 0
+        accounts = 0
+        for user_balance in queryset.only('id', 'user_id').iterator():
+            # Каждый счет - отдельная короткая транзакция, чтобы не держать блокировки
+            with transaction.atomic():
+                amount = rebalance(user_balance)
+            if amount:
+                moved += amount
+                accounts += 1
+        return moved, accounts
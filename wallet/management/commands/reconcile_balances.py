@@ -0,0 +1,120 @@
+import csv
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from wallet.reconciliation import init_worker, reconcile_range
+
+
+class Command(BaseCommand):
+    help = 'Сверка UserBalance.balance_kopecks с суммой операций в Transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество процессов (и соединений с базой) для сверки (по умолчанию: 4)'
+        )
+        parser.add_argument(
+            '--range-size',
+            type=int,
+            default=10000,
+            help='Размер диапазона id пользователей на один групповой запрос (по умолчанию: 10000)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Инкрементальный режим: только балансы с updated_at не раньше даты (ISO 8601)'
+        )
+        parser.add_argument(
+            '--report',
+            default='reconciliation_report.csv',
+            help='Файл отчета с расхождениями (по умолчанию: reconciliation_report.csv)'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        range_size = options['range_size']
+        since = self.parse_since(options['since'])
+
+        if workers < 1 or range_size < 1:
+            raise CommandError('--workers и --range-size должны быть положительными')
+
+        bounds = User.objects.aggregate(lo=Min('id'), hi=Max('id'))
+        if bounds['lo'] is None:
+            self.stdout.write(self.style.WARNING('Пользователи не найдены'))
+            return
+
+        ranges = [
+            (lo, min(lo + range_size, bounds['hi'] + 1))
+            for lo in range(bounds['lo'], bounds['hi'] + 1, range_size)
+        ]
+        mode = f'с {since.isoformat()}' if since else 'полная'
+        self.stdout.write(self.style.SUCCESS(
+            f'Сверка балансов ({mode}): {len(ranges)} диапазонов, процессов: {workers}'
+        ))
+
+        started = time.monotonic()
+        checked_total = 0
+        mismatch_total = 0
+
+        with open(options['report'], 'w', newline='', encoding='utf-8') as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(['user_id', 'balance_kopecks', 'ledger_kopecks', 'diff_kopecks'])
+
+            for lo, hi, checked, mismatches in self.run_ranges(ranges, since, workers):
+                checked_total += checked
+                mismatch_total += len(mismatches)
+                for user_id, balance, ledger in mismatches:
+                    writer.writerow([user_id, balance, ledger, balance - ledger])
+                report_file.flush()
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'  [{lo}, {hi}): проверено {checked}, расхождений {len(mismatches)} | '
+                    f'{checked_total / elapsed if elapsed else 0:.0f} польз./с'
+                )
+
+        elapsed = time.monotonic() - started
+        style = self.style.ERROR if mismatch_total else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Проверено пользователей: {checked_total}, расхождений: {mismatch_total}, '
+            f'{checked_total / elapsed if elapsed else 0:.0f} польз./с. Отчет: {options["report"]}'
+        ))
+
+    def run_ranges(self, ranges, since, workers):
+        """Сверка диапазонов в пуле процессов; результаты отдаются по мере готовности"""
+        if workers == 1:
+            for lo, hi in ranges:
+                yield reconcile_range(lo, hi, since=since)
+            return
+
+        # Дочерние процессы не должны наследовать открытые соединения родителя
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = [executor.submit(reconcile_range, lo, hi, since) for lo, hi in ranges]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def parse_since(self, value):
+        if not value:
+            return None
+        try:
+            since = parse_datetime(value)
+            if since is None:
+                date = parse_date(value)
+                since = datetime.combine(date, datetime.min.time()) if date else None
+        except ValueError:
+            # Формат верный, но такой даты нет (например, 2024-02-30)
+            since = None
+        if since is None:
+            raise CommandError(f'Некорректное значение --since: {value}')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
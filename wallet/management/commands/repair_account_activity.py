@@ -0,0 +1,88 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from wallet.models import ACTIVITY_COUNTERS, ACTIVITY_FIELDS, BalanceShard, UserBalance, add_activity
+from wallet.reconciliation import ledger_activity
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков операций UserBalance (количество, суммы по типам, последняя операция) по истории'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='ID пользователя (можно указать несколько раз); по умолчанию - все счета'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество счетов в одной транзакции (по умолчанию: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество счетов с расхождениями, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        started = time.monotonic()
+        checked = 0
+        repaired = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # Счета и их слоты блокируются, чтобы операции не изменили счетчики между чтением истории и записью
+                queryset = UserBalance.objects.select_for_update().filter(id__gt=last_id).order_by('id')
+                if options['users']:
+                    queryset = queryset.filter(user_id__in=options['users'])
+                balances = list(queryset[:batch_size])
+                if not balances:
+                    break
+                last_id = balances[-1].id
+                shards = list(BalanceShard.objects.select_for_update().filter(user_balance__in=balances).order_by('id'))
+                checked += len(balances)
+                repaired += self.repair_batch(balances, shards, options['dry_run'])
+
+        action = 'Расхождений найдено' if options['dry_run'] else 'Исправлено счетов'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено счетов: {checked}. {action}: {repaired} за {time.monotonic() - started:.1f} с'
+        ))
+
+    def repair_batch(self, balances, shards, dry_run):
+        """
+        Запись пересчитанных счетчиков в основные строки, счетчики слотов обнуляются.
+        Поля, которые нельзя восстановить по истории (см. ledger_activity), сохраняют текущие значения
+        """
+        ledger = ledger_activity([balance.user_id for balance in balances])
+        stored = {balance.id: add_activity({}, balance) for balance in balances}
+        for shard in shards:
+            add_activity(stored[shard.user_balance_id], shard)
+        activity = {balance.user_id: {**stored[balance.id], **ledger[balance.user_id]} for balance in balances}
+
+        changed = [balance for balance in balances if stored[balance.id] != activity[balance.user_id]]
+        if dry_run or not changed:
+            return len(changed)
+        changed_ids = {balance.id for balance in changed}
+        shards = [shard for shard in shards if shard.user_balance_id in changed_ids]
+
+        for balance in changed:
+            for name in ACTIVITY_FIELDS:
+                setattr(balance, name, activity[balance.user_id][name])
+        UserBalance.objects.bulk_update(changed, ACTIVITY_FIELDS)
+
+        for shard in shards:
+            for name in ACTIVITY_COUNTERS:
+                setattr(shard, name, 0)
+            shard.last_transaction_id = None
+            shard.last_transaction_at = None
+        BalanceShard.objects.bulk_update(shards, ACTIVITY_FIELDS)
+        return len(changed)
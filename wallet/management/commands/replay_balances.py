@@ -0,0 +1,114 @@
+import csv
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from wallet.loganalysis.replay import Ledger, database_balances
+
+
+def parse_at(value):
+    """
+    Момент --at как наивное местное время: так записаны метки в логе.
+    Значение с часовым поясом переводится в местное время.
+    """
+    try:
+        at = parse_datetime(value)
+    except ValueError:
+        at = None
+    if at is None:
+        raise CommandError(f'Неверный формат --at: {value}')
+    if timezone.is_aware(at):
+        at = timezone.localtime(at).replace(tzinfo=None)
+    return at
+
+
+class Command(BaseCommand):
+    help = 'Восстановление балансов по transactions.log и сверка с UserBalance'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            help='Файл лога транзакций (по умолчанию: logs/transactions.log); читаются все его поколения'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Количество процессов для разбора лога (по умолчанию: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество пользователей на один запрос к UserBalance (по умолчанию: 1000)'
+        )
+        parser.add_argument(
+            '--at',
+            help='Балансы на момент времени "YYYY-MM-DD HH:MM:SS" вместо сверки текущих с базой'
+        )
+        parser.add_argument(
+            '--report',
+            default='replay_report.csv',
+            help='Файл отчета (по умолчанию: replay_report.csv)'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers и --batch-size должны быть положительными')
+        at = parse_at(options['at']) if options['at'] is not None else None
+
+        log_path = options['log'] or os.path.join(settings.BASE_DIR, 'logs', 'transactions.log')
+        if not os.path.exists(log_path):
+            raise CommandError(f'Файл {log_path} не найден')
+
+        started = time.monotonic()
+        ledger = Ledger.from_log(log_path, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проводок: {len(ledger.deltas)}, пользователей: {len(ledger.names)} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+        unknown = int(ledger.unknown_opening.sum())
+        if unknown:
+            self.stdout.write(self.style.WARNING(
+                f'Начальный баланс не записан в логе для {unknown} пользователей, принят равным 0'
+            ))
+
+        if at is not None:
+            self.write_balances_at(ledger, at, options['report'])
+        else:
+            self.compare_with_database(ledger, options['batch_size'], options['report'])
+
+    def write_balances_at(self, ledger, at, report):
+        """Балансы всех пользователей лога на момент at"""
+        balances = ledger.balances_at(at)
+        with open(report, 'w', newline='', encoding='utf-8') as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(['username', 'balance_kopecks'])
+            writer.writerows(zip(ledger.names, balances.tolist()))
+        self.stdout.write(self.style.SUCCESS(f'Балансы на {at:%Y-%m-%d %H:%M:%S} записаны в {report}'))
+
+    def compare_with_database(self, ledger, batch_size, report):
+        """Сверка итоговых балансов по логу с UserBalance"""
+        replayed = ledger.final_balances().tolist()
+        stored = database_balances(ledger.names, batch_size)
+
+        mismatches = 0
+        missing = 0
+        with open(report, 'w', newline='', encoding='utf-8') as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(['username', 'replayed_kopecks', 'balance_kopecks', 'diff_kopecks'])
+            for name, balance in zip(ledger.names, replayed):
+                if name not in stored:
+                    missing += 1
+                    writer.writerow([name, balance, '', ''])
+                elif stored[name] != balance:
+                    mismatches += 1
+                    writer.writerow([name, balance, stored[name], stored[name] - balance])
+
+        style = self.style.ERROR if mismatches or missing else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Расхождений с UserBalance: {mismatches}, нет в базе: {missing}. Отчет: {report}'
+        ))
@@ -1,12 +1,19 @@
+import hashlib
 import logging
 import time
 import json
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
 from django.dispatch import receiver
 from django.http import JsonResponse
 from django.core.exceptions import SuspiciousOperation
 
+from .routers import set_replica_reads
+
 
 logger = logging.getLogger('wallet')
 auth_logger = logging.getLogger('wallet.auth')
@@ -187,4 +194,64 @@ class RateLimitingMiddleware(MiddlewareMixin):
                     f"requests_count={len(self.request_counts[ip])}"
                 )
         
-        return None 
\ No newline at end of file
+        return None
+
+
+def cache_is_shared():
+    """
+    Общий ли кэш Django для всех процессов: у LocMemCache и DummyCache
+    каждый процесс видит только свои записи
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Мидлвеар, разрешающий чтение из реплик для безопасных (GET/HEAD/OPTIONS) запросов.
+
+    После успешного изменяющего запроса клиент на REPLICA_STICKY_SECONDS
+    закрепляется за основной базой (read-your-writes): через cookie и, если
+    кэш общий для процессов (см. CACHES), через маркер в кэше по пользователю
+    и по заголовку Authorization. С кэшем в памяти процесса маркер был бы
+    виден только одному воркеру, поэтому он не используется.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    PIN_COOKIE = 'primary_pin'
+
+    def process_request(self, request):
+        set_replica_reads(request.method in self.SAFE_METHODS and not self.is_pinned(request))
+
+    def process_response(self, request, response):
+        set_replica_reads(False)
+
+        if request.method not in self.SAFE_METHODS and response.status_code < 400:
+            self.pin(request, response)
+        return response
+
+    def is_pinned(self, request):
+        if request.COOKIES.get(self.PIN_COOKIE):
+            return True
+
+        keys = self.pin_keys(request) if cache_is_shared() else []
+        return bool(keys) and bool(cache.get_many(keys))
+
+    def pin(self, request, response):
+        window = settings.REPLICA_STICKY_SECONDS
+        if window <= 0:
+            return
+        response.set_cookie(self.PIN_COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+        keys = self.pin_keys(request) if cache_is_shared() else []
+        if keys:
+            cache.set_many({key: True for key in keys}, timeout=window)
+
+    def pin_keys(self, request):
+        keys = []
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            keys.append(f'replica_pin:user:{user.pk}')
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if authorization:
+            digest = hashlib.sha256(authorization.encode()).hexdigest()
+            keys.append(f'replica_pin:auth:{digest}')
+        return keys
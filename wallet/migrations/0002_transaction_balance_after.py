@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='account',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='Пользователь, чей баланс изменила операция', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after_kopecks',
+            field=models.BigIntegerField(blank=True, help_text='Баланс счета после операции в копейках', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'created_at'], name='wallet_tx_account_created_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_transactions(apps, schema_editor):
+    """
+    Помесячное секционирование wallet_transaction; на SQLite и других СУБД ничего не делает
+    """
+    from wallet.partitions import partition_transaction_table
+
+    partition_transaction_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_transaction_balance_after'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_before', models.DateTimeField(help_text='Граница архива: все операции до нее выгружены')),
+                ('net_kopecks', models.BigIntegerField(default=0, help_text='Сумма заархивированных операций со знаком')),
+                ('transaction_count', models.BigIntegerField(default=0, help_text='Количество заархивированных операций')),
+                ('balance_after_kopecks', models.BigIntegerField(blank=True, help_text='Баланс после последней заархивированной операции', null=True)),
+                ('last_transaction_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshot', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итоги архива счета',
+                'verbose_name_plural': 'Итоги архива счетов',
+            },
+        ),
+        migrations.RunPython(partition_transactions, migrations.RunPython.noop),
+    ]
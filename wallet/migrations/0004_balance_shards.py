@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:38
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_transaction_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbalance',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Количество слотов для зачислений (0 - баланс хранится одной строкой)'),
+        ),
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('balance_kopecks', models.BigIntegerField(default=0, help_text='Баланс слота в копейках', validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_balance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='wallet.userbalance')),
+            ],
+            options={
+                'verbose_name': 'Слот баланса',
+                'verbose_name_plural': 'Слоты балансов',
+                'constraints': [models.UniqueConstraint(fields=('user_balance', 'slot'), name='wallet_balance_shard_slot_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_balance_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbalance',
+            name='version',
+            field=models.BigIntegerField(default=0, help_text='Номер версии строки, увеличивается при каждом изменении баланса'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_userbalance_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('deposit', 'Пополнение'), ('transfer', 'Перевод')], max_length=20)),
+                ('payload', models.JSONField()),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Количество неудачных попыток доставки')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Не доставлять раньше этого момента (повтор после ошибки)')),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Событие для доставки',
+                'verbose_name_plural': 'События для доставки',
+                'indexes': [models.Index(fields=['available_at', 'id'], name='wallet_outbox_available_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_transaction_sync_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=64)),
+                ('level', models.CharField(choices=[('DEBUG', 'DEBUG'), ('INFO', 'INFO'), ('WARNING', 'WARNING'), ('ERROR', 'ERROR'), ('CRITICAL', 'CRITICAL')], max_length=10)),
+                ('username', models.CharField(blank=True, help_text='Имя из сообщения, даже если такого пользователя нет', max_length=150)),
+                ('ip', models.CharField(blank=True, max_length=45)),
+                ('details', models.JSONField(default=dict, help_text='Поля key=value сообщения')),
+                ('created_at', models.DateTimeField(help_text='Время записи в лог')),
+                ('user', models.ForeignKey(blank=True, db_index=False, help_text='Пользователь события (администратор для действий в админке)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Событие аудита',
+                'verbose_name_plural': 'События аудита',
+                'indexes': [models.Index(fields=['event_type', 'created_at'], name='wallet_audit_type_created_idx'), models.Index(fields=['user', 'created_at'], name='wallet_audit_user_created_idx'), models.Index(fields=['created_at'], name='wallet_audit_created_idx')],
+            },
+        ),
+    ]
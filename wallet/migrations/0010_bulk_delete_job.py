@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_transaction_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkDeleteJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='running', max_length=10)),
+                ('estimated_total', models.BigIntegerField(default=0, help_text='Оценка числа строк на момент запуска')),
+                ('deleted', models.BigIntegerField(default=0, help_text='Удалено строк')),
+                ('chunks', models.IntegerField(default=0, help_text='Выполнено чанков')),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('admin', models.ForeignKey(blank=True, help_text='Администратор, запустивший удаление', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bulk_delete_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Фоновое удаление',
+                'verbose_name_plural': 'Фоновые удаления',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Триграммные индексы по имени и почте пользователей и полнотекстовый
+    индекс по описанию транзакций; на SQLite и других СУБД ничего не делает
+    """
+    from wallet.search import create_search_indexes
+
+    create_search_indexes(schema_editor.connection)
+
+
+def drop_search_indexes(apps, schema_editor):
+    from wallet.search import drop_search_indexes
+
+    drop_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0010_bulk_delete_job'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0011_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceshard',
+            name='last_transaction_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='last_transaction_id',
+            field=models.BigIntegerField(blank=True, help_text='id последней операции счета', null=True),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='total_deposited_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма пополнений в копейках'),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='total_received_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма входящих переводов в копейках'),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='total_sent_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма исходящих переводов в копейках'),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='transaction_count',
+            field=models.BigIntegerField(default=0, help_text='Количество операций счета'),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='last_transaction_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='last_transaction_id',
+            field=models.BigIntegerField(blank=True, help_text='id последней операции счета', null=True),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='total_deposited_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма пополнений в копейках'),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='total_received_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма входящих переводов в копейках'),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='total_sent_kopecks',
+            field=models.BigIntegerField(default=0, help_text='Сумма исходящих переводов в копейках'),
+        ),
+        migrations.AddField(
+            model_name='userbalance',
+            name='transaction_count',
+            field=models.BigIntegerField(default=0, help_text='Количество операций счета'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0012_account_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxDispatcher',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Хост и PID процесса диспетчера', max_length=255, unique=True)),
+                ('stats', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Диспетчер outbox',
+                'verbose_name_plural': 'Диспетчеры outbox',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0013_outbox_dispatcher'),
+    ]
+
+    # Существующие итоги получают NULL (суммы по типам неизвестны), новые - 0
+    operations = [
+        migrations.AddField(
+            model_name='ledgersnapshot',
+            name='last_transaction_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ledgersnapshot',
+            name='total_deposited_kopecks',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ledgersnapshot',
+            name='total_deposited_kopecks',
+            field=models.BigIntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='ledgersnapshot',
+            name='total_received_kopecks',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ledgersnapshot',
+            name='total_received_kopecks',
+            field=models.BigIntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AddField(
+            model_name='ledgersnapshot',
+            name='total_sent_kopecks',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ledgersnapshot',
+            name='total_sent_kopecks',
+            field=models.BigIntegerField(blank=True, default=0, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0014_ledger_snapshot_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='parked_at',
+            field=models.DateTimeField(blank=True, help_text='Исчерпаны попытки доставки, событие больше не отправляется', null=True),
+        ),
+    ]
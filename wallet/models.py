@@ -1,14 +1,49 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.db.models import Sum
+from django.utils import timezone
 from decimal import Decimal
 import logging
 
 
 logger = logging.getLogger('wallet')
 
+# Счетчики операций счета, которые складываются между основной строкой и слотами
+ACTIVITY_COUNTERS = ('transaction_count', 'total_deposited_kopecks', 'total_sent_kopecks', 'total_received_kopecks')
+ACTIVITY_FIELDS = (*ACTIVITY_COUNTERS, 'last_transaction_id', 'last_transaction_at')
 
-class UserBalance(models.Model):
+
+class AccountActivity(models.Model):
+    """
+    Счетчики операций счета, обновляемые в той же транзакции, что и сами операции
+    """
+    transaction_count = models.BigIntegerField(default=0, help_text="Количество операций счета")
+    total_deposited_kopecks = models.BigIntegerField(default=0, help_text="Сумма пополнений в копейках")
+    total_sent_kopecks = models.BigIntegerField(default=0, help_text="Сумма исходящих переводов в копейках")
+    total_received_kopecks = models.BigIntegerField(default=0, help_text="Сумма входящих переводов в копейках")
+    last_transaction_id = models.BigIntegerField(null=True, blank=True, help_text="id последней операции счета")
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+def add_activity(activity, row):
+    """
+    Прибавление счетчиков строки (UserBalance или слота) к словарю счетчиков;
+    последней считается операция с наибольшим id
+    """
+    for name in ACTIVITY_COUNTERS:
+        activity[name] = activity.get(name, 0) + getattr(row, name)
+    last_id = activity.get('last_transaction_id')
+    if last_id is None or (row.last_transaction_id is not None and row.last_transaction_id > last_id):
+        activity['last_transaction_id'] = row.last_transaction_id
+        activity['last_transaction_at'] = row.last_transaction_at
+    return activity
+
+
+class UserBalance(AccountActivity):
     """
     Модель для хранения баланса пользователя в копейках
     """
@@ -18,6 +53,14 @@ class UserBalance(models.Model):
         validators=[MinValueValidator(0)],
         help_text="Баланс в копейках"
     )
+    shard_count = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Количество слотов для зачислений (0 - баланс хранится одной строкой)"
+    )
+    version = models.BigIntegerField(
+        default=0,
+        help_text="Номер версии строки, увеличивается при каждом изменении баланса"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -25,11 +68,30 @@ class UserBalance(models.Model):
         verbose_name = "Баланс пользователя"
         verbose_name_plural = "Балансы пользователей"
 
+    def get_total_kopecks(self):
+        """
+        Возвращает полный баланс в копейках: основная строка плюс слоты шардированного счета
+        """
+        if not self.shard_count:
+            return self.balance_kopecks
+        shards_total = self.shards.aggregate(total=Sum('balance_kopecks'))['total'] or 0
+        return self.balance_kopecks + shards_total
+
     def get_balance_rubles(self):
         """
         Возвращает баланс в рублях
         """
-        return Decimal(self.balance_kopecks) / 100
+        return Decimal(self.get_total_kopecks()) / 100
+
+    def get_activity(self):
+        """
+        Счетчики операций счета: основная строка плюс слоты шардированного счета
+        """
+        activity = add_activity({}, self)
+        if self.shard_count:
+            for shard in self.shards.all():
+                add_activity(activity, shard)
+        return activity
 
     def save(self, *args, **kwargs):
         """
@@ -44,6 +106,10 @@ class UserBalance(models.Model):
                 old_balance = old_instance.balance_kopecks
             except UserBalance.DoesNotExist:
                 old_balance = 0
+            # Оптимистичные записи сравнивают версию, поэтому ее меняет любое сохранение
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
         
         super().save(*args, **kwargs)
         
@@ -61,6 +127,32 @@ class UserBalance(models.Model):
         return f"{self.user.username}: {self.get_balance_rubles()} руб."
 
 
+class BalanceShard(AccountActivity):
+    """
+    Слот баланса горячего счета: зачисления распределяются по слотам,
+    чтобы параллельные переводы не ждали блокировки одной строки.
+    Счетчики зачислений в слот хранятся в самом слоте
+    """
+    user_balance = models.ForeignKey(UserBalance, on_delete=models.CASCADE, related_name='shards')
+    slot = models.PositiveSmallIntegerField()
+    balance_kopecks = models.BigIntegerField(
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text="Баланс слота в копейках"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Слот баланса"
+        verbose_name_plural = "Слоты балансов"
+        constraints = [
+            models.UniqueConstraint(fields=['user_balance', 'slot'], name='wallet_balance_shard_slot_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_balance.user.username} #{self.slot}: {self.balance_kopecks} коп."
+
+
 class Transaction(models.Model):
     """
     Модель для учета всех операций с балансом
@@ -90,12 +182,32 @@ class Transaction(models.Model):
         choices=TransactionType.choices
     )
     description = models.TextField(blank=True, help_text="Описание операции")
+    account = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        null=True,
+        blank=True,
+        db_index=False,
+        help_text="Пользователь, чей баланс изменила операция"
+    )
+    balance_after_kopecks = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Баланс счета после операции в копейках"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Транзакция"
         verbose_name_plural = "Транзакции"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='wallet_tx_account_created_idx'),
+            models.Index(fields=['from_user', 'id'], name='wallet_tx_from_id_idx'),
+            models.Index(fields=['to_user', 'id'], name='wallet_tx_to_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='wallet_tx_created_id_idx'),
+        ]
 
     def get_amount_rubles(self):
         """
@@ -103,6 +215,14 @@ class Transaction(models.Model):
         """
         return Decimal(self.amount_kopecks) / 100
 
+    def get_signed_amount_kopecks(self):
+        """
+        Возвращает изменение баланса счета (отрицательное для исходящих переводов)
+        """
+        if self.transaction_type == self.TransactionType.TRANSFER_OUT:
+            return -self.amount_kopecks
+        return self.amount_kopecks
+
     def save(self, *args, **kwargs):
         """
         Переопределение метода save для логирования создания транзакций
@@ -120,3 +240,166 @@ class Transaction(models.Model):
     def __str__(self):
         from_user = self.from_user.username if self.from_user else "Система"
         return f"{from_user} -> {self.to_user.username}: {self.get_amount_rubles()} руб."
+
+
+class LedgerSnapshot(models.Model):
+    """
+    Итоги заархивированной части истории счета: после выгрузки старых
+    транзакций в архив суммы и баланс на границе архива остаются в базе
+    """
+    account = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger_snapshot')
+    archived_before = models.DateTimeField(help_text="Граница архива: все операции до нее выгружены")
+    net_kopecks = models.BigIntegerField(default=0, help_text="Сумма заархивированных операций со знаком")
+    transaction_count = models.BigIntegerField(default=0, help_text="Количество заархивированных операций")
+    balance_after_kopecks = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Баланс после последней заархивированной операции"
+    )
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+    last_transaction_id = models.BigIntegerField(null=True, blank=True)
+    # Суммы по типам операций; null - часть архива выгружена до появления этих полей и итог неизвестен
+    total_deposited_kopecks = models.BigIntegerField(null=True, blank=True, default=0)
+    total_sent_kopecks = models.BigIntegerField(null=True, blank=True, default=0)
+    total_received_kopecks = models.BigIntegerField(null=True, blank=True, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Итоги архива счета"
+        verbose_name_plural = "Итоги архива счетов"
+
+    def __str__(self):
+        return f"{self.account.username}: архив до {self.archived_before:%Y-%m-%d}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Событие изменения баланса для внешних систем. Пишется в той же транзакции,
+    что и операция, и удаляется после доставки (см. wallet.outbox)
+    """
+    class EventType(models.TextChoices):
+        DEPOSIT = 'deposit', 'Пополнение'
+        TRANSFER = 'transfer', 'Перевод'
+
+    event_type = models.CharField(max_length=20, choices=EventType.choices)
+    payload = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0, help_text="Количество неудачных попыток доставки")
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Не доставлять раньше этого момента (повтор после ошибки)"
+    )
+    last_error = models.TextField(blank=True)
+    parked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Исчерпаны попытки доставки, событие больше не отправляется"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Событие для доставки"
+        verbose_name_plural = "События для доставки"
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='wallet_outbox_available_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
+
+
+class OutboxDispatcher(models.Model):
+    """
+    Статистика процесса dispatch_outbox. Диспетчер работает отдельно
+    от API, поэтому публикует статистику в базу, откуда ее читают метрики
+    """
+    name = models.CharField(max_length=255, unique=True, help_text="Хост и PID процесса диспетчера")
+    stats = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Диспетчер outbox"
+        verbose_name_plural = "Диспетчеры outbox"
+
+    def __str__(self):
+        return self.name
+
+
+class AuditEvent(models.Model):
+    """
+    Событие безопасности из логгера wallet.security (см. wallet.audit):
+    вход, превышение лимита запросов, действие администратора и т.п.
+    """
+    class Level(models.TextChoices):
+        DEBUG = 'DEBUG', 'DEBUG'
+        INFO = 'INFO', 'INFO'
+        WARNING = 'WARNING', 'WARNING'
+        ERROR = 'ERROR', 'ERROR'
+        CRITICAL = 'CRITICAL', 'CRITICAL'
+
+    event_type = models.CharField(max_length=64)
+    level = models.CharField(max_length=10, choices=Level.choices)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='audit_events',
+        null=True,
+        blank=True,
+        db_index=False,
+        help_text="Пользователь события (администратор для действий в админке)"
+    )
+    username = models.CharField(
+        max_length=150,
+        blank=True,
+        help_text="Имя из сообщения, даже если такого пользователя нет"
+    )
+    ip = models.CharField(max_length=45, blank=True)
+    details = models.JSONField(default=dict, help_text="Поля key=value сообщения")
+    created_at = models.DateTimeField(help_text="Время записи в лог")
+
+    class Meta:
+        verbose_name = "Событие аудита"
+        verbose_name_plural = "События аудита"
+        indexes = [
+            models.Index(fields=['event_type', 'created_at'], name='wallet_audit_type_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='wallet_audit_user_created_idx'),
+            models.Index(fields=['created_at'], name='wallet_audit_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.username} {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+
+class BulkDeleteJob(models.Model):
+    """
+    Фоновое удаление транзакций из админки (см. wallet.bulk_delete):
+    прогресс обновляется после каждого чанка
+    """
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершено'
+        FAILED = 'failed', 'Ошибка'
+
+    admin = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='bulk_delete_jobs',
+        null=True,
+        blank=True,
+        help_text="Администратор, запустивший удаление"
+    )
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    estimated_total = models.BigIntegerField(default=0, help_text="Оценка числа строк на момент запуска")
+    deleted = models.BigIntegerField(default=0, help_text="Удалено строк")
+    chunks = models.IntegerField(default=0, help_text="Выполнено чанков")
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Фоновое удаление"
+        verbose_name_plural = "Фоновые удаления"
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Удаление #{self.pk}: {self.deleted} из ~{self.estimated_total} ({self.get_status_display()})"
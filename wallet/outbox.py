@@ -0,0 +1,355 @@
+"""
+Транзакционный outbox для событий изменения балансов.
+
+Каждое пополнение и перевод записывает OutboxEvent в той же транзакции,
+что и сама операция, поэтому событие появляется тогда и только тогда,
+когда операция зафиксирована. Диспетчер (команда dispatch_outbox)
+забирает события пачками через SELECT ... FOR UPDATE SKIP LOCKED -
+несколько диспетчеров не мешают друг другу, - передает пачку в sink
+и удаляет доставленные строки одним DELETE. Если получатель отклоняет
+пачку, она делится пополам, пока ошибка не сведется к отдельным
+событиям: они откладываются с экспоненциальной задержкой, остальные
+доставляются. Событие, не доставленное за OUTBOX_MAX_ATTEMPTS попыток,
+паркуется (parked_at) и больше не отправляется до ручного разбора.
+Доставка - не реже одного раза: получатель должен отбрасывать повторы
+по id события.
+
+Sink задается настройкой OUTBOX_SINK:
+    {'BACKEND': 'wallet.outbox.HttpSink', 'OPTIONS': {'url': ...}}
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxDispatcher, OutboxEvent
+
+
+logger = logging.getLogger('wallet')
+
+# Статистика диспетчера пишется в базу не чаще раза в STATS_PUBLISH_SECONDS,
+# диспетчеры, не обновлявшие ее дольше STATS_MAX_AGE, в метриках не показываются
+STATS_PUBLISH_SECONDS = 5
+STATS_MAX_AGE = 300
+
+
+def enabled():
+    return getattr(settings, 'OUTBOX_ENABLED', True)
+
+
+def deposit_event(user_id, amount_kopecks, transaction_ids, balance_after_kopecks):
+    return OutboxEvent(
+        event_type=OutboxEvent.EventType.DEPOSIT,
+        payload={
+            'user_id': user_id,
+            'amount_kopecks': amount_kopecks,
+            'balance_after_kopecks': balance_after_kopecks,
+            'transaction_ids': transaction_ids,
+        }
+    )
+
+
+def transfer_event(sender_id, recipient_id, amount_kopecks, transaction_ids):
+    return OutboxEvent(
+        event_type=OutboxEvent.EventType.TRANSFER,
+        payload={
+            'sender_id': sender_id,
+            'recipient_id': recipient_id,
+            'amount_kopecks': amount_kopecks,
+            'transaction_ids': transaction_ids,
+        }
+    )
+
+
+def publish(*events):
+    """
+    Запись событий в outbox; вызывается внутри транзакции операции
+    """
+    if not enabled() or not events:
+        return
+    if len(events) == 1:
+        events[0].save()
+    else:
+        OutboxEvent.objects.bulk_create(events)
+
+
+def as_message(event):
+    return {
+        'id': event.pk,
+        'type': event.event_type,
+        'created_at': event.created_at.isoformat(),
+        **event.payload,
+    }
+
+
+class Backpressure(Exception):
+    """Получатель перегружен, доставку нужно отложить"""
+
+
+class FileSink:
+    """
+    Дозапись событий в NDJSON-файл с fsync после каждой пачки
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, messages):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as output:
+            output.write(''.join(json.dumps(message, ensure_ascii=False) + '\n' for message in messages))
+            output.flush()
+            os.fsync(output.fileno())
+
+
+class HttpSink:
+    """
+    Отправка пачки событий JSON-массивом на webhook.
+    Ответы 429 и 503 считаются перегрузкой получателя.
+    """
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def send(self, messages):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(messages, ensure_ascii=False).encode(),
+            headers=self.headers,
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 503):
+                raise Backpressure(f'HTTP {e.code}') from e
+            raise
+
+
+class QueueSink:
+    """
+    Локальная очередь процесса вместо внешнего брокера (для разработки и тестов).
+    Заполненная очередь означает перегрузку получателя.
+    """
+
+    def __init__(self, maxsize=10000, timeout=1.0):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.timeout = timeout
+
+    def send(self, messages):
+        for message in messages:
+            try:
+                self.queue.put(message, timeout=self.timeout)
+            except queue.Full as e:
+                raise Backpressure('очередь заполнена') from e
+
+
+def get_sink():
+    config = getattr(settings, 'OUTBOX_SINK', {
+        'BACKEND': 'wallet.outbox.FileSink',
+        'OPTIONS': {'path': os.path.join(settings.BASE_DIR, 'logs', 'outbox.ndjson')},
+    })
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+class Dispatcher:
+    """
+    Доставка событий outbox пачками
+    """
+
+    def __init__(self, sink, batch_size=500, base_delay=1.0, max_delay=300.0, max_attempts=None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 20)
+        self.delivered = 0
+        self.parked = 0
+        self.failed_batches = 0
+        # Ошибки подряд для паузы в run, failed_batches - счетчик за все время
+        self.consecutive_failures = 0
+        self.last_lag = None
+        self.started = time.monotonic()
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.published_at = None
+
+    def dispatch_batch(self):
+        """
+        Доставка одной пачки. Возвращает (доставлено, была ли ошибка доставки).
+        Строки пачки заблокированы до конца транзакции, другие
+        диспетчеры их пропускают. Ошибкой считается пачка, из которой
+        не доставлено ни одного события.
+        """
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(parked_at__isnull=True, available_at__lte=timezone.now())
+                .order_by('id')[:self.batch_size]
+            )
+            if not events:
+                return 0, False
+
+            delivered, rejected = self.deliver(events)
+            if delivered:
+                OutboxEvent.objects.filter(pk__in=[event.pk for event in delivered]).delete()
+            for failed, error, isolated in rejected:
+                # Одиночная ошибка - ошибка самого события, если получатель принял
+                # остальную пачку; иначе он, скорее всего, недоступен целиком
+                self.postpone(failed, error, park=isolated and (bool(delivered) or len(events) == 1))
+
+        if rejected:
+            self.failed_batches += 1
+        if not delivered:
+            self.consecutive_failures += 1
+            return 0, True
+
+        self.delivered += len(delivered)
+        self.consecutive_failures = 0
+        self.last_lag = (timezone.now() - delivered[0].created_at).total_seconds()
+        return len(delivered), False
+
+    def deliver(self, events):
+        """
+        Отправка событий с делением отклоненной пачки пополам.
+        Возвращает доставленные события и список (события, ошибка, отклонено
+        ли событие отдельно). Перегрузку получателя деление не лечит,
+        поэтому после Backpressure остаток откладывается целиком, как и после
+        max_splits ошибок подряд, если получатель недоступен.
+        """
+        delivered, rejected = [], []
+        chunks = [events]
+        max_splits = 2 * len(events).bit_length()
+        failures = 0
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                self.sink.send([as_message(event) for event in chunk])
+            except Exception as e:
+                failures += 1
+                if isinstance(e, Backpressure) or failures > max_splits:
+                    rest = chunk + [event for pending in reversed(chunks) for event in pending]
+                    rejected.append((rest, e, False))
+                    break
+                if len(chunk) == 1:
+                    rejected.append((chunk, e, True))
+                else:
+                    middle = len(chunk) // 2
+                    chunks += [chunk[middle:], chunk[:middle]]
+                continue
+            delivered += chunk
+        return delivered, rejected
+
+    def postpone(self, events, error, park=False):
+        now = timezone.now()
+        parked = []
+        for event in events:
+            event.attempts += 1
+            event.available_at = now + timedelta(
+                seconds=min(self.base_delay * 2 ** (event.attempts - 1), self.max_delay)
+            )
+            event.last_error = str(error)[:1000]
+            if park and event.attempts >= self.max_attempts:
+                event.parked_at = now
+                parked.append(event)
+        OutboxEvent.objects.bulk_update(events, ['attempts', 'available_at', 'last_error', 'parked_at'])
+
+        if parked:
+            self.parked += len(parked)
+            logger.error(
+                f"События outbox {[event.pk for event in parked]} не доставлены "
+                f"за {self.max_attempts} попыток и припаркованы: {error}"
+            )
+        if len(events) > len(parked):
+            logger.warning(f"Доставка {len(events) - len(parked)} событий outbox отложена: {error}")
+
+    def run(self, interval=1.0, max_batches=None):
+        """
+        Доставка до исчерпания очереди, затем ожидание новых событий.
+        После ошибки или перегрузки получателя диспетчер делает паузу.
+        """
+        batches = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                delivered, failed = self.dispatch_batch()
+                batches += 1
+                self.publish_stats()
+                if failed:
+                    if interval <= 0:
+                        break
+                    time.sleep(min(self.base_delay * 2 ** min(self.consecutive_failures - 1, 10), self.max_delay))
+                elif delivered < self.batch_size:
+                    if interval <= 0:
+                        break
+                    time.sleep(interval)
+        finally:
+            self.publish_stats(force=True)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'delivered': self.delivered,
+            'failed_batches': self.failed_batches,
+            'parked': self.parked,
+            'consecutive_failures': self.consecutive_failures,
+            'delivered_per_sec': round(self.delivered / elapsed, 1) if elapsed else 0.0,
+            'last_lag_seconds': round(self.last_lag, 3) if self.last_lag is not None else None,
+        }
+
+    def publish_stats(self, force=False):
+        # Диспетчер работает в отдельном процессе, метрики API читают его статистику из базы
+        now = time.monotonic()
+        if not force and self.published_at is not None and now - self.published_at < STATS_PUBLISH_SECONDS:
+            return
+        self.published_at = now
+        OutboxDispatcher.objects.update_or_create(name=self.name, defaults={'stats': self.stats()})
+
+
+def backlog_stats():
+    """
+    Очередь outbox по данным базы: размер, возраст самого старого события
+    и число припаркованных событий
+    """
+    waiting = Q(parked_at__isnull=True)
+    row = OutboxEvent.objects.aggregate(
+        pending=Count('id', filter=waiting),
+        oldest=Min('created_at', filter=waiting),
+        parked=Count('id', filter=~waiting),
+    )
+    return {
+        'pending': row['pending'],
+        'parked': row['parked'],
+        'oldest_age_seconds': (
+            round((timezone.now() - row['oldest']).total_seconds(), 3) if row['oldest'] else None
+        ),
+        'dispatchers': {
+            dispatcher.name: dispatcher.stats
+            for dispatcher in OutboxDispatcher.objects.filter(
+                updated_at__gte=timezone.now() - timedelta(seconds=STATS_MAX_AGE)
+            ).order_by('name')
+        },
+    }
+
+
+def requeue_parked():
+    """
+    Возврат припаркованных событий в очередь после исправления причины ошибки
+    """
+    requeued = OutboxEvent.objects.filter(parked_at__isnull=False).update(
+        parked_at=None, attempts=0, available_at=timezone.now()
+    )
+    if requeued:
+        logger.warning(f"В очередь outbox возвращено припаркованных событий: {requeued}")
+    return requeued
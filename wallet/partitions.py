@@ -0,0 +1,154 @@
+"""
+Помесячное секционирование таблицы транзакций в PostgreSQL.
+
+Таблица wallet_transaction секционируется по диапазонам created_at:
+одна секция wallet_transaction_pYYYYMM на календарный месяц (UTC)
+и секция по умолчанию для строк вне созданных диапазонов.
+На других СУБД все функции ничего не делают.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+
+PARENT_TABLE = 'wallet_transaction'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+PARTITION_NAME_RE = re.compile(rf'^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def month_start(value):
+    """Начало месяца (UTC) для момента времени"""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [PARENT_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection):
+    """
+    Помесячные секции в порядке возрастания: [(имя, начало, конец)]
+    """
+    if not is_partitioned(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [PARENT_TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            lower = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions.append((name, lower, add_months(lower, 1)))
+    return partitions
+
+
+def create_partition(cursor, month):
+    lower = month_start(month)
+    upper = add_months(lower, 1)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(lower)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+
+
+def ensure_partitions(connection, start, months_ahead=3):
+    """
+    Создает помесячные секции от start до текущего месяца + months_ahead.
+    Секции нужно создавать заранее: строки будущего месяца, попавшие
+    в секцию по умолчанию, не дадут создать для него отдельную секцию.
+    """
+    if not is_partitioned(connection):
+        return 0
+    month = month_start(start)
+    last = add_months(month_start(datetime.now(dt_timezone.utc)), months_ahead)
+    created = 0
+    with connection.cursor() as cursor:
+        while month <= last:
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+            created += 1
+    return created
+
+
+def partition_transaction_table(connection, months_ahead=3):
+    """
+    Преобразует wallet_transaction в секционированную таблицу с переносом данных.
+
+    Индексы и внешние ключи переносятся по определениям исходной таблицы,
+    первичный ключ становится (id, created_at) - ключ секционирования
+    обязан входить в него. Вместо identity-колонки используется
+    последовательность, продолжающая нумерацию.
+    """
+    if connection.vendor != 'postgresql' or is_partitioned(connection):
+        return
+
+    old_table = f'{PARENT_TABLE}_unpartitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {old_table}")
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT LIKE %s",
+            [old_table, '%pkey']
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [old_table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT MIN(created_at), MAX(id) FROM {old_table}")
+        first_created_at, max_id = cursor.fetchone()
+
+        cursor.execute(
+            f"CREATE TABLE {PARENT_TABLE} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+
+    ensure_partitions(connection, first_created_at or datetime.now(dt_timezone.utc), months_ahead)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {PARENT_TABLE} SELECT * FROM {old_table}")
+        # Имена первичного ключа, последовательности и индексов освобождаются вместе со старой таблицей
+        cursor.execute(f"DROP TABLE {old_table}")
+
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(f"CREATE SEQUENCE {PARENT_TABLE}_id_seq OWNED BY {PARENT_TABLE}.id")
+        cursor.execute(f"SELECT setval('{PARENT_TABLE}_id_seq', %s, false)", [(max_id or 0) + 1])
+        cursor.execute(
+            f"ALTER TABLE {PARENT_TABLE} ALTER COLUMN id SET DEFAULT nextval('{PARENT_TABLE}_id_seq')"
+        )
+
+        for definition in index_definitions:
+            cursor.execute(definition.replace(f' ON public.{old_table} ', f' ON public.{PARENT_TABLE} ')
+                                     .replace(f' ON {old_table} ', f' ON {PARENT_TABLE} '))
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+def drop_partition(cursor, name):
+    """Отсоединение и удаление секции (в транзакции вместе с записью итогов)"""
+    cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+    cursor.execute(f"DROP TABLE {name}")
@@ -0,0 +1,168 @@
+"""
+Сверка балансов пользователей с историей транзакций
+"""
+import django
+from django.apps import apps
+from django.db.models import BigIntegerField, Case, Count, F, Max, Q, Sum, When
+
+from .models import ACTIVITY_COUNTERS, BalanceShard, LedgerSnapshot, UserBalance, Transaction
+from .routers import use_replicas
+
+
+SIGNED_AMOUNT = Case(
+    When(transaction_type=Transaction.TransactionType.TRANSFER_OUT, then=-F('amount_kopecks')),
+    default=F('amount_kopecks'),
+    output_field=BigIntegerField(),
+)
+
+
+def ledger_sums(lo, hi, user_ids=None):
+    """
+    Суммы операций по счетам с id в диапазоне [lo, hi) - один групповой запрос
+    по живым транзакциям плюс итоги заархивированной истории
+    """
+    queryset = Transaction.objects.filter(account_id__gte=lo, account_id__lt=hi)
+    snapshots = LedgerSnapshot.objects.filter(account_id__gte=lo, account_id__lt=hi)
+    if user_ids is not None:
+        queryset = queryset.filter(account_id__in=user_ids)
+        snapshots = snapshots.filter(account_id__in=user_ids)
+
+    rows = queryset.values('account_id').annotate(total=Sum(SIGNED_AMOUNT)).order_by()
+    sums = {row['account_id']: row['total'] or 0 for row in rows}
+    for account_id, net_kopecks in snapshots.values_list('account_id', 'net_kopecks'):
+        sums[account_id] = sums.get(account_id, 0) + net_kopecks
+    return sums
+
+
+def ledger_activity(user_ids):
+    """
+    Счетчики операций счетов по истории: {user_id: {поле AccountActivity: значение}}
+    с учетом итогов архива. Поля, которые по истории восстановить нельзя,
+    в словаре счета отсутствуют: суммы по типам, если часть архива выгружена
+    до их появления в LedgerSnapshot, и последняя операция, если она
+    в архиве, а ее id в итогах не записан
+    """
+    types = Transaction.TransactionType
+    rows = (
+        Transaction.objects.filter(account_id__in=user_ids)
+        .values('account_id')
+        .annotate(
+            transaction_count=Count('id'),
+            total_deposited_kopecks=Sum('amount_kopecks', filter=Q(transaction_type=types.DEPOSIT)),
+            total_sent_kopecks=Sum('amount_kopecks', filter=Q(transaction_type=types.TRANSFER_OUT)),
+            total_received_kopecks=Sum('amount_kopecks', filter=Q(transaction_type=types.TRANSFER_IN)),
+            last_transaction_id=Max('id'),
+        )
+        .order_by()
+    )
+    empty = {**dict.fromkeys(ACTIVITY_COUNTERS, 0), 'last_transaction_id': None, 'last_transaction_at': None}
+    activity = {user_id: dict(empty) for user_id in user_ids}
+    for row in rows:
+        account = activity[row.pop('account_id')]
+        account.update({name: value or 0 for name, value in row.items() if name in ACTIVITY_COUNTERS})
+        account['last_transaction_id'] = row['last_transaction_id']
+
+    last_ids = [account['last_transaction_id'] for account in activity.values() if account['last_transaction_id']]
+    created = dict(Transaction.objects.filter(id__in=last_ids).values_list('id', 'created_at'))
+    for account in activity.values():
+        account['last_transaction_at'] = created.get(account['last_transaction_id'])
+
+    totals = [name for name in ACTIVITY_COUNTERS if name != 'transaction_count']
+    for snapshot in LedgerSnapshot.objects.filter(account_id__in=user_ids):
+        account = activity[snapshot.account_id]
+        account['transaction_count'] += snapshot.transaction_count
+        for name in totals:
+            if getattr(snapshot, name) is None:
+                del account[name]
+            else:
+                account[name] += getattr(snapshot, name)
+        if account['last_transaction_id'] is None and snapshot.last_transaction_at is not None:
+            # Все операции счета в архиве
+            if snapshot.last_transaction_id is None:
+                del account['last_transaction_id'], account['last_transaction_at']
+            else:
+                account['last_transaction_id'] = snapshot.last_transaction_id
+                account['last_transaction_at'] = snapshot.last_transaction_at
+    return activity
+
+
+def stored_balances(lo, hi, since=None, user_ids=None):
+    """
+    Сохраненные балансы пользователей с id в диапазоне [lo, hi) вместе со слотами горячих счетов
+    """
+    queryset = UserBalance.objects.filter(user_id__gte=lo, user_id__lt=hi)
+    if since is not None:
+        # Зачисления на горячие счета меняют только слоты
+        queryset = queryset.filter(Q(updated_at__gte=since) | Q(shards__updated_at__gte=since)).distinct()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    balances = dict(queryset.values_list('user_id', 'balance_kopecks'))
+
+    shards = (
+        BalanceShard.objects
+        .filter(user_balance__user_id__gte=lo, user_balance__user_id__lt=hi)
+        .values('user_balance__user_id')
+        .annotate(total=Sum('balance_kopecks'))
+        .order_by()
+    )
+    if user_ids is not None:
+        shards = shards.filter(user_balance__user_id__in=user_ids)
+    for row in shards:
+        user_id = row['user_balance__user_id']
+        if user_id in balances:
+            balances[user_id] += row['total'] or 0
+    return balances
+
+
+def find_mismatches(lo, hi, since=None, user_ids=None):
+    """
+    Возвращает (количество проверенных пользователей, {user_id: (баланс, сумма по истории)})
+    """
+    balances = stored_balances(lo, hi, since=since, user_ids=user_ids)
+    if since is not None:
+        # В инкрементальном режиме сверяются только недавно измененные балансы
+        user_ids = list(balances)
+        sums = ledger_sums(lo, hi, user_ids=user_ids) if user_ids else {}
+    else:
+        sums = ledger_sums(lo, hi, user_ids=user_ids)
+
+    checked = set(balances) | set(sums)
+    mismatches = {}
+    for user_id in checked:
+        balance = balances.get(user_id, 0)
+        ledger = sums.get(user_id, 0)
+        if balance != ledger:
+            mismatches[user_id] = (balance, ledger)
+    return len(checked), mismatches
+
+
+def reconcile_range(lo, hi, since=None):
+    """
+    Сверка диапазона пользователей [lo, hi).
+
+    Баланс и сумма истории читаются разными запросами, поэтому параллельная
+    операция может дать ложное расхождение. Найденные расхождения
+    перепроверяются, в отчет попадают только воспроизводящиеся.
+    Чтение идет из реплик, если они настроены.
+    """
+    with use_replicas():
+        checked, mismatches = find_mismatches(lo, hi, since=since)
+        if mismatches:
+            _, confirmed = find_mismatches(lo, hi, user_ids=list(mismatches))
+            mismatches = {
+                user_id: values for user_id, values in mismatches.items()
+                if confirmed.get(user_id) == values
+            }
+    return lo, hi, checked, sorted(
+        (user_id, balance, ledger) for user_id, (balance, ledger) in mismatches.items()
+    )
+
+
+def init_worker():
+    """
+    Инициализация процесса пула: настройка Django при запуске через spawn.
+    Каждый процесс открывает не более одного соединения с базой.
+    """
+    if not apps.ready:
+        django.setup()
+
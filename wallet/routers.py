@@ -0,0 +1,93 @@
+"""
+Маршрутизация запросов к базе: запись - в основную базу, чтение - в реплики
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger('wallet')
+
+_replica_reads = contextvars.ContextVar('wallet_replica_reads', default=False)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """
+    Разрешает чтение из реплик внутри блока (read-only запросы и отчеты)
+    """
+    token = set_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+def set_replica_reads(enabled):
+    return _replica_reads.set(enabled)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Направляет чтение в одну из реплик, если это разрешено текущим контекстом
+    (см. use_replicas и ReplicaRoutingMiddleware), запись - всегда в default.
+    Недоступная реплика исключается на REPLICA_RETRY_SECONDS, при отсутствии
+    доступных реплик чтение идет в основную базу.
+    """
+
+    def __init__(self, replicas=None, connection_handler=None):
+        self.replicas = list(replicas if replicas is not None else getattr(settings, 'DATABASE_REPLICAS', []))
+        self.connections = connection_handler or connections
+        self.retry_after = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+        self._down_until = {}
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not _replica_reads.get():
+            return None
+
+        available = [alias for alias in self.replicas if self.is_available(alias)]
+        if not available:
+            return DEFAULT_DB_ALIAS
+        return random.choice(available)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in self.replicas
+
+    def is_available(self, alias):
+        """
+        Проверка доступности реплики: соединение открывается заранее,
+        чтобы ошибка не возникла посреди обработки запроса
+        """
+        down_until = self._down_until.get(alias)
+        if down_until is not None and time.monotonic() < down_until:
+            return False
+
+        connection = self.connections[alias]
+        if connection.connection is None:
+            try:
+                connection.ensure_connection()
+            except DatabaseError as e:
+                logger.warning(f"Реплика {alias} недоступна, чтение переключено на основную базу: {str(e)}")
+                self._down_until[alias] = time.monotonic() + self.retry_after
+                return False
+
+        self._down_until.pop(alias, None)
+        return True
@@ -0,0 +1,79 @@
+"""
+Поиск по описаниям транзакций и пользователям с опорой на индексы PostgreSQL.
+
+Миграция 0011_search_indexes создает на PostgreSQL:
+- GIN-индекс по to_tsvector('russian', description) транзакций -
+  полнотекстовый поиск по словам описания (с учетом словоформ);
+- триграммные GIN-индексы (pg_trgm) по UPPER(username) и UPPER(email)
+  пользователей: в эти выражения Django переводит icontains, поэтому
+  LIKE '%x%' по имени и почте читается по индексу, а не сканированием.
+
+На других СУБД индексы не создаются, а описание ищется через icontains.
+"""
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+
+TEXT_SEARCH_CONFIG = 'russian'
+
+DESCRIPTION_INDEX = 'wallet_tx_description_fts_idx'
+USERNAME_INDEX = 'wallet_user_username_trgm_idx'
+EMAIL_INDEX = 'wallet_user_email_trgm_idx'
+
+
+def description_vector(column):
+    # Выражение запроса должно совпадать с выражением индекса
+    return f"to_tsvector('{TEXT_SEARCH_CONFIG}', {column})"
+
+
+def create_search_indexes(connection):
+    """Индексы поиска на PostgreSQL; на других СУБД ничего не делает"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {USERNAME_INDEX} ON auth_user USING gin (UPPER(username::text) gin_trgm_ops)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {EMAIL_INDEX} ON auth_user USING gin (UPPER(email::text) gin_trgm_ops)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {DESCRIPTION_INDEX} ON wallet_transaction "
+            f"USING gin ({description_vector('description')})"
+        )
+
+
+def drop_search_indexes(connection):
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for name in (USERNAME_INDEX, EMAIL_INDEX, DESCRIPTION_INDEX):
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def description_matches(term, using='default'):
+    """Условие поиска term в описании транзакции для filter()"""
+    if connections[using].vendor == 'postgresql':
+        return Q(RawSQL(
+            f"{description_vector('wallet_transaction.description')} @@ plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s)",
+            [term],
+            output_field=BooleanField()
+        ))
+    return Q(description__icontains=term)
+
+
+def search_transactions(queryset, term):
+    """Транзакции выборки, в описании которых встречается term"""
+    return queryset.filter(description_matches(term, queryset.db))
+
+
+def search_users(queryset, term, prefix=''):
+    """
+    Записи выборки, у которых имя или почта пользователя содержат term;
+    prefix - путь до пользователя ('user__' для UserBalance)
+    """
+    return queryset.filter(
+        Q(**{f'{prefix}username__icontains': term}) | Q(**{f'{prefix}email__icontains': term})
+    )
@@ -24,6 +24,28 @@ class BalanceSerializer(serializers.ModelSerializer):
         return float(obj.get_balance_rubles())
 
 
+class AccountSummarySerializer(serializers.Serializer):
+    """
+    Сериализатор для сводки по счету: баланс и счетчики операций из UserBalance
+    """
+
+    def to_representation(self, obj):
+        activity = obj.get_activity()
+        last_transaction_at = activity['last_transaction_at']
+        return {
+            'username': obj.user.username,
+            'balance_rubles': float(obj.get_balance_rubles()),
+            'transaction_count': activity['transaction_count'],
+            'total_deposited_rubles': float(Decimal(activity['total_deposited_kopecks']) / 100),
+            'total_sent_rubles': float(Decimal(activity['total_sent_kopecks']) / 100),
+            'total_received_rubles': float(Decimal(activity['total_received_kopecks']) / 100),
+            'last_transaction_id': activity['last_transaction_id'],
+            'last_transaction_at': (
+                serializers.DateTimeField().to_representation(last_transaction_at) if last_transaction_at else None
+            ),
+        }
+
+
 class DepositSerializer(serializers.Serializer):
     """
     Сериализатор для пополнения баланса
@@ -111,14 +133,15 @@ class TransferSerializer(serializers.Serializer):
         if request and request.user.is_authenticated:
             try:
                 user_balance = UserBalance.objects.get(user=request.user)
-                if user_balance.balance_kopecks < data['amount_kopecks']:
+                available = user_balance.get_total_kopecks()
+                if available < data['amount_kopecks']:
                     logger.warning(
                         f"Попытка перевода при недостатке средств: пользователь {request.user.username}, "
-                        f"нужно {data['amount_kopecks']}, есть {user_balance.balance_kopecks}"
+                        f"нужно {data['amount_kopecks']}, есть {available}"
                     )
                     security_logger.warning(
                         f"INSUFFICIENT_FUNDS_VALIDATION | user={request.user.username} | "
-                        f"required={data['amount_kopecks']} | available={user_balance.balance_kopecks}"
+                        f"required={data['amount_kopecks']} | available={available}"
                     )
                     raise serializers.ValidationError("Недостаточно средств на балансе")
             except UserBalance.DoesNotExist:
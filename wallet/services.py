@@ -0,0 +1,380 @@
+"""
+Изменение балансов пользователей.
+
+Обычный счет хранит баланс одной строкой UserBalance, и каждое изменение
+блокирует ее. У горячего счета (shard_count > 0) зачисления попадают
+в случайный слот BalanceShard атомарным UPDATE без блокировки основной
+строки, поэтому параллельные переводы на такой счет не выстраиваются
+в очередь. Списания блокируют основную строку и при нехватке средств
+в ней забирают остаток из слотов. Полный баланс - сумма основной строки
+и слотов; rebalance_shards периодически переносит средства слотов
+в основную строку.
+
+В оптимистичном режиме (BALANCE_WRITE_MODE = 'optimistic') обычные счета
+не блокируются: баланс читается вместе с версией и меняется
+UPDATE ... WHERE id = ... AND version = ...; при конфликте операция
+повторяется до BALANCE_OPTIMISTIC_RETRIES раз.
+
+Функции изменения баланса вызываются внутри transaction.atomic(),
+deposit и transfer открывают транзакцию сами. В той же транзакции
+обновляются счетчики операций счета (AccountActivity): у обычного счета -
+в строке UserBalance, зачисление на горячий счет - в слоте, куда попала сумма.
+"""
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import outbox
+from .models import BalanceShard, UserBalance, Transaction, add_activity
+
+
+logger = logging.getLogger('wallet')
+
+# Счетчик суммы для каждого типа операции
+TOTAL_COUNTERS = {
+    Transaction.TransactionType.DEPOSIT: 'total_deposited_kopecks',
+    Transaction.TransactionType.TRANSFER_OUT: 'total_sent_kopecks',
+    Transaction.TransactionType.TRANSFER_IN: 'total_received_kopecks',
+}
+
+
+class VersionConflict(Exception):
+    """Строка баланса изменена параллельной операцией после чтения"""
+
+
+class InsufficientFunds(Exception):
+    """Недостаточно средств для списания"""
+
+    def __init__(self, available_kopecks=None):
+        super().__init__('Недостаточно средств на балансе')
+        self.available_kopecks = available_kopecks
+
+
+def lock_balance(user):
+    """
+    Баланс пользователя, заблокированный до конца транзакции
+    """
+    user_balance, created = UserBalance.objects.select_for_update().get_or_create(user=user)
+    return user_balance
+
+
+def credit(user, amount_kopecks):
+    """
+    Зачисление на счет пользователя.
+
+    Возвращает (баланс пользователя, баланс после операции). Для горячего
+    счета баланс после операции неизвестен без блокировки всех слотов,
+    поэтому возвращается None. Слот, в который попала сумма, сохраняется
+    в user_balance.credited_slot (None - основная строка).
+    """
+    user_balance, created = UserBalance.objects.get_or_create(user=user)
+    if user_balance.shard_count:
+        slot = random.randrange(user_balance.shard_count)
+        updated = BalanceShard.objects.filter(user_balance=user_balance, slot=slot).update(
+            balance_kopecks=F('balance_kopecks') + amount_kopecks,
+            updated_at=timezone.now()
+        )
+        if updated:
+            user_balance.credited_slot = slot
+            return user_balance, None
+        logger.warning(f"Слот {slot} баланса пользователя {user.username} не найден, зачисление в основную строку")
+
+    user_balance = lock_balance(user)
+    user_balance.balance_kopecks += amount_kopecks
+    user_balance.save()
+    user_balance.credited_slot = None
+    return user_balance, None if user_balance.shard_count else user_balance.balance_kopecks
+
+
+def record_activity(entry, user_balance_id=None, slot=None):
+    """
+    Учет операции в счетчиках ее счета в текущей транзакции.
+    Зачисление на горячий счет учитывается в слоте, куда попала сумма: эта строка
+    уже заблокирована зачислением, основная строка и другие слоты не затрагиваются
+    """
+    total = TOTAL_COUNTERS[entry.transaction_type]
+    changes = {
+        'transaction_count': F('transaction_count') + 1,
+        total: F(total) + entry.amount_kopecks,
+        'last_transaction_id': entry.id,
+        'last_transaction_at': entry.created_at,
+    }
+    if slot is not None and BalanceShard.objects.filter(user_balance_id=user_balance_id, slot=slot).update(**changes):
+        return
+    UserBalance.objects.filter(user_id=entry.account_id).update(**changes)
+
+
+def fold_activity(user_balance, shards):
+    """Перенос счетчиков удаляемых слотов в основную строку (строки заблокированы вызывающим)"""
+    activity = add_activity({}, user_balance)
+    for shard in shards:
+        add_activity(activity, shard)
+    for name, value in activity.items():
+        setattr(user_balance, name, value)
+
+
+def debit(user_balance, amount_kopecks):
+    """
+    Списание с заблокированного баланса (см. lock_balance).
+
+    Возвращает баланс после операции или None для горячего счета.
+    Бросает InsufficientFunds, если средств не хватает.
+    """
+    if user_balance.balance_kopecks >= amount_kopecks:
+        user_balance.balance_kopecks -= amount_kopecks
+        user_balance.save()
+        return None if user_balance.shard_count else user_balance.balance_kopecks
+
+    if not user_balance.shard_count:
+        raise InsufficientFunds(user_balance.balance_kopecks)
+
+    shards = list(
+        BalanceShard.objects.select_for_update()
+        .filter(user_balance=user_balance, balance_kopecks__gt=0)
+        .order_by('slot')
+    )
+    available = user_balance.balance_kopecks + sum(shard.balance_kopecks for shard in shards)
+    if available < amount_kopecks:
+        raise InsufficientFunds(available)
+
+    remaining = amount_kopecks - user_balance.balance_kopecks
+    user_balance.balance_kopecks = 0
+    changed = []
+    for shard in shards:
+        if not remaining:
+            break
+        taken = min(shard.balance_kopecks, remaining)
+        shard.balance_kopecks -= taken
+        shard.updated_at = timezone.now()
+        remaining -= taken
+        changed.append(shard)
+
+    BalanceShard.objects.bulk_update(changed, ['balance_kopecks', 'updated_at'])
+    user_balance.save()
+    return None
+
+
+def deposit(user, amount_kopecks):
+    """
+    Пополнение баланса с записью операции.
+    Возвращает {'old_balance_kopecks', 'new_balance_kopecks', 'transaction_ids'}.
+    """
+    if write_mode() == 'optimistic':
+        return with_retries(_deposit_optimistic, user, amount_kopecks)
+    with transaction.atomic():
+        return _deposit_locked(user, amount_kopecks)
+
+
+def transfer(sender, recipient, amount_kopecks):
+    """
+    Перевод между пользователями с записью исходящей и входящей операций.
+    Возвращает {'sender_old_balance_kopecks', 'sender_new_balance_kopecks',
+    'recipient_old_balance_kopecks', 'recipient_new_balance_kopecks', 'transaction_ids'}.
+    Бросает InsufficientFunds, если средств не хватает.
+    """
+    if write_mode() == 'optimistic':
+        return with_retries(_transfer_optimistic, sender, recipient, amount_kopecks)
+    with transaction.atomic():
+        return _transfer_locked(sender, recipient, amount_kopecks)
+
+
+def write_mode():
+    """
+    Режим изменения балансов: pessimistic - SELECT ... FOR UPDATE,
+    optimistic - UPDATE ... WHERE version = прочитанной версии с повторами
+    """
+    return getattr(settings, 'BALANCE_WRITE_MODE', 'pessimistic')
+
+
+def with_retries(operation, *args):
+    """
+    Выполнение операции в отдельной транзакции с повтором при конфликте версий
+    """
+    retries = getattr(settings, 'BALANCE_OPTIMISTIC_RETRIES', 5)
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                return operation(*args)
+        except VersionConflict:
+            if attempt == retries:
+                logger.warning(f"Конфликт версий баланса не разрешился за {retries} повторов")
+                raise
+            time.sleep(random.uniform(0, 0.001 * 2 ** attempt))
+
+
+def compare_and_set(user_balance, delta_kopecks):
+    """
+    Изменение баланса, только если строка не менялась с момента чтения
+    """
+    new_balance = user_balance.balance_kopecks + delta_kopecks
+    updated = UserBalance.objects.filter(pk=user_balance.pk, version=user_balance.version).update(
+        balance_kopecks=new_balance,
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        raise VersionConflict()
+    user_balance.balance_kopecks = new_balance
+    user_balance.version += 1
+
+
+def _deposit_locked(user, amount_kopecks):
+    user_balance, balance_after = credit(user, amount_kopecks)
+    # У горячего счета баланс после зачисления читается без блокировки слотов
+    new_balance = balance_after if balance_after is not None else user_balance.get_total_kopecks()
+    return _record_deposit(user, amount_kopecks, new_balance, balance_after, user_balance.pk, user_balance.credited_slot)
+
+
+def _deposit_optimistic(user, amount_kopecks):
+    user_balance, created = UserBalance.objects.get_or_create(user=user)
+    if user_balance.shard_count:
+        return _deposit_locked(user, amount_kopecks)
+
+    compare_and_set(user_balance, amount_kopecks)
+    return _record_deposit(user, amount_kopecks, user_balance.balance_kopecks, user_balance.balance_kopecks)
+
+
+def _record_deposit(user, amount_kopecks, new_balance, balance_after, user_balance_id=None, slot=None):
+    record = Transaction.objects.create(
+        to_user=user,
+        amount_kopecks=amount_kopecks,
+        transaction_type=Transaction.TransactionType.DEPOSIT,
+        description=f"Пополнение баланса на {amount_kopecks} копеек",
+        account=user,
+        balance_after_kopecks=balance_after
+    )
+    record_activity(record, user_balance_id, slot)
+    outbox.publish(outbox.deposit_event(user.pk, amount_kopecks, [record.id], new_balance))
+    return {
+        'old_balance_kopecks': new_balance - amount_kopecks,
+        'new_balance_kopecks': new_balance,
+        'transaction_ids': [record.id],
+    }
+
+
+def _transfer_locked(sender, recipient, amount_kopecks):
+    sender_balance = lock_balance(sender)
+    sender_available = sender_balance.get_total_kopecks()
+    if sender_available < amount_kopecks:
+        raise InsufficientFunds(sender_available)
+
+    sender_balance_after = debit(sender_balance, amount_kopecks)
+    recipient_balance, recipient_balance_after = credit(recipient, amount_kopecks)
+    recipient_new_balance = (
+        recipient_balance_after if recipient_balance_after is not None
+        else recipient_balance.get_total_kopecks()
+    )
+    return _record_transfer(
+        sender, recipient, amount_kopecks,
+        sender_available, recipient_new_balance,
+        sender_balance_after, recipient_balance_after,
+        recipient_balance.pk, recipient_balance.credited_slot
+    )
+
+
+def _transfer_optimistic(sender, recipient, amount_kopecks):
+    sender_balance, created = UserBalance.objects.get_or_create(user=sender)
+    recipient_balance, created = UserBalance.objects.get_or_create(user=recipient)
+    if sender_balance.shard_count or recipient_balance.shard_count:
+        return _transfer_locked(sender, recipient, amount_kopecks)
+
+    sender_available = sender_balance.balance_kopecks
+    if sender_available < amount_kopecks:
+        raise InsufficientFunds(sender_available)
+
+    # Строки обновляются в порядке user_id, чтобы встречные переводы не взаимоблокировались
+    for user_balance, delta in sorted(
+        [(sender_balance, -amount_kopecks), (recipient_balance, amount_kopecks)],
+        key=lambda item: item[0].user_id
+    ):
+        compare_and_set(user_balance, delta)
+
+    return _record_transfer(
+        sender, recipient, amount_kopecks,
+        sender_available, recipient_balance.balance_kopecks,
+        sender_balance.balance_kopecks, recipient_balance.balance_kopecks
+    )
+
+
+def _record_transfer(sender, recipient, amount_kopecks, sender_available, recipient_new_balance,
+                     sender_balance_after, recipient_balance_after, recipient_balance_id=None, recipient_slot=None):
+    transfer_out = Transaction.objects.create(
+        from_user=sender,
+        to_user=recipient,
+        amount_kopecks=amount_kopecks,
+        transaction_type=Transaction.TransactionType.TRANSFER_OUT,
+        description=f"Перевод {amount_kopecks} копеек пользователю {recipient.username}",
+        account=sender,
+        balance_after_kopecks=sender_balance_after
+    )
+    transfer_in = Transaction.objects.create(
+        from_user=sender,
+        to_user=recipient,
+        amount_kopecks=amount_kopecks,
+        transaction_type=Transaction.TransactionType.TRANSFER_IN,
+        description=f"Получен перевод {amount_kopecks} копеек от пользователя {sender.username}",
+        account=recipient,
+        balance_after_kopecks=recipient_balance_after
+    )
+    record_activity(transfer_out)
+    record_activity(transfer_in, recipient_balance_id, recipient_slot)
+    outbox.publish(outbox.transfer_event(sender.pk, recipient.pk, amount_kopecks, [transfer_out.id, transfer_in.id]))
+    return {
+        'sender_old_balance_kopecks': sender_available,
+        'sender_new_balance_kopecks': sender_available - amount_kopecks,
+        'recipient_old_balance_kopecks': recipient_new_balance - amount_kopecks,
+        'recipient_new_balance_kopecks': recipient_new_balance,
+        'transaction_ids': [transfer_out.id, transfer_in.id],
+    }
+
+
+def configure_shards(user_balance, shard_count):
+    """
+    Изменение количества слотов счета. Лишние слоты переносятся в основную строку.
+    """
+    user_balance = UserBalance.objects.select_for_update().get(pk=user_balance.pk)
+    shards = list(BalanceShard.objects.select_for_update().filter(user_balance=user_balance).order_by('slot'))
+
+    removed = [shard for shard in shards if shard.slot >= shard_count]
+    existing = {shard.slot for shard in shards}
+    BalanceShard.objects.bulk_create([
+        BalanceShard(user_balance=user_balance, slot=slot)
+        for slot in range(shard_count) if slot not in existing
+    ])
+    if removed:
+        user_balance.balance_kopecks += sum(shard.balance_kopecks for shard in removed)
+        fold_activity(user_balance, removed)
+        BalanceShard.objects.filter(pk__in=[shard.pk for shard in removed]).delete()
+
+    user_balance.shard_count = shard_count
+    user_balance.save()
+    return user_balance
+
+
+def rebalance(user_balance):
+    """
+    Перенос средств из слотов в основную строку, чтобы списания
+    не блокировали слоты. Возвращает перенесенную сумму.
+    """
+    user_balance = UserBalance.objects.select_for_update().get(pk=user_balance.pk)
+    shards = list(
+        BalanceShard.objects.select_for_update()
+        .filter(user_balance=user_balance, balance_kopecks__gt=0)
+        .order_by('slot')
+    )
+    moved = sum(shard.balance_kopecks for shard in shards)
+    if not moved:
+        return 0
+
+    now = timezone.now()
+    for shard in shards:
+        shard.balance_kopecks = 0
+        shard.updated_at = now
+    BalanceShard.objects.bulk_update(shards, ['balance_kopecks', 'updated_at'])
+    user_balance.balance_kopecks += moved
+    user_balance.save()
+    return moved
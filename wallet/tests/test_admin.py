@@ -1,7 +1,11 @@
+from datetime import timedelta
+from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.contrib.admin.sites import AdminSite
+from django.urls import reverse
 from django.utils import timezone
+from wallet.changelist import CURSOR_VAR
 from wallet.models import UserBalance, Transaction
 from wallet.admin import UserBalanceAdmin, TransactionAdmin
 
@@ -186,4 +190,169 @@ class TransactionAdminTest(TestCase):
         self.assertIn(UserBalance, admin.site._registry)
         self.assertIn(Transaction, admin.site._registry)
         self.assertIsInstance(admin.site._registry[UserBalance], UserBalanceAdmin)
-        self.assertIsInstance(admin.site._registry[Transaction], TransactionAdmin) 
\ No newline at end of file
+        self.assertIsInstance(admin.site._registry[Transaction], TransactionAdmin) 
+
+
+class TransactionChangeListTest(TestCase):
+    """
+    Тесты для списка транзакций в админке на больших таблицах
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:wallet_transaction_changelist')
+        self.users = [User.objects.create_user(username=f'user{index}', password='testpass123') for index in range(3)]
+        now = timezone.now()
+        for index in range(5):
+            transaction = Transaction.objects.create(
+                from_user=self.users[index % 3],
+                to_user=self.users[(index + 1) % 3],
+                amount_kopecks=100 * (index + 1),
+                transaction_type=Transaction.TransactionType.TRANSFER_OUT,
+            )
+            # Две последние транзакции с одинаковым временем: порядок внутри них задает id
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=now - timedelta(days=max(4 - index, 1)))
+
+    def test_keyset_pages(self):
+        """
+        Тест: страницы листаются по курсору без пропусков и повторов
+        """
+        ids = []
+        url = self.url
+        with patch.object(TransactionAdmin, 'list_per_page', 2):
+            for _ in range(3):
+                cl = self.client.get(url).context['cl']
+                ids.extend(obj.pk for obj in cl.result_list)
+                if not cl.next_cursor:
+                    break
+                url = self.url + cl.next_page_url
+
+        self.assertIsNone(cl.next_cursor)
+        self.assertEqual(ids, list(Transaction.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_select_related_users(self):
+        """
+        Тест: отправители и получатели загружаются одним запросом со строками
+        """
+        response = self.client.get(self.url)
+        cl = response.context['cl']
+
+        with self.assertNumQueries(0):
+            names = [(obj.from_user.username, obj.to_user.username) for obj in cl.result_list]
+        self.assertEqual(len(names), 5)
+        self.assertEqual(cl.result_count, 5)
+        self.assertIsNone(cl.next_cursor)
+
+    def test_created_range_filter(self):
+        """
+        Тест: фильтр по дате отбирает диапазон и раскрывает выбранный месяц по дням
+        """
+        response = self.client.get(self.url, {'created': '7d'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+        day = timezone.localdate() - timedelta(days=1)
+        response = self.client.get(self.url, {'created': f'{day:%Y-%m-%d}'})
+        cl = response.context['cl']
+        self.assertEqual(len(cl.result_list), 2)
+        self.assertContains(response, f'created={day:%Y-%m}-01')
+
+        response = self.client.get(self.url, {'created': 'yesterday'})
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+    def test_search_by_username_and_id(self):
+        """
+        Тест: поиск по точному имени пользователя и по номеру транзакции
+        """
+        response = self.client.get(self.url, {'q': 'user0'})
+        results = response.context['cl'].result_list
+        self.assertTrue(results)
+        self.assertTrue(all(self.users[0] in (obj.from_user, obj.to_user) for obj in results))
+
+        transaction = Transaction.objects.first()
+        response = self.client.get(self.url, {'q': str(transaction.pk)})
+        self.assertEqual([obj.pk for obj in response.context['cl'].result_list], [transaction.pk])
+
+        response = self.client.get(self.url, {'q': 'user'})
+        self.assertEqual(response.context['cl'].result_list, [])
+
+    def test_invalid_cursor(self):
+        """
+        Тест: поврежденный курсор не приводит к ошибке сервера
+        """
+        response = self.client.get(self.url, {CURSOR_VAR: 'garbage'})
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_search_by_description(self):
+        """
+        Тест: поиск находит слова из описания
+        """
+        transaction = Transaction.objects.first()
+        Transaction.objects.filter(pk=transaction.pk).update(description='Возврат по заказу 42')
+
+        response = self.client.get(self.url, {'q': 'заказу'})
+
+        self.assertEqual([obj.pk for obj in response.context['cl'].result_list], [transaction.pk])
+
+
+class UserBalanceSearchTest(TestCase):
+    """
+    Тесты для поиска балансов по пользователю
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        for username, email in (('alice', 'alice@example.com'), ('bob', 'bob@mail.test')):
+            UserBalance.objects.create(user=User.objects.create_user(username=username, email=email))
+
+    def test_search_username_and_email(self):
+        """
+        Тест: подстрока ищется и в имени, и в почте
+        """
+        url = reverse('admin:wallet_userbalance_changelist')
+
+        response = self.client.get(url, {'q': 'LIC'})
+        self.assertEqual([balance.user.username for balance in response.context['cl'].result_list], ['alice'])
+
+        response = self.client.get(url, {'q': 'mail.test'})
+        self.assertEqual([balance.user.username for balance in response.context['cl'].result_list], ['bob'])
+
+
+class UserBalanceChangeFormTest(TestCase):
+    """
+    Тесты для формы изменения баланса в админке
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        self.balance = UserBalance.objects.create(user=User.objects.create_user(username='merchant'))
+
+    def test_service_fields_not_editable(self):
+        """
+        Тест: число слотов нельзя изменить в обход configure_shards
+        """
+        response = self.client.get(reverse('admin:wallet_userbalance_change', args=[self.balance.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('shard_count', response.context['adminform'].form.fields)
+
+    def test_version_not_editable(self):
+        """
+        Тест: версию баланса нельзя вернуть к старому значению через админку
+        """
+        response = self.client.get(reverse('admin:wallet_userbalance_change', args=[self.balance.pk]))
+
+        self.assertNotIn('version', response.context['adminform'].form.fields)
+
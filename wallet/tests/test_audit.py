@@ -0,0 +1,186 @@
+import logging
+import time
+from unittest.mock import patch
+from django.test import RequestFactory, TestCase, override_settings
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.urls import reverse
+from wallet.admin import UserAdmin
+from wallet.audit import AuditHandler
+from wallet.models import AuditEvent, UserBalance
+
+
+def make_record(message, level=logging.WARNING):
+    return logging.LogRecord('wallet.security', level, __file__, 1, message, None, None)
+
+
+@patch('wallet.audit.threading.Thread')
+class AuditHandlerTest(TestCase):
+    """
+    Тесты для записи событий безопасности в AuditEvent
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_user(username='root', password='testpass123')
+        self.alice = User.objects.create_user(username='alice.k', password='testpass123')
+        self.handler = AuditHandler()
+
+    def test_emit_does_not_touch_database(self, thread):
+        """
+        Тест: emit только ставит событие в очередь, запись - при сбросе пачки
+        """
+        with self.assertNumQueries(0):
+            self.handler.emit(make_record('LOGIN_FAILED | username=alice.k | ip=10.0.0.1'))
+        self.assertEqual(AuditEvent.objects.count(), 0)
+
+        with self.assertNumQueries(2):
+            self.handler.flush()
+
+        event = AuditEvent.objects.get()
+        self.assertEqual(
+            (event.event_type, event.level, event.user, event.ip), ('LOGIN_FAILED', 'WARNING', self.alice, '10.0.0.1')
+        )
+        thread.return_value.start.assert_called_once()
+
+    def test_batch_resolves_users_and_fields(self, thread):
+        """
+        Тест: пользователь берется из admin раньше user, неизвестные имена сохраняются без ссылки
+        """
+        self.handler.emit(make_record('ADMIN_BALANCE_CHANGE | admin=root | user=alice.k | old_balance=1.0 | new_balance=2.0'))
+        self.handler.emit(make_record('LOGIN_FAILED | username=mallory | ip=10.0.0.2'))
+        self.handler.emit(make_record('RATE_LIMIT_EXCEEDED | ip=10.0.0.3 | user=anonymous | requests_count=101'))
+
+        self.handler.flush()
+
+        events = list(AuditEvent.objects.order_by('id'))
+        self.assertEqual([event.user for event in events], [self.admin, None, None])
+        self.assertEqual(events[0].details['new_balance'], '2.0')
+        self.assertEqual(events[1].username, 'mallory')
+        self.assertEqual(self.handler.stats()['written'], 3)
+
+    @override_settings(AUDIT_LOG={'QUEUE_SIZE': 2})
+    def test_full_queue_drops_events(self, thread):
+        """
+        Тест: при переполненной очереди события отбрасываются, а не ждут
+        """
+        for index in range(5):
+            self.handler.emit(make_record(f'LOGIN_FAILED | username=user{index}'))
+
+        self.assertEqual(self.handler.stats(), {'written': 0, 'dropped': 3, 'queued': 2})
+
+    @override_settings(AUDIT_LOG={'BATCH_SIZE': 3, 'FLUSH_INTERVAL_MS': 1000})
+    def test_collect_limits_batch(self, thread):
+        """
+        Тест: пачка ограничена BATCH_SIZE и не ждет интервал, если уже полна
+        """
+        for index in range(5):
+            self.handler.emit(make_record(f'LOGIN_FAILED | username=user{index}'))
+
+        started = time.monotonic()
+        batch = self.handler.collect(self.handler._queue.get())
+
+        self.assertEqual(len(batch), 3)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @override_settings(AUDIT_LOG={'ENABLED': False})
+    def test_disabled(self, thread):
+        """
+        Тест: выключенный журнал не запускает поток
+        """
+        self.handler.emit(make_record('LOGIN_FAILED | username=alice.k'))
+
+        thread.assert_not_called()
+
+
+class AuditEventAdminTest(TestCase):
+    """
+    Тесты для списка событий аудита в админке
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        handler = AuditHandler()
+        handler.write([
+            (time.time(), 'WARNING', 'LOGIN_FAILED | username=admin | ip=10.0.0.1'),
+            (time.time(), 'WARNING', 'RATE_LIMIT_EXCEEDED | ip=10.0.0.9 | user=anonymous'),
+        ])
+
+    def test_filter_by_event_type(self):
+        """
+        Тест: фильтр по типу события и поиск по точному имени пользователя
+        """
+        url = reverse('admin:wallet_auditevent_changelist')
+
+        response = self.client.get(url, {'event_type': 'RATE_LIMIT_EXCEEDED'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list.values_list('ip', flat=True)), ['10.0.0.9'])
+
+        response = self.client.get(url, {'q': 'admin'})
+        self.assertEqual(list(response.context['cl'].result_list.values_list('event_type', flat=True)), ['LOGIN_FAILED'])
+
+    def test_read_only(self):
+        """
+        Тест: события нельзя добавить через админку
+        """
+        response = self.client.get(reverse('admin:wallet_auditevent_add'))
+
+        self.assertEqual(response.status_code, 403)
+
+
+@patch('wallet.audit.threading.Thread')
+class AdminActionAuditTest(TestCase):
+    """
+    Тесты записи действий администраторов в журнал аудита
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        self.alice = User.objects.create_user(username='alice.k', password='testpass123')
+        # Обработчик с тем же уровнем, что и в LOGGING, вместо общего обработчика процесса
+        self.handler = AuditHandler(level=logging.WARNING)
+        security_logger = logging.getLogger('wallet.security')
+        handlers = patch.object(security_logger, 'handlers', [self.handler])
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def test_balance_change_form(self, thread):
+        """
+        Тест: сохранение баланса в админке записывается в AuditEvent
+        """
+        balance = UserBalance.objects.create(user=self.alice, balance_kopecks=100)
+
+        response = self.client.post(
+            reverse('admin:wallet_userbalance_change', args=[balance.pk]),
+            {'user': self.alice.pk, 'balance_kopecks': 100, '_save': 'Сохранить'}
+        )
+        self.handler.flush()
+
+        self.assertEqual(response.status_code, 302)
+        event = AuditEvent.objects.get(event_type='ADMIN_BALANCE_ACTION')
+        self.assertEqual((event.user, event.details['user']), (self.admin, 'alice.k'))
+
+    def test_user_change(self, thread):
+        """
+        Тест: изменение пользователя в админке записывается в AuditEvent
+        """
+        request = RequestFactory().post('/admin/auth/user/')
+        request.user = self.admin
+        user_admin = UserAdmin(User, AdminSite())
+
+        user_admin.save_model(request, self.alice, form=None, change=True)
+        self.handler.flush()
+
+        event = AuditEvent.objects.get(event_type='ADMIN_USER_ACTION')
+        self.assertEqual((event.user, event.details['target']), (self.admin, 'alice.k'))
+
@@ -0,0 +1,174 @@
+import base64
+import time
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from unittest import mock
+from wallet.authentication import TTLCache, basic_auth_cache, token_cache
+
+
+class TTLCacheTest(TestCase):
+    """
+    Тесты LRU-кэша с временем жизни записей
+    """
+
+    def test_lru_eviction(self):
+        """
+        Тест: при переполнении вытесняется давно неиспользованная запись
+        """
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entry_is_dropped(self):
+        """
+        Тест: запись с истекшим временем жизни не возвращается
+        """
+        cache = TTLCache(max_size=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """
+    Тесты кэширующей аутентификации по токену
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        token_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('get_balance')
+
+    def test_repeated_requests_skip_token_lookup(self):
+        """
+        Тест: повторный запрос не читает токен и пользователя из базы
+        """
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'user1')
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries.captured_queries))
+
+    def test_deleted_token_is_rejected(self):
+        """
+        Тест: удаленный токен (выход) перестает действовать сразу
+        """
+        self.client.get(self.url)
+        self.token.delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        """
+        Тест: токен деактивированного пользователя перестает действовать сразу
+        """
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalid_token_is_rejected(self):
+        """
+        Тест: неизвестный токен не кэшируется и отклоняется
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(token_cache.get('invalid'))
+
+
+class CachedBasicAuthenticationTest(TestCase):
+    """
+    Тесты кэширующей Basic-аутентификации
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        basic_auth_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.url = reverse('get_balance')
+
+    def login(self, password):
+        credentials = base64.b64encode(f'user1:{password}'.encode()).decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+    def test_repeated_requests_skip_password_hashing(self):
+        """
+        Тест: повторный запрос с теми же учетными данными не хеширует пароль
+        """
+        self.login('testpass123')
+        self.client.get(self.url)
+
+        with mock.patch('django.contrib.auth.base_user.check_password') as check_password:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        check_password.assert_not_called()
+
+    def test_password_is_not_stored(self):
+        """
+        Тест: в кэше нет открытого пароля
+        """
+        self.login('testpass123')
+        self.client.get(self.url)
+
+        self.assertEqual(len(basic_auth_cache), 1)
+        self.assertFalse(any('testpass123' in key for key in basic_auth_cache._data))
+
+    def test_wrong_password_is_rejected(self):
+        """
+        Тест: неверный пароль отклоняется и после удачного входа
+        """
+        self.login('testpass123')
+        self.client.get(self.url)
+        self.login('wrongpass')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates_cache(self):
+        """
+        Тест: после смены пароля старый пароль перестает действовать сразу
+        """
+        self.login('testpass123')
+        self.client.get(self.url)
+        self.user.set_password('newpass456')
+        self.user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(basic_auth_cache), 0)
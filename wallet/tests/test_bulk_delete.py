@@ -0,0 +1,89 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from wallet.bulk_delete import delete_in_chunks, run_job
+from wallet.models import BulkDeleteJob, Transaction
+
+
+@override_settings(BULK_DELETE={'CHUNK_SIZE': 2, 'PAUSE_MS': 0, 'BACKGROUND_THRESHOLD': 4})
+class BulkDeleteTest(TestCase):
+    """
+    Тесты для удаления транзакций чанками
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:wallet_transaction_changelist')
+        for index in range(5):
+            Transaction.objects.create(
+                to_user=self.user,
+                amount_kopecks=100 * (index + 1),
+                transaction_type=Transaction.TransactionType.DEPOSIT,
+            )
+
+    def test_chunks_logged(self):
+        """
+        Тест: каждый чанк записывается в журнал безопасности, общего подсчета нет
+        """
+        queryset = Transaction.objects.filter(amount_kopecks__gte=200)
+
+        with self.assertLogs('wallet.security', level='ERROR') as logs:
+            deleted = delete_in_chunks(queryset, 'admin')
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual([line.split(' | ')[2:4] for line in (record.getMessage() for record in logs.records)], [
+            ['chunk=1', 'count=2'], ['chunk=2', 'count=2'],
+        ])
+
+    def test_job_progress(self):
+        """
+        Тест: фоновая задача сохраняет прогресс и итог
+        """
+        job = BulkDeleteJob.objects.create(admin=self.admin, estimated_total=5)
+
+        run_job(job, Transaction.objects.all(), 'admin')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted, job.chunks), (BulkDeleteJob.Status.DONE, 5, 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_admin_action_small_selection(self):
+        """
+        Тест: небольшая выборка удаляется сразу после подтверждения
+        """
+        ids = list(Transaction.objects.values_list('id', flat=True)[:2])
+        data = {'action': 'delete_transactions', '_selected_action': ids}
+
+        response = self.client.post(self.url, data)
+        self.assertContains(response, 'Будет удалено 2 транзакций')
+        self.assertNotContains(response, 'name="action" value="delete_selected"')
+
+        response = self.client.post(self.url, {**data, 'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Transaction.objects.filter(id__in=ids).count(), 0)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    @patch('wallet.bulk_delete.threading.Thread')
+    def test_admin_action_background(self, thread):
+        """
+        Тест: выборка больше порога удаляется в фоновой задаче
+        """
+        response = self.client.post(self.url, {
+            'action': 'delete_transactions', 'select_across': '1', '_selected_action': [0], 'post': 'yes',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        job = BulkDeleteJob.objects.get()
+        self.assertEqual((job.status, job.estimated_total), (BulkDeleteJob.Status.RUNNING, 5))
+        # Поток журнала аудита тоже создается через threading.Thread
+        names = [call.kwargs.get('name') for call in thread.call_args_list]
+        self.assertIn(f'wallet-bulk-delete-{job.pk}', names)
+        self.assertEqual(Transaction.objects.count(), 5)
@@ -0,0 +1,161 @@
+import threading
+import time
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+from wallet.coalescing import SingleFlight, reads
+from wallet.models import UserBalance
+
+
+class SingleFlightTest(SimpleTestCase):
+    """
+    Тесты объединения одновременных вызовов в потоках
+    """
+
+    def run_concurrently(self, flight, count, fn, key='key'):
+        results = [None] * count
+        errors = [None] * count
+
+        def call(index):
+            try:
+                results[index] = flight.do(key, fn)
+            except Exception as error:
+                errors[index] = error
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        """
+        Тест: одновременные вызовы с одним ключом выполняют функцию один раз
+        """
+        flight = SingleFlight()
+        started = threading.Event()
+        executions = []
+
+        def slow():
+            executions.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 42
+
+        results, errors = self.run_concurrently(flight, 5, slow)
+
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(flight.stats()['shared'], 4)
+        self.assertEqual(flight.stats()['coalescing_ratio'], 0.8)
+
+    def test_error_is_shared_and_not_kept(self):
+        """
+        Тест: исключение получают все ожидающие, следующий вызов выполняется заново
+        """
+        flight = SingleFlight(window=60)
+
+        def failing():
+            time.sleep(0.05)
+            raise ValueError('boom')
+
+        results, errors = self.run_concurrently(flight, 3, failing)
+
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+
+    def test_result_window_and_forget(self):
+        """
+        Тест: готовый результат раздается в течение окна и сбрасывается по условию
+        """
+        flight = SingleFlight(window=60)
+
+        self.assertEqual(flight.do((1, 'balance'), lambda: 'old'), 'old')
+        self.assertEqual(flight.do((1, 'balance'), lambda: 'new'), 'old')
+
+        flight.forget(lambda key: key[0] == 1)
+
+        self.assertEqual(flight.do((1, 'balance'), lambda: 'new'), 'new')
+
+    def test_no_window_recomputes(self):
+        """
+        Тест: без окна завершенный результат не переиспользуется
+        """
+        flight = SingleFlight()
+
+        flight.do('key', lambda: 'first')
+
+        self.assertEqual(flight.do('key', lambda: 'second'), 'second')
+
+
+class CoalescedViewsTest(TestCase):
+    """
+    Тесты объединения запросов в представлениях
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.balance = UserBalance.objects.create(user=self.user, balance_kopecks=10000)
+        self.client.force_authenticate(user=self.user)
+        self.window = reads.window
+        reads.window = 60
+
+    def tearDown(self):
+        reads.window = self.window
+        reads.forget(lambda key: True)
+
+    def test_balance_is_fresh_after_deposit(self):
+        """
+        Тест: изменение баланса сбрасывает объединенный результат
+        """
+        self.client.get(reverse('get_balance'))
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 5000}, format='json')
+
+        response = self.client.get(reverse('get_balance'))
+
+        self.assertEqual(response.data['balance_rubles'], 150.0)
+
+    def test_repeated_reads_share_result(self):
+        """
+        Тест: повторное чтение в пределах окна не обращается к базе
+        """
+        self.client.get(reverse('get_transactions'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_transactions'))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_string_is_part_of_key(self):
+        """
+        Тест: запросы с параметрами объединяются по их значениям
+        """
+        params = {'page': '1', 'tag': ['a', 'b']}
+        self.assertEqual(self.client.get(reverse('get_transactions'), params).status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_transactions'), params)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse('get_balance'), {'page': '2'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_require_staff(self):
+        """
+        Тест: метрики доступны только персоналу
+        """
+        response = self.client.get(reverse('get_metrics'))
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('get_metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('coalescing_ratio', response.data['coalescing'])
@@ -0,0 +1,394 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from wallet.management.commands.archive_transactions import Command as ArchiveCommand
+from wallet.models import BalanceShard, LedgerSnapshot, UserBalance, Transaction
+from wallet.services import deposit, transfer
+
+
+class BackfillBalanceAfterCommandTest(TestCase):
+    """
+    Тесты для команды backfill_balance_after
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных: история без account и balance_after_kopecks
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        
+        self.deposit = Transaction.objects.create(
+            to_user=self.user1,
+            amount_kopecks=10000,
+            transaction_type=Transaction.TransactionType.DEPOSIT
+        )
+        self.transfer_out = Transaction.objects.create(
+            from_user=self.user1,
+            to_user=self.user2,
+            amount_kopecks=3000,
+            transaction_type=Transaction.TransactionType.TRANSFER_OUT
+        )
+        self.transfer_in = Transaction.objects.create(
+            from_user=self.user1,
+            to_user=self.user2,
+            amount_kopecks=3000,
+            transaction_type=Transaction.TransactionType.TRANSFER_IN
+        )
+
+    def test_backfill_fills_accounts_and_balances(self):
+        """
+        Тест заполнения account и баланса после операции
+        """
+        call_command('backfill_balance_after', chunk_size=1, stdout=StringIO())
+        
+        self.deposit.refresh_from_db()
+        self.transfer_out.refresh_from_db()
+        self.transfer_in.refresh_from_db()
+        
+        self.assertEqual(self.deposit.account, self.user1)
+        self.assertEqual(self.deposit.balance_after_kopecks, 10000)
+        self.assertEqual(self.transfer_out.account, self.user1)
+        self.assertEqual(self.transfer_out.balance_after_kopecks, 7000)
+        self.assertEqual(self.transfer_in.account, self.user2)
+        self.assertEqual(self.transfer_in.balance_after_kopecks, 3000)
+
+    def test_backfill_continues_from_filled_rows(self):
+        """
+        Тест продолжения с уже заполненных строк
+        """
+        Transaction.objects.filter(pk=self.deposit.pk).update(account=self.user1, balance_after_kopecks=20000)
+        
+        call_command('backfill_balance_after', stdout=StringIO())
+        
+        self.transfer_out.refresh_from_db()
+        self.assertEqual(self.transfer_out.balance_after_kopecks, 17000)
+
+
+class ReconcileBalancesCommandTest(TestCase):
+    """
+    Тесты для команды reconcile_balances
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.report_path = os.path.join(tempfile.mkdtemp(), 'report.csv')
+        
+        UserBalance.objects.create(user=self.user1, balance_kopecks=7000)
+        UserBalance.objects.create(user=self.user2, balance_kopecks=3000)
+        
+        Transaction.objects.create(
+            to_user=self.user1, account=self.user1, amount_kopecks=10000,
+            transaction_type=Transaction.TransactionType.DEPOSIT
+        )
+        Transaction.objects.create(
+            from_user=self.user1, to_user=self.user2, account=self.user1, amount_kopecks=3000,
+            transaction_type=Transaction.TransactionType.TRANSFER_OUT
+        )
+        Transaction.objects.create(
+            from_user=self.user1, to_user=self.user2, account=self.user2, amount_kopecks=3000,
+            transaction_type=Transaction.TransactionType.TRANSFER_IN
+        )
+
+    def read_report(self):
+        with open(self.report_path, encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def test_reconcile_no_mismatches(self):
+        """
+        Тест сверки согласованных балансов
+        """
+        out = StringIO()
+        call_command('reconcile_balances', workers=1, range_size=1, report=self.report_path, stdout=out)
+        
+        self.assertEqual(self.read_report(), [])
+        self.assertIn('расхождений: 0', out.getvalue())
+
+    def test_reconcile_reports_drift(self):
+        """
+        Тест обнаружения расхождения баланса с историей
+        """
+        UserBalance.objects.filter(user=self.user2).update(balance_kopecks=3500)
+        
+        call_command('reconcile_balances', workers=1, report=self.report_path, stdout=StringIO())
+        
+        report = self.read_report()
+        self.assertEqual(len(report), 1)
+        self.assertEqual(int(report[0]['user_id']), self.user2.id)
+        self.assertEqual(int(report[0]['diff_kopecks']), 500)
+
+    def test_reconcile_since_skips_old_balances(self):
+        """
+        Тест инкрементального режима по updated_at
+        """
+        UserBalance.objects.filter(user=self.user2).update(
+            balance_kopecks=3500,
+            updated_at=timezone.now() - timedelta(days=10)
+        )
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        
+        call_command('reconcile_balances', workers=1, since=since, report=self.report_path, stdout=StringIO())
+        
+        self.assertEqual(self.read_report(), [])
+
+    def test_reconcile_invalid_since_rejected(self):
+        """
+        Тест: несуществующая дата в --since дает CommandError, а не трассировку
+        """
+        for since in ('2024-02-30', '2024-02-30 10:00:00', 'вчера'):
+            with self.assertRaisesMessage(CommandError, f'Некорректное значение --since: {since}'):
+                call_command('reconcile_balances', workers=1, since=since, report=self.report_path, stdout=StringIO())
+
+
+class ArchiveTransactionsCommandTest(TestCase):
+    """
+    Тесты для команды archive_transactions
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных: две старые операции и одна свежая
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.output_dir = tempfile.mkdtemp()
+        self.old_date = timezone.now() - timedelta(days=400)
+        
+        UserBalance.objects.create(user=self.user1, balance_kopecks=8000)
+        UserBalance.objects.create(user=self.user2, balance_kopecks=2000)
+        
+        old_rows = [
+            Transaction.objects.create(
+                to_user=self.user1, account=self.user1, amount_kopecks=10000, balance_after_kopecks=10000,
+                transaction_type=Transaction.TransactionType.DEPOSIT
+            ),
+            Transaction.objects.create(
+                from_user=self.user1, to_user=self.user2, account=self.user1, amount_kopecks=3000,
+                balance_after_kopecks=7000, transaction_type=Transaction.TransactionType.TRANSFER_OUT
+            ),
+            Transaction.objects.create(
+                from_user=self.user1, to_user=self.user2, account=self.user2, amount_kopecks=3000,
+                balance_after_kopecks=3000, transaction_type=Transaction.TransactionType.TRANSFER_IN
+            ),
+        ]
+        for offset, row in enumerate(old_rows):
+            Transaction.objects.filter(pk=row.pk).update(created_at=self.old_date + timedelta(minutes=offset))
+        self.old_ids = [row.pk for row in old_rows]
+        
+        self.recent = Transaction.objects.create(
+            from_user=self.user2, to_user=self.user1, account=self.user2, amount_kopecks=1000,
+            balance_after_kopecks=2000, transaction_type=Transaction.TransactionType.TRANSFER_OUT
+        )
+        Transaction.objects.create(
+            from_user=self.user2, to_user=self.user1, account=self.user1, amount_kopecks=1000,
+            balance_after_kopecks=8000, transaction_type=Transaction.TransactionType.TRANSFER_IN
+        )
+
+    def run_archive(self, **options):
+        before = (self.old_date + timedelta(days=1)).isoformat()
+        call_command('archive_transactions', before=before, output_dir=self.output_dir, stdout=StringIO(), **options)
+
+    def read_archive(self):
+        records = []
+        for name in os.listdir(self.output_dir):
+            with gzip.open(os.path.join(self.output_dir, name), 'rt', encoding='utf-8') as f:
+                records.extend(json.loads(line) for line in f)
+        return records
+
+    def test_archive_exports_and_deletes_old_rows(self):
+        """
+        Тест выгрузки старых операций в NDJSON.gz и их удаления
+        """
+        self.run_archive()
+        
+        records = self.read_archive()
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['transaction_type'], 'deposit')
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_archive_keeps_snapshot_totals(self):
+        """
+        Тест сохранения итогов по счетам
+        """
+        self.run_archive()
+        
+        snapshot1 = LedgerSnapshot.objects.get(account=self.user1)
+        snapshot2 = LedgerSnapshot.objects.get(account=self.user2)
+        self.assertEqual(snapshot1.net_kopecks, 7000)
+        self.assertEqual(snapshot1.transaction_count, 2)
+        self.assertEqual(snapshot1.balance_after_kopecks, 7000)
+        self.assertEqual(snapshot2.net_kopecks, 3000)
+        self.assertEqual(
+            (snapshot1.total_deposited_kopecks, snapshot1.total_sent_kopecks, snapshot1.total_received_kopecks),
+            (10000, 3000, 0)
+        )
+        self.assertEqual(snapshot1.last_transaction_id, self.old_ids[1])
+        self.assertEqual(snapshot2.total_received_kopecks, 3000)
+
+    def test_reconcile_after_archive(self):
+        """
+        Тест: сверка учитывает итоги архива
+        """
+        self.run_archive()
+        report_path = os.path.join(self.output_dir, 'report.csv')
+        
+        out = StringIO()
+        call_command('reconcile_balances', workers=1, report=report_path, stdout=out)
+        
+        self.assertIn('расхождений: 0', out.getvalue())
+
+    def test_dry_run_keeps_rows(self):
+        """
+        Тест пробного запуска без удаления
+        """
+        self.run_archive(dry_run=True)
+        
+        self.assertEqual(len(self.read_archive()), 3)
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertFalse(LedgerSnapshot.objects.exists())
+
+    def test_rows_added_during_archive_are_kept(self):
+        """
+        Тест: удаляются только выгруженные строки, а не все подходящие на момент удаления
+        """
+        save_snapshots = ArchiveCommand.save_snapshots
+
+        def insert_and_save(command, totals, archived_before):
+            late = Transaction.objects.create(
+                to_user=self.user1, account=self.user1, amount_kopecks=500,
+                transaction_type=Transaction.TransactionType.DEPOSIT
+            )
+            Transaction.objects.filter(pk=late.pk).update(created_at=self.old_date)
+            save_snapshots(command, totals, archived_before)
+
+        with patch.object(ArchiveCommand, 'save_snapshots', insert_and_save):
+            self.run_archive()
+
+        self.assertEqual(len(self.read_archive()), 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(LedgerSnapshot.objects.get(account=self.user1).transaction_count, 2)
+
+    def test_future_before_rejected(self):
+        """
+        Тест: граница архива в будущем отклоняется
+        """
+        before = (timezone.now() + timedelta(days=1)).isoformat()
+
+        with self.assertRaises(CommandError):
+            call_command('archive_transactions', before=before, output_dir=self.output_dir, stdout=StringIO())
+
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_invalid_before_rejected(self):
+        """
+        Тест: несуществующая дата в --before дает CommandError, а не трассировку
+        """
+        for before in ('2024-02-30', '2024-02-30 10:00:00', 'вчера'):
+            with self.assertRaisesMessage(CommandError, f'Некорректное значение --before: {before}'):
+                call_command('archive_transactions', before=before, output_dir=self.output_dir, stdout=StringIO())
+
+        self.assertEqual(Transaction.objects.count(), 5)
+
+
+class RebalanceShardsCommandTest(TestCase):
+    """
+    Тесты для команды rebalance_shards
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.merchant = User.objects.create_user(username='merchant', password='testpass123')
+        self.balance = UserBalance.objects.create(user=self.merchant, balance_kopecks=500)
+
+    def test_configure_and_rebalance(self):
+        """
+        Тест: команда задает количество слотов и переносит их средства в основную строку
+        """
+        call_command('rebalance_shards', user=[self.merchant.id], shards=3, stdout=StringIO())
+        BalanceShard.objects.filter(user_balance=self.balance).update(balance_kopecks=200)
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.shard_count, 3)
+        self.assertEqual(self.balance.balance_kopecks, 1100)
+        self.assertIn('Перенесено 600 коп.', out.getvalue())
+
+
+class RepairAccountActivityCommandTest(TestCase):
+    """
+    Тесты для команды repair_account_activity
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        deposit(self.user1, 5000)
+        transfer(self.user1, self.user2, 2000)
+        UserBalance.objects.filter(user=self.user1).update(transaction_count=7, total_sent_kopecks=0)
+
+    def test_repair(self):
+        """
+        Тест: команда восстанавливает счетчики по истории и не трогает верные
+        """
+        out = StringIO()
+        call_command('repair_account_activity', batch_size=1, stdout=out)
+
+        balance = UserBalance.objects.get(user=self.user1)
+        self.assertEqual((balance.transaction_count, balance.total_sent_kopecks), (2, 2000))
+        self.assertEqual(balance.last_transaction_id, Transaction.objects.filter(account=self.user1).latest('id').id)
+        self.assertIn('Проверено счетов: 2. Исправлено счетов: 1', out.getvalue())
+
+    def test_dry_run(self):
+        """
+        Тест: --dry-run только сообщает о расхождениях
+        """
+        out = StringIO()
+        call_command('repair_account_activity', dry_run=True, stdout=out)
+
+        self.assertEqual(UserBalance.objects.get(user=self.user1).transaction_count, 7)
+        self.assertIn('Расхождений найдено: 1', out.getvalue())
+
+    def test_archived_totals_kept(self):
+        """
+        Тест: суммы по типам учитывают итоги архива, а неизвестные итоги старого архива не переписываются
+        """
+        LedgerSnapshot.objects.create(
+            account=self.user2, archived_before=timezone.now() - timedelta(days=30), net_kopecks=500,
+            transaction_count=1, total_received_kopecks=500
+        )
+        UserBalance.objects.filter(user=self.user2).update(transaction_count=2, total_received_kopecks=2500)
+        LedgerSnapshot.objects.create(
+            account=self.user1, archived_before=timezone.now() - timedelta(days=30), net_kopecks=900,
+            transaction_count=1, total_deposited_kopecks=None, total_sent_kopecks=None, total_received_kopecks=None
+        )
+
+        out = StringIO()
+        call_command('repair_account_activity', stdout=out)
+
+        recipient = UserBalance.objects.get(user=self.user2)
+        self.assertEqual((recipient.transaction_count, recipient.total_received_kopecks), (2, 2500))
+        sender = UserBalance.objects.get(user=self.user1)
+        self.assertEqual(sender.transaction_count, 3)
+        self.assertEqual((sender.total_deposited_kopecks, sender.total_sent_kopecks), (5000, 0))
+        self.assertIn('Исправлено счетов: 1', out.getvalue())
+
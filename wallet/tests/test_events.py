@@ -0,0 +1,140 @@
+import asyncio
+import json
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from wallet.events import broker
+from wallet.models import UserBalance
+
+
+class BrokerTest(TestCase):
+    """
+    Тесты pub/sub процесса
+    """
+
+    def test_publish_reaches_only_user_subscribers(self):
+        """
+        Тест: сообщение получают только подписки этого пользователя
+        """
+        async def main():
+            with broker.subscribe(1) as mine, broker.subscribe(2) as other:
+                broker.publish(1, {'user_id': 1})
+                return await mine.get(1), await other.get(0.05)
+
+        self.assertEqual(asyncio.run(main()), ({'user_id': 1}, None))
+
+    def test_full_queue_drops_oldest(self):
+        """
+        Тест: переполненная очередь вытесняет самое старое сообщение
+        """
+        async def main():
+            with broker.subscribe(1) as subscription:
+                for index in range(20):
+                    broker.publish(1, {'index': index})
+                await asyncio.sleep(0)
+                return (await subscription.get(1))['index']
+
+        with override_settings(WALLET_EVENTS={'QUEUE_SIZE': 16}):
+            self.assertEqual(asyncio.run(main()), 4)
+
+    def test_unsubscribe_on_close(self):
+        """
+        Тест: закрытая подписка удаляется из брокера
+        """
+        async def main():
+            with broker.subscribe(1):
+                self.assertEqual(broker.stats()['connections'], 1)
+
+        asyncio.run(main())
+        self.assertEqual(broker.stats()['connections'], 0)
+
+
+class BalanceEventsViewTest(TestCase):
+    """
+    Тесты для endpoint уведомлений об изменении баланса
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        UserBalance.objects.create(user=self.user1, balance_kopecks=10000)
+        self.token = Token.objects.create(user=self.user1)
+        self.headers = {'authorization': f'Token {self.token.key}'}
+
+    def test_write_views_publish_after_commit(self):
+        """
+        Тест: перевод уведомляет отправителя и получателя после коммита
+        """
+        client = APIClient()
+        client.force_authenticate(user=self.user1)
+
+        with patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                client.post(
+                    reverse('transfer_money'),
+                    {'recipient_id': self.user2.id, 'amount_kopecks': 1500},
+                    format='json'
+                )
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        published = {call.args[0]: call.args[1]['balance_kopecks'] for call in publish.call_args_list}
+        self.assertEqual(published, {self.user1.id: 8500, self.user2.id: 1500})
+
+    def test_poll_timeout(self):
+        """
+        Тест: long-poll без изменений отвечает 204
+        """
+        response = self.client.get(reverse('balance_events'), {'mode': 'poll', 'timeout': 0.05}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_unauthenticated(self):
+        """
+        Тест: без учетных данных подписка запрещена
+        """
+        response = self.client.get(reverse('balance_events'), {'mode': 'poll', 'timeout': 0})
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_poll_receives_message(self):
+        """
+        Тест: long-poll возвращает первое сообщение пользователя
+        """
+        request = asyncio.ensure_future(
+            self.async_client.get(reverse('balance_events'), {'mode': 'poll', 'timeout': 5}, headers=self.headers)
+        )
+        while broker.stats()['connections'] == 0:
+            await asyncio.sleep(0.01)
+        broker.publish(self.user1.id, {'type': 'balance', 'user_id': self.user1.id, 'balance_kopecks': 700})
+
+        response = await request
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['balance_kopecks'], 700)
+
+    @override_settings(WALLET_EVENTS={'STREAM_SECONDS': 0.5, 'HEARTBEAT_SECONDS': 0.1})
+    async def test_stream(self):
+        """
+        Тест: поток server-sent events отдает сообщения пользователя и пинги,
+        по истечении STREAM_SECONDS завершается и отписывается
+        """
+        response = await self.async_client.get(reverse('balance_events'), headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b'retry: 3000\n\n')
+        broker.publish(self.user1.id, {'type': 'balance', 'user_id': self.user1.id, 'balance_kopecks': 1})
+
+        chunk = await anext(content)
+        self.assertTrue(chunk.startswith(b'event: balance\ndata: '))
+        self.assertEqual(json.loads(chunk.split(b'data: ')[1])['balance_kopecks'], 1)
+        rest = [chunk async for chunk in content]
+        self.assertIn(b': ping\n\n', rest)
+        self.assertEqual(broker.stats()['connections'], 0)
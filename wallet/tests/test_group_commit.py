@@ -0,0 +1,138 @@
+import threading
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from wallet.group_commit import GroupCommitter, NotBatchable, _Mutation
+from wallet.models import UserBalance, Transaction
+from wallet.services import InsufficientFunds, configure_shards
+
+
+class GroupCommitterTest(TestCase):
+    """
+    Тесты групповой фиксации пополнений и переводов
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.committer = GroupCommitter(max_batch=10, max_wait_ms=1, latency_ceiling_ms=50)
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        UserBalance.objects.create(user=self.user1, balance_kopecks=10000)
+
+    def enqueue(self, kind, sender, recipient, amount_kopecks):
+        mutation = _Mutation(kind, sender, recipient, amount_kopecks)
+        self.committer._queue.put(mutation)
+        return mutation
+
+    def test_batch_applies_all_mutations(self):
+        """
+        Тест: пачка применяет пополнения и переводы и возвращает каждому свой результат
+        """
+        deposit = self.enqueue('deposit', None, self.user1, 500)
+        first = self.enqueue('transfer', self.user1, self.user2, 3000)
+        second = self.enqueue('transfer', self.user1, self.user2, 2000)
+
+        self.committer.drain()
+
+        self.assertEqual(deposit.future.result()['new_balance_kopecks'], 10500)
+        self.assertEqual(first.future.result()['sender_new_balance_kopecks'], 7500)
+        self.assertEqual(second.future.result()['recipient_new_balance_kopecks'], 5000)
+        self.assertEqual(UserBalance.objects.get(user=self.user1).balance_kopecks, 5500)
+        self.assertEqual(UserBalance.objects.get(user=self.user2).balance_kopecks, 5000)
+
+        out_id, in_id = second.future.result()['transaction_ids']
+        self.assertEqual(Transaction.objects.get(id=out_id).balance_after_kopecks, 5500)
+        self.assertEqual(Transaction.objects.get(id=in_id).balance_after_kopecks, 5000)
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertEqual(self.committer.stats()['batches'], 1)
+
+        sender = UserBalance.objects.get(user=self.user1)
+        self.assertEqual(
+            (sender.transaction_count, sender.total_deposited_kopecks, sender.total_sent_kopecks),
+            (3, 500, 5000)
+        )
+        self.assertEqual(sender.last_transaction_id, out_id)
+        recipient = UserBalance.objects.get(user=self.user2)
+        self.assertEqual((recipient.transaction_count, recipient.total_received_kopecks), (2, 5000))
+        self.assertEqual(recipient.last_transaction_id, in_id)
+
+    def test_insufficient_funds_fails_only_own_mutation(self):
+        """
+        Тест: нехватка средств отклоняет только свою операцию
+        """
+        too_big = self.enqueue('transfer', self.user1, self.user2, 20000)
+        ok = self.enqueue('transfer', self.user1, self.user2, 1000)
+
+        self.committer.drain()
+
+        with self.assertRaises(InsufficientFunds):
+            too_big.future.result()
+        self.assertEqual(ok.future.result()['sender_new_balance_kopecks'], 9000)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_hot_account_is_not_batched(self):
+        """
+        Тест: операции с горячим счетом выполняются напрямую
+        """
+        with transaction.atomic():
+            configure_shards(UserBalance.objects.create(user=self.user2), 2)
+        mutation = self.enqueue('transfer', self.user1, self.user2, 1000)
+
+        self.committer.drain()
+
+        with self.assertRaises(NotBatchable):
+            mutation.future.result()
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_cancelled_mutation_is_skipped(self):
+        """
+        Тест: операция, отмененная по потолку задержки, не применяется пачкой
+        """
+        mutation = self.enqueue('deposit', None, self.user1, 500)
+        mutation.future.cancel()
+
+        self.committer.drain()
+
+        self.assertEqual(UserBalance.objects.get(user=self.user1).balance_kopecks, 10000)
+
+    @override_settings(GROUP_COMMIT={'ENABLED': True})
+    def test_inside_transaction_runs_directly(self):
+        """
+        Тест: внутри открытой транзакции операция выполняется напрямую
+        """
+        result = self.committer.deposit(self.user1, 500)
+
+        self.assertEqual(result['new_balance_kopecks'], 10500)
+        self.assertEqual(self.committer.stats()['direct'], 1)
+
+
+class GroupCommitThreadTest(TransactionTestCase):
+    """
+    Тест групповой фиксации через поток-фиксатор
+    """
+
+    @override_settings(GROUP_COMMIT={'ENABLED': True})
+    def test_concurrent_deposits_share_batches(self):
+        """
+        Тест: одновременные пополнения применяются потоком-фиксатором
+        """
+        committer = GroupCommitter(max_batch=50, max_wait_ms=50, latency_ceiling_ms=5000)
+        user = User.objects.create_user(username='user1', password='testpass123')
+        results = []
+
+        def worker():
+            results.append(committer.deposit(user, 100))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(UserBalance.objects.get(user=user).balance_kopecks, 800)
+        self.assertEqual(Transaction.objects.count(), 8)
+        self.assertLess(committer.stats()['batches'], 8)
@@ -0,0 +1,506 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from wallet.loganalysis.files import generations, seek_time, split_chunks
+from wallet.loganalysis.parsing import Tokenizer, parse_security_line, parse_transaction_line
+from wallet.loganalysis.replay import Ledger
+from wallet.loganalysis.rollups import RELATIVE_ACCURACY, DDSketch
+from wallet.models import UserBalance
+from wallet.loganalysis.store import LogIndex
+
+
+def log_line(event, fields, ts=None, logger='wallet.transactions'):
+    ts = ts or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return f"{ts} | INFO | {logger} | view:1 | {' | '.join([event, *fields])}\n"
+
+
+def deposit_line(user, amount, ts=None):
+    return log_line('DEPOSIT_SUCCESS', [f'user={user}', f'amount={amount}', 'old_balance=0.0', 'new_balance=0.0'], ts)
+
+
+def transfer_line(sender, recipient, amount, ts=None):
+    return log_line('TRANSFER_SUCCESS', [f'sender={sender}', f'recipient={recipient}', f'amount={amount}'], ts)
+
+
+def slow_request_line(user, duration, ts=None):
+    return log_line(
+        'SLOW_REQUEST', ['POST /api/wallet/transfer/', f'user={user}', f'duration={duration}s', 'status=200'],
+        ts, 'wallet.security'
+    )
+
+
+def days_ago(days, minutes=0):
+    return (datetime.now() - timedelta(days=days, minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class LogAnalysisTestCase(TestCase):
+    """
+    Базовый класс: временная директория логов
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.logs_dir = os.path.join(self.base_dir, 'logs')
+        os.makedirs(self.logs_dir)
+        self.transactions_log = os.path.join(self.logs_dir, 'transactions.log')
+        self.security_log = os.path.join(self.logs_dir, 'security.log')
+
+    def append(self, path, *lines):
+        with open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write(''.join(lines))
+
+    def analyze(self, **options):
+        out = StringIO()
+        with override_settings(
+            BASE_DIR=self.base_dir, LOG_ANALYSIS_INDEX=os.path.join(self.logs_dir, 'analytics.sqlite3')
+        ):
+            call_command('analyze_logs', stdout=out, **options)
+        return out.getvalue()
+
+
+class TokenizerTest(TestCase):
+    """
+    Тесты для разбора записей detailed
+    """
+
+    def test_fields(self):
+        """
+        Тест: запись делится на время, уровень, логгер, тип события и поля
+        """
+        line = log_line(
+            'SLOW_REQUEST', ['POST /api/wallet/transfer/', 'user=anna.k@example.com', 'duration=1.234s'],
+            '2026-01-02 03:04:05', 'wallet'
+        )
+
+        self.assertEqual(
+            Tokenizer()(line),
+            ('2026-01-02 03:04:05', 'INFO', 'wallet', 'SLOW_REQUEST',
+             {0: 'POST /api/wallet/transfer/', 'user': 'anna.k@example.com', 'duration': '1.234s'})
+        )
+
+    def test_prefix_fast_path(self):
+        """
+        Тест: события без нужного префикса и строки без метки времени отбрасываются
+        """
+        tokenize = Tokenizer(('DEPOSIT_',))
+
+        self.assertIsNone(tokenize(log_line('BALANCE_VIEW', ['user=alice'])))
+        self.assertIsNone(tokenize('Traceback | a | b | c | DEPOSIT_SUCCESS | user=alice'))
+        self.assertEqual(tokenize(deposit_line('alice', '1.00'))[3], 'DEPOSIT_SUCCESS')
+
+    def test_usernames_outside_word_characters(self):
+        """
+        Тест: имена с точками, @ и дефисами разбираются целиком
+        """
+        transfer = parse_transaction_line(transfer_line('ivan.petrov', 'olga-s@mail.ru', '3.5'))
+        login = parse_security_line(log_line('LOGIN_FAILED', ['username=a+b.c', 'ip=1.2.3.4'], logger='wallet.security'))
+
+        self.assertEqual(transfer[2:5], ('ivan.petrov', 'olga-s@mail.ru', 350))
+        self.assertEqual(login[2], 'a+b.c')
+
+    def test_event_matched_by_position(self):
+        """
+        Тест: тип события определяется по своему сегменту, а не по подстроке в строке
+        """
+        self.assertIsNone(parse_security_line(log_line('USER_LOGIN_SUCCESS', ['user=alice'], logger='wallet.auth')))
+        self.assertIsNone(parse_transaction_line(log_line('BALANCE_VIEW', ['user=DEPOSIT_SUCCESS'])))
+        self.assertEqual(
+            parse_security_line(log_line('ADMIN_USER_ACTION', ['admin=root'], logger='wallet.security'))[0],
+            'ADMIN_ACTION'
+        )
+
+
+class DDSketchTest(TestCase):
+    """
+    Тесты для эскиза квантилей
+    """
+
+    def test_relative_accuracy(self):
+        """
+        Тест: квантили отличаются от точных не больше чем на RELATIVE_ACCURACY
+        """
+        sketch = DDSketch()
+        for value in range(1, 10001):
+            sketch.add(value)
+
+        for q, exact in ((0.5, 5000), (0.95, 9500), (0.99, 9900)):
+            self.assertAlmostEqual(sketch.quantile(q), exact, delta=exact * RELATIVE_ACCURACY + 1)
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+    def test_merge_equals_single_sketch(self):
+        """
+        Тест: объединение эскизов частей совпадает с эскизом всех значений
+        """
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for value in range(1, 5000, 7):
+            whole.add(value)
+            (left if value % 2 else right).add(value)
+
+        self.assertEqual(left.merge(right).bins, whole.bins)
+
+
+class LogIndexTest(LogAnalysisTestCase):
+    """
+    Тесты для SQLite-индекса событий и контрольных точек
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        super().setUp()
+        self.index = LogIndex(os.path.join(self.logs_dir, 'analytics.sqlite3'))
+        self.addCleanup(self.index.close)
+        self.since = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def test_ingest_reads_only_new_lines(self):
+        """
+        Тест: повторный разбор начинается с контрольной точки
+        """
+        self.append(self.transactions_log, deposit_line('alice', '10.50'))
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 1)
+
+        self.append(self.transactions_log, transfer_line('alice', 'bob', '2.25'))
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 1)
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 0)
+
+        report = self.index.transaction_report(self.since)
+        self.assertEqual(report['count'], 2)
+        self.assertEqual(report['volume_kopecks'], 1275)
+        self.assertEqual(report['recipients'], [('bob', 225)])
+
+    def test_partial_line_waits_for_next_run(self):
+        """
+        Тест: недописанная строка не попадает в индекс до следующего запуска
+        """
+        line = deposit_line('alice', '1.00')
+        self.append(self.transactions_log, line[:20])
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 0)
+
+        self.append(self.transactions_log, line[20:])
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['events'], 1)
+
+    def test_rotation_finishes_previous_file(self):
+        """
+        Тест: после ротации дочитывается хвост старого файла и новый файл целиком
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00'))
+        self.index.ingest('transactions', self.transactions_log)
+        self.append(self.transactions_log, deposit_line('alice', '2.00'))
+        os.rename(self.transactions_log, f'{self.transactions_log}.1')
+        self.append(self.transactions_log, deposit_line('bob', '3.00'))
+
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 2)
+        self.assertEqual(self.index.transaction_report(self.since)['volume_kopecks'], 600)
+
+    def test_first_run_reads_all_generations(self):
+        """
+        Тест: первый разбор читает все поколения, включая сжатые
+        """
+        with gzip.open(f'{self.transactions_log}.2.gz', 'wt', encoding='utf-8') as log_file:
+            log_file.write(deposit_line('alice', '1.00'))
+        self.append(f'{self.transactions_log}.1', deposit_line('alice', '2.00'))
+        self.append(self.transactions_log, deposit_line('alice', '4.00'))
+
+        self.assertEqual(
+            [os.path.basename(path) for path in generations(self.transactions_log)],
+            ['transactions.log.2.gz', 'transactions.log.1', 'transactions.log']
+        )
+        stats = self.index.ingest('transactions', self.transactions_log)
+        self.assertEqual((stats['files'], stats['lines']), (3, 3))
+        self.assertEqual(self.index.transaction_report(self.since)['volume_kopecks'], 700)
+
+    def test_rotation_past_first_generation(self):
+        """
+        Тест: если с прошлого запуска было несколько ротаций, читаются все новые поколения
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00'))
+        self.index.ingest('transactions', self.transactions_log)
+        self.append(self.transactions_log, deposit_line('alice', '2.00'))
+        os.rename(self.transactions_log, f'{self.transactions_log}.2')
+        self.append(f'{self.transactions_log}.1', deposit_line('alice', '4.00'))
+        self.append(self.transactions_log, deposit_line('alice', '8.00'))
+
+        self.assertEqual(self.index.ingest('transactions', self.transactions_log)['lines'], 3)
+        self.assertEqual(self.index.transaction_report(self.since)['volume_kopecks'], 1500)
+
+    def test_chunks_start_at_line_boundaries(self):
+        """
+        Тест: участки начинаются с начала строки и покрывают файл целиком
+        """
+        self.append(self.transactions_log, *[deposit_line(f'user{i}', '1.00') for i in range(50)])
+        size = os.path.getsize(self.transactions_log)
+
+        chunks = split_chunks(self.transactions_log, 0, size, chunk_size=500)
+
+        self.assertGreater(len(chunks), 5)
+        self.assertEqual((chunks[0][1], chunks[-1][2]), (0, size))
+        with open(self.transactions_log, 'rb') as log_file:
+            data = log_file.read()
+        for path, lo, hi in chunks:
+            self.assertEqual(data[lo - 1:lo], b'\n' if lo else b'')
+
+    def test_parallel_ingest_matches_sequential(self):
+        """
+        Тест: разбор участков в пуле процессов дает те же события и контрольную точку
+        """
+        self.append(self.transactions_log, *[transfer_line(f'user{i % 7}', 'bob', '1.25') for i in range(300)])
+
+        stats = self.index.ingest('transactions', self.transactions_log, workers=2, chunk_size=4096)
+
+        self.assertGreater(stats['chunks'], 1)
+        self.assertEqual(stats['events'], 300)
+        self.assertEqual(self.index.checkpoint('transactions')[1], os.path.getsize(self.transactions_log))
+        self.assertEqual(self.index.transaction_report(self.since)['recipients'], [('bob', 37500)])
+
+    def test_seek_time(self):
+        """
+        Тест: двоичный поиск находит первую строку не раньше заданного времени
+        """
+        lines = [deposit_line('alice', '1.00', days_ago(0, minutes=100 - i)) for i in range(100)]
+        lines.insert(50, 'Traceback: продолжение многострочного сообщения\n')
+        self.append(self.transactions_log, *lines)
+        with open(self.transactions_log, 'rb') as log_file:
+            data = log_file.read()
+
+        offset = seek_time(self.transactions_log, days_ago(0, minutes=30))
+
+        self.assertEqual(data[offset:].decode().count('\n'), 30)
+        self.assertEqual(seek_time(self.transactions_log, days_ago(1)), 0)
+        self.assertEqual(seek_time(self.transactions_log, days_ago(-1)), len(data))
+
+    def test_first_run_starts_at_window(self):
+        """
+        Тест: первый разбор с окном не читает строки старше окна
+        """
+        self.append(
+            self.transactions_log,
+            *[deposit_line('old', '1.00', days_ago(5)) for _ in range(20)],
+            deposit_line('alice', '2.00'),
+        )
+
+        stats = self.index.ingest('transactions', self.transactions_log, since=self.since)
+
+        self.assertEqual((stats['lines'], stats['events']), (1, 1))
+
+    def test_wider_window_backfills(self):
+        """
+        Тест: более раннее окно дочитывает только недостающие строки
+        """
+        with gzip.open(f'{self.transactions_log}.2.gz', 'wt', encoding='utf-8') as log_file:
+            log_file.write(deposit_line('old', '1.00', days_ago(10)) + deposit_line('alice', '2.00', days_ago(4)))
+        self.append(f'{self.transactions_log}.1', deposit_line('alice', '4.00', days_ago(3)), deposit_line('alice', '8.00', days_ago(2)))
+        self.append(self.transactions_log, deposit_line('alice', '16.00'))
+        self.index.ingest('transactions', self.transactions_log, since=days_ago(2, minutes=1))
+
+        self.index.ingest('transactions', self.transactions_log, since=days_ago(5))
+        self.index.ingest('transactions', self.transactions_log, since=days_ago(5))
+
+        report = self.index.transaction_report(days_ago(30))
+        self.assertEqual((report['count'], report['volume_kopecks']), (4, 3000))
+
+    def test_rollups_merge_parallel_chunks_and_runs(self):
+        """
+        Тест: агрегаты участков из пула и повторных запусков складываются
+        """
+        ts = days_ago(0, minutes=5)
+        self.append(self.transactions_log, *[deposit_line('alice', f'{i}.00', ts) for i in range(1, 101)])
+        self.index.ingest('transactions', self.transactions_log, workers=2, chunk_size=2048)
+        self.append(self.transactions_log, deposit_line('bob', '500.00'))
+        self.index.ingest('transactions', self.transactions_log)
+
+        rows = {row['bucket']: row for row in self.index.rollups(['DEPOSIT_SUCCESS'], self.since, 'minute')}
+
+        self.assertEqual(rows[ts[:16]]['count'], 100)
+        self.assertEqual(rows[ts[:16]]['peak_per_second'], 100)
+        self.assertEqual((rows['all']['count'], rows['all']['total']), (101, 555000))
+        self.assertAlmostEqual(rows[ts[:16]]['p50'], 5000, delta=5000 * RELATIVE_ACCURACY + 100)
+
+    def test_days_window(self):
+        """
+        Тест: отчет учитывает только события окна
+        """
+        old = (datetime.now() - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')
+        self.append(self.transactions_log, deposit_line('alice', '5.00', old), deposit_line('bob', '1.00'))
+        self.index.ingest('transactions', self.transactions_log)
+
+        self.assertEqual(self.index.transaction_report(self.since)['deposits'], [('bob', 100)])
+
+
+class AnalyzeLogsCommandTest(LogAnalysisTestCase):
+    """
+    Тесты для команды analyze_logs
+    """
+
+    def test_reports(self):
+        """
+        Тест: команда выводит отчеты по безопасности и транзакциям
+        """
+        self.append(
+            self.security_log,
+            log_line('LOGIN_SUCCESS', ['user=alice', 'ip=127.0.0.1'], logger='wallet.security'),
+            log_line('LOGIN_FAILED', ['username=mallory', 'ip=10.0.0.1'], logger='wallet.security'),
+            log_line('SELF_TRANSFER_ATTEMPT', ['user=alice', 'amount=1.0'], logger='wallet.security'),
+        )
+        self.append(self.transactions_log, deposit_line('alice', '100.00'), transfer_line('alice', 'bob', '40.00'))
+
+        output = self.analyze(days=1)
+
+        self.assertIn('alice: 1 успешных входов', output)
+        self.assertIn('mallory: 1 неудачных попыток', output)
+        self.assertIn('Подозрительная активность (1 событий)', output)
+        self.assertIn('Общий объем: 140.00 ₽', output)
+        self.assertIn('bob: 40.00 ₽ получено', output)
+
+    def test_rebuild(self):
+        """
+        Тест: --rebuild очищает индекс и разбирает логи заново
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00'))
+        self.analyze(type='transactions')
+
+        output = self.analyze(type='transactions', rebuild=True)
+
+        self.assertIn('Проиндексировано новых строк transactions.log: 1', output)
+        self.assertIn('Всего транзакций: 1', output)
+
+    def test_rollup_formats(self):
+        """
+        Тест: агрегаты выводятся в JSON и CSV без текстовых отчетов
+        """
+        ts = days_ago(0, minutes=1)
+        self.append(self.security_log, slow_request_line('anna.k', '1.500', ts), slow_request_line('anna.k', '2.500', ts))
+        self.append(self.transactions_log, deposit_line('alice', '10.00', ts), transfer_line('alice', 'bob', '4.00', ts))
+
+        rows = json.loads(self.analyze(days=1, rollup='hour', format='json'))
+        slow = [row for row in rows if row['metric'] == 'SLOW_REQUEST' and row['bucket'] == 'all'][0]
+        self.assertEqual((slow['unit'], slow['count'], slow['total'], slow['peak_per_second']), ('ms', 2, 4000, 2))
+        self.assertEqual({row['bucket'] for row in rows}, {ts[:13], 'all'})
+
+        output = self.analyze(days=1, type='transactions', format='csv')
+        records = list(csv.DictReader(output.splitlines()))
+        totals = {(record['metric'], record['total']) for record in records if record['bucket'] == 'all'}
+        self.assertEqual(totals, {('DEPOSIT_SUCCESS', '1000'), ('TRANSFER_SUCCESS', '400')})
+
+    def test_rollup_table(self):
+        """
+        Тест: --rollup добавляет таблицу агрегатов к отчетам
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00'))
+
+        output = self.analyze(type='transactions', rollup='minute')
+
+        self.assertIn('НАГРУЗКА ПО МИНУТАМ', output)
+        self.assertIn('peak_per_second', output)
+
+
+class ReplayBalancesTest(LogAnalysisTestCase):
+    """
+    Тесты для восстановления балансов по transactions.log
+    """
+
+    def replay(self, **options):
+        out = StringIO()
+        report = os.path.join(self.base_dir, 'replay_report.csv')
+        call_command('replay_balances', log=self.transactions_log, report=report, workers=1, stdout=out, **options)
+        with open(report, encoding='utf-8') as report_file:
+            return out.getvalue(), list(csv.DictReader(report_file))
+
+    def test_final_and_point_in_time_balances(self):
+        """
+        Тест: начальный баланс берется из первой проводки, суммы - в копейках
+        """
+        self.append(
+            self.transactions_log,
+            log_line(
+                'DEPOSIT_SUCCESS',
+                ['user=ann.k', 'amount=0.1', 'old_balance=5.0', 'amount_kopecks=10', 'old_balance_kopecks=500'],
+                days_ago(2)
+            ),
+            # Строка без полей *_kopecks, записанная до их появления
+            log_line(
+                'TRANSFER_SUCCESS',
+                ['sender=ann.k', 'recipient=bob', 'amount=2.2', 'sender_old_balance=5.1', 'recipient_old_balance=1.0'],
+                days_ago(1)
+            ),
+            deposit_line('bob', '0.3'),
+        )
+
+        ledger = Ledger.from_log(self.transactions_log, chunk_size=200)
+        balances = dict(zip(ledger.names, ledger.final_balances().tolist()))
+        earlier = dict(zip(ledger.names, ledger.balances_at(datetime.now() - timedelta(days=1, minutes=1)).tolist()))
+
+        self.assertEqual(balances, {'ann.k': 290, 'bob': 350})
+        self.assertEqual(earlier, {'ann.k': 510, 'bob': 100})
+
+    def test_replay_matches_database_after_api_operations(self):
+        """
+        Тест: балансы по строкам лога, записанным API, совпадают с UserBalance,
+        а измененный баланс попадает в отчет
+        """
+        alice = User.objects.create_user(username='alice', password='testpass123')
+        bob = User.objects.create_user(username='bob.smith', password='testpass123')
+        UserBalance.objects.create(user=alice, balance_kopecks=1000)
+        client = APIClient()
+        client.force_authenticate(user=alice)
+
+        with self.assertLogs('wallet.transactions', 'INFO') as logs:
+            client.post(reverse('deposit_balance'), {'amount_kopecks': 333}, format='json')
+            client.post(reverse('transfer_money'), {'recipient_id': bob.id, 'amount_kopecks': 1001}, format='json')
+        self.append(self.transactions_log, *[
+            f'{days_ago(0)} | INFO | wallet.transactions | view:1 | {record.getMessage()}\n'
+            for record in logs.records
+        ])
+
+        output, rows = self.replay()
+        self.assertIn('Расхождений с UserBalance: 0, нет в базе: 0', output)
+        self.assertEqual(rows, [])
+
+        UserBalance.objects.filter(user=bob).update(balance_kopecks=1000)
+        output, rows = self.replay()
+        self.assertEqual(
+            rows, [{'username': 'bob.smith', 'replayed_kopecks': '1001', 'balance_kopecks': '1000', 'diff_kopecks': '-1'}]
+        )
+
+    def test_point_in_time_report(self):
+        """
+        Тест: --at записывает балансы на момент времени без сверки с базой
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00', days_ago(2)), deposit_line('alice', '2.00'))
+
+        output, rows = self.replay(at=days_ago(1))
+
+        self.assertEqual(rows, [{'username': 'alice', 'balance_kopecks': '100'}])
+
+    def test_point_in_time_with_offset_and_invalid_values(self):
+        """
+        Тест: --at с часовым поясом переводится в местное время, некорректное - CommandError
+        """
+        self.append(self.transactions_log, deposit_line('alice', '1.00', days_ago(2)), deposit_line('alice', '2.00'))
+        moment = timezone.make_aware(datetime.now() - timedelta(days=1))
+        at = moment.astimezone(dt_timezone(timedelta(hours=-11))).isoformat()
+
+        output, rows = self.replay(at=at)
+
+        self.assertEqual(rows, [{'username': 'alice', 'balance_kopecks': '100'}])
+        for value in ('2024-02-30', '2024-02-30 10:00:00', 'вчера'):
+            with self.assertRaisesMessage(CommandError, f'Неверный формат --at: {value}'):
+                self.replay(at=value)
+        output, rows = self.replay(at=days_ago(1) + ',123')
+        self.assertEqual(rows, [{'username': 'alice', 'balance_kopecks': '100'}])
@@ -0,0 +1,234 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from wallet.group_commit import GroupCommitter, _Mutation
+from wallet.models import OutboxEvent, UserBalance
+from wallet.outbox import Backpressure, Dispatcher, QueueSink, backlog_stats, requeue_parked
+
+
+class FailingSink:
+    def send(self, messages):
+        raise Backpressure('перегрузка')
+
+
+class FlakySink(QueueSink):
+    """Отказывает заданное число раз, затем принимает события"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise Backpressure('перегрузка')
+        super().send(messages)
+
+
+class RejectingSink(QueueSink):
+    """Отклоняет любую пачку, в которой есть событие из rejected"""
+
+    def __init__(self, rejected):
+        super().__init__()
+        self.rejected = set(rejected)
+        self.calls = 0
+
+    def send(self, messages):
+        self.calls += 1
+        if self.rejected & {message['id'] for message in messages}:
+            raise ValueError('некорректное событие')
+        super().send(messages)
+
+
+class OutboxTest(TestCase):
+    """
+    Тесты записи и доставки событий outbox
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.client = APIClient()
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        UserBalance.objects.create(user=self.user1, balance_kopecks=10000)
+        self.client.force_authenticate(user=self.user1)
+
+    def test_operations_write_events(self):
+        """
+        Тест: пополнение и перевод записывают события вместе с операцией
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 500}, format='json')
+        self.client.post(
+            reverse('transfer_money'),
+            {'recipient_id': self.user2.id, 'amount_kopecks': 1000},
+            format='json'
+        )
+
+        events = list(OutboxEvent.objects.order_by('id'))
+        self.assertEqual([event.event_type for event in events], ['deposit', 'transfer'])
+        self.assertEqual(events[0].payload['balance_after_kopecks'], 10500)
+        self.assertEqual(events[1].payload['recipient_id'], self.user2.id)
+        self.assertEqual(len(events[1].payload['transaction_ids']), 2)
+
+    def test_failed_operation_writes_no_event(self):
+        """
+        Тест: отклоненный перевод не оставляет события
+        """
+        self.client.post(
+            reverse('transfer_money'),
+            {'recipient_id': self.user2.id, 'amount_kopecks': 50000},
+            format='json'
+        )
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_group_commit_writes_events(self):
+        """
+        Тест: групповая фиксация пишет события пачкой
+        """
+        committer = GroupCommitter(max_batch=10)
+        for _ in range(3):
+            committer._queue.put(_Mutation('deposit', None, self.user1, 100))
+
+        committer.drain()
+
+        self.assertEqual(OutboxEvent.objects.filter(event_type='deposit').count(), 3)
+
+    def test_dispatcher_delivers_and_deletes(self):
+        """
+        Тест: диспетчер доставляет события пачками и удаляет их
+        """
+        for _ in range(5):
+            self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        sink = QueueSink()
+
+        dispatcher = Dispatcher(sink, batch_size=2)
+        dispatcher.run(interval=0)
+
+        self.assertEqual(sink.queue.qsize(), 5)
+        self.assertEqual(sink.queue.get()['type'], 'deposit')
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(dispatcher.stats()['delivered'], 5)
+        self.assertEqual(backlog_stats()['dispatchers'][dispatcher.name]['delivered'], 5)
+
+    def test_failed_delivery_is_postponed(self):
+        """
+        Тест: при ошибке доставки пачка откладывается и остается в outbox
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+
+        delivered, failed = Dispatcher(FailingSink()).dispatch_batch()
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual((delivered, failed), (0, True))
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(backlog_stats()['pending'], 1)
+
+    def test_backoff_resets_after_delivery(self):
+        """
+        Тест: пауза растет только для ошибок подряд и сбрасывается после доставки
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        sink = FlakySink(failures=3)
+        dispatcher = Dispatcher(sink, base_delay=1.0)
+
+        with patch('wallet.outbox.time.sleep') as sleep:
+            for _ in range(3):
+                dispatcher.dispatch_batch()
+                OutboxEvent.objects.update(available_at=timezone.now())
+            self.assertEqual(dispatcher.consecutive_failures, 3)
+            dispatcher.dispatch_batch()
+            self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+            sink.failures = 1
+            dispatcher.run(interval=1.0, max_batches=1)
+
+        self.assertEqual(dispatcher.stats()['failed_batches'], 4)
+        self.assertEqual(dispatcher.stats()['consecutive_failures'], 1)
+        sleep.assert_called_once_with(1.0)
+
+    def test_failed_batch_is_split(self):
+        """
+        Тест: откладывается только событие, которое отклоняет получатель
+        """
+        for _ in range(8):
+            self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        bad = OutboxEvent.objects.order_by('id')[5]
+        sink = RejectingSink([bad.pk])
+        dispatcher = Dispatcher(sink)
+
+        delivered, failed = dispatcher.dispatch_batch()
+
+        self.assertEqual((delivered, failed), (7, False))
+        self.assertEqual(sink.queue.qsize(), 7)
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.pk, event.attempts), (bad.pk, 1))
+        self.assertIsNone(event.parked_at)
+        self.assertEqual(dispatcher.stats()['failed_batches'], 1)
+        self.assertEqual(dispatcher.stats()['consecutive_failures'], 0)
+
+    def test_event_is_parked_after_max_attempts(self):
+        """
+        Тест: событие, исчерпавшее попытки, паркуется и не мешает остальным
+        """
+        for _ in range(3):
+            self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        bad = OutboxEvent.objects.order_by('id').first()
+        sink = RejectingSink([bad.pk])
+        dispatcher = Dispatcher(sink, max_attempts=2)
+
+        dispatcher.dispatch_batch()
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.assertEqual(dispatcher.dispatch_batch(), (0, True))
+
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, 2)
+        self.assertIsNotNone(bad.parked_at)
+        self.assertEqual(dispatcher.stats()['parked'], 1)
+        self.assertEqual(dispatcher.dispatch_batch(), (0, False))
+        self.assertEqual(backlog_stats()['pending'], 0)
+        self.assertEqual(backlog_stats()['parked'], 1)
+
+        sink.rejected.clear()
+        self.assertEqual(requeue_parked(), 1)
+        self.assertEqual(dispatcher.dispatch_batch(), (1, False))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_unavailable_sink_does_not_park(self):
+        """
+        Тест: недоступный получатель не паркует события и не дробит пачку без конца
+        """
+        for _ in range(8):
+            self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        sink = RejectingSink(OutboxEvent.objects.values_list('pk', flat=True))
+        dispatcher = Dispatcher(sink, max_attempts=1)
+
+        self.assertEqual(dispatcher.dispatch_batch(), (0, True))
+
+        self.assertLessEqual(sink.calls, 2 * (8).bit_length() + 1)
+        self.assertEqual(OutboxEvent.objects.filter(attempts=1, parked_at__isnull=True).count(), 8)
+
+    def test_dispatch_command_writes_file(self):
+        """
+        Тест: команда доставляет события в файл
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 100}, format='json')
+        path = os.path.join(tempfile.mkdtemp(), 'outbox.ndjson')
+
+        with override_settings(OUTBOX_SINK={'BACKEND': 'wallet.outbox.FileSink', 'OPTIONS': {'path': path}}):
+            call_command('dispatch_outbox', once=True, stdout=StringIO())
+
+        with open(path, encoding='utf-8') as events:
+            message = json.loads(events.readline())
+        self.assertEqual(message['user_id'], self.user1.id)
+        self.assertFalse(OutboxEvent.objects.exists())
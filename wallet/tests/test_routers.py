@@ -0,0 +1,202 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest.mock import patch
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from wallet.middleware import ReplicaRoutingMiddleware
+from wallet.models import UserBalance
+from wallet.routers import PrimaryReplicaRouter, use_replicas, replica_reads_enabled
+
+
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    """
+    Тесты маршрутизатора на двух файлах SQLite вместо основной базы и реплики
+    """
+
+    def setUp(self):
+        """
+        Основная база, рабочая реплика и реплика в несуществующем каталоге
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('primary.sqlite3', 'replica.sqlite3'):
+            sqlite3.connect(os.path.join(self.tmpdir, name)).close()
+
+        self.handler = ConnectionHandler({
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(self.tmpdir, 'primary.sqlite3'),
+            },
+            'replica_ok': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(self.tmpdir, 'replica.sqlite3'),
+            },
+            'replica_down': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(self.tmpdir, 'missing', 'replica.sqlite3'),
+            },
+        })
+
+    def tearDown(self):
+        self.handler.close_all()
+        shutil.rmtree(self.tmpdir)
+
+    def make_router(self, replicas):
+        return PrimaryReplicaRouter(replicas=replicas, connection_handler=self.handler)
+
+    def test_reads_go_to_primary_outside_replica_context(self):
+        """
+        Тест: без разрешения чтение идет в основную базу
+        """
+        router = self.make_router(['replica_ok'])
+
+        self.assertIsNone(router.db_for_read(UserBalance))
+        self.assertEqual(router.db_for_write(UserBalance), 'default')
+
+    def test_reads_go_to_replica_inside_context(self):
+        """
+        Тест: в контексте use_replicas чтение идет в реплику, запись - в основную базу
+        """
+        router = self.make_router(['replica_ok'])
+
+        with use_replicas():
+            self.assertEqual(router.db_for_read(UserBalance), 'replica_ok')
+            self.assertEqual(router.db_for_write(UserBalance), 'default')
+        self.assertFalse(replica_reads_enabled())
+
+    def test_unavailable_replica_is_skipped(self):
+        """
+        Тест: недоступная реплика исключается из выбора
+        """
+        router = self.make_router(['replica_down', 'replica_ok'])
+
+        with use_replicas():
+            for _ in range(5):
+                self.assertEqual(router.db_for_read(UserBalance), 'replica_ok')
+        self.assertIn('replica_down', router._down_until)
+
+    def test_fallback_to_primary_when_all_replicas_down(self):
+        """
+        Тест: при недоступности всех реплик чтение идет в основную базу
+        """
+        router = self.make_router(['replica_down'])
+
+        with use_replicas():
+            self.assertEqual(router.db_for_read(UserBalance), 'default')
+
+    def test_migrations_are_not_applied_to_replicas(self):
+        """
+        Тест: миграции применяются только к основной базе
+        """
+        router = self.make_router(['replica_ok'])
+
+        self.assertTrue(router.allow_migrate('default', 'wallet'))
+        self.assertFalse(router.allow_migrate('replica_ok', 'wallet'))
+
+
+@override_settings(REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingMiddlewareTest(TestCase):
+    """
+    Тесты мидлвеара выбора реплики и закрепления за основной базой
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        cache.clear()
+        # Маркер в кэше используется только с общим для процессов кэшем
+        shared = patch('wallet.middleware.cache_is_shared', return_value=True)
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='user1', password='testpass123')
+        self.seen = []
+
+        def get_response(request):
+            self.seen.append(replica_reads_enabled())
+            return HttpResponse(status=200)
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+
+    def make_request(self, method, **extra):
+        request = getattr(self.factory, method)('/api/wallet/balance/', **extra)
+        request.user = self.user
+        return request
+
+    def test_safe_request_reads_from_replicas(self):
+        """
+        Тест: GET запрос читает из реплик, после ответа контекст сбрасывается
+        """
+        self.middleware(self.make_request('get'))
+
+        self.assertEqual(self.seen, [True])
+        self.assertFalse(replica_reads_enabled())
+
+    def test_write_request_uses_primary_and_pins(self):
+        """
+        Тест: POST запрос идет в основную базу и закрепляет клиента за ней
+        """
+        response = self.middleware(self.make_request('post'))
+
+        self.assertEqual(self.seen, [False])
+        self.assertIn(ReplicaRoutingMiddleware.PIN_COOKIE, response.cookies)
+        self.assertTrue(cache.get(f'replica_pin:user:{self.user.pk}'))
+
+    def test_pinned_user_reads_from_primary(self):
+        """
+        Тест: после записи пользователь читает из основной базы
+        """
+        self.middleware(self.make_request('post'))
+        self.middleware(self.make_request('get'))
+
+        self.assertEqual(self.seen, [False, False])
+
+    def test_pinned_by_authorization_header(self):
+        """
+        Тест: закрепление по заголовку Authorization для клиентов без cookie
+        """
+        self.middleware(self.make_request('post', HTTP_AUTHORIZATION='Token abc'))
+        cache.delete(f'replica_pin:user:{self.user.pk}')
+
+        request = self.make_request('get', HTTP_AUTHORIZATION='Token abc')
+        request.user = User()
+        self.middleware(request)
+
+        self.assertEqual(self.seen, [False, False])
+
+    def test_pinned_by_cookie(self):
+        """
+        Тест: закрепление по cookie
+        """
+        request = self.make_request('get')
+        request.COOKIES[ReplicaRoutingMiddleware.PIN_COOKIE] = '1'
+        self.middleware(request)
+
+        self.assertEqual(self.seen, [False])
+
+    def test_failed_write_does_not_pin(self):
+        """
+        Тест: неуспешный изменяющий запрос не закрепляет клиента
+        """
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse(status=400))
+        response = middleware(self.make_request('post'))
+
+        self.assertNotIn(ReplicaRoutingMiddleware.PIN_COOKIE, response.cookies)
+
+    def test_process_local_cache_not_used_for_pin(self):
+        """
+        Тест: с кэшем в памяти процесса закрепление работает только через cookie
+        """
+        with patch('wallet.middleware.cache_is_shared', return_value=False):
+            response = self.middleware(self.make_request('post'))
+            self.middleware(self.make_request('get'))
+
+        self.assertIn(ReplicaRoutingMiddleware.PIN_COOKIE, response.cookies)
+        self.assertIsNone(cache.get(f'replica_pin:user:{self.user.pk}'))
+        self.assertEqual(self.seen, [False, True])
+
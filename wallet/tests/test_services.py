@@ -0,0 +1,356 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from wallet.models import BalanceShard, UserBalance, Transaction
+from wallet.reconciliation import find_mismatches
+from wallet.services import (
+    InsufficientFunds, VersionConflict, compare_and_set, configure_shards, credit, debit,
+    deposit, lock_balance, rebalance, transfer, with_retries
+)
+
+
+class ShardedBalanceServiceTest(TestCase):
+    """
+    Тесты зачислений и списаний для горячих счетов
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных: горячий счет с четырьмя слотами
+        """
+        self.merchant = User.objects.create_user(username='merchant', password='testpass123')
+        self.balance = UserBalance.objects.create(user=self.merchant, balance_kopecks=1000)
+        with transaction.atomic():
+            self.balance = configure_shards(self.balance, 4)
+
+    def test_configure_creates_slots(self):
+        """
+        Тест: настройка создает слоты с нулевым балансом
+        """
+        self.assertEqual(self.balance.shard_count, 4)
+        self.assertEqual(
+            list(self.balance.shards.order_by('slot').values_list('slot', 'balance_kopecks')),
+            [(0, 0), (1, 0), (2, 0), (3, 0)]
+        )
+
+    def test_credit_goes_to_slot(self):
+        """
+        Тест: зачисление меняет слот, а не основную строку
+        """
+        with transaction.atomic():
+            user_balance, balance_after = credit(self.merchant, 500)
+
+        self.balance.refresh_from_db()
+        self.assertIsNone(balance_after)
+        self.assertEqual(self.balance.balance_kopecks, 1000)
+        self.assertEqual(self.balance.get_total_kopecks(), 1500)
+
+    def test_debit_takes_from_slots(self):
+        """
+        Тест: при нехватке средств в основной строке списание забирает остаток из слотов
+        """
+        BalanceShard.objects.filter(user_balance=self.balance, slot__in=[1, 2]).update(balance_kopecks=300)
+
+        with transaction.atomic():
+            debit(lock_balance(self.merchant), 1200)
+
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.balance_kopecks, 0)
+        self.assertEqual(self.balance.get_total_kopecks(), 400)
+
+    def test_debit_insufficient_funds(self):
+        """
+        Тест: списание больше полного баланса отклоняется
+        """
+        with self.assertRaises(InsufficientFunds):
+            with transaction.atomic():
+                debit(lock_balance(self.merchant), 1001)
+
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.get_total_kopecks(), 1000)
+
+    def test_rebalance_moves_slots_to_main_row(self):
+        """
+        Тест: перенос собирает средства слотов в основную строку
+        """
+        BalanceShard.objects.filter(user_balance=self.balance).update(balance_kopecks=100)
+
+        with transaction.atomic():
+            moved = rebalance(self.balance)
+
+        self.balance.refresh_from_db()
+        self.assertEqual(moved, 400)
+        self.assertEqual(self.balance.balance_kopecks, 1400)
+        self.assertEqual(self.balance.get_total_kopecks(), 1400)
+
+    def test_reducing_slots_keeps_funds(self):
+        """
+        Тест: удаляемые слоты переносятся в основную строку
+        """
+        BalanceShard.objects.filter(user_balance=self.balance, slot=3).update(balance_kopecks=250)
+
+        with transaction.atomic():
+            configure_shards(self.balance, 2)
+
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.shards.count(), 2)
+        self.assertEqual(self.balance.balance_kopecks, 1250)
+
+
+class ShardedBalanceViewsTest(TestCase):
+    """
+    Тесты API для горячего счета
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.client = APIClient()
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.merchant = User.objects.create_user(username='merchant', password='testpass123')
+        UserBalance.objects.create(user=self.sender, balance_kopecks=10000)
+        self.merchant_balance = UserBalance.objects.create(user=self.merchant, balance_kopecks=0)
+        with transaction.atomic():
+            configure_shards(self.merchant_balance, 4)
+
+    def transfer(self, amount_kopecks):
+        self.client.force_authenticate(user=self.sender)
+        return self.client.post(
+            reverse('transfer_money'),
+            {'recipient_id': self.merchant.id, 'amount_kopecks': amount_kopecks},
+            format='json'
+        )
+
+    def test_transfers_to_hot_account(self):
+        """
+        Тест: баланс горячего счета - сумма слотов, сверка не находит расхождений
+        """
+        for _ in range(5):
+            self.assertEqual(self.transfer(1000).status_code, 200)
+
+        self.client.force_authenticate(user=self.merchant)
+        response = self.client.get(reverse('get_balance'))
+
+        self.assertEqual(response.data['balance_rubles'], 50.0)
+        checked, mismatches = find_mismatches(0, 10 ** 9, user_ids=[self.merchant.id])
+        self.assertEqual(mismatches, {})
+
+    def test_hot_account_pays_from_slots(self):
+        """
+        Тест: горячий счет может потратить средства, лежащие в слотах
+        """
+        self.transfer(3000)
+        self.client.force_authenticate(user=self.merchant)
+
+        response = self.client.post(
+            reverse('transfer_money'),
+            {'recipient_id': self.sender.id, 'amount_kopecks': 3000},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.merchant_balance.refresh_from_db()
+        self.assertEqual(self.merchant_balance.get_total_kopecks(), 0)
+
+    def test_balance_at_without_stored_balance(self):
+        """
+        Тест: баланс на момент времени для операций без balance_after считается по истории
+        """
+        self.transfer(1000)
+        self.transfer(2000)
+        self.assertFalse(
+            Transaction.objects.filter(account=self.merchant, balance_after_kopecks__isnull=False).exists()
+        )
+
+        self.client.force_authenticate(user=self.merchant)
+        response = self.client.get(
+            reverse('get_balance_at'),
+            {'ts': (timezone.now() + timedelta(seconds=1)).isoformat()}
+        )
+
+        self.assertEqual(response.data['balance_kopecks'], 3000)
+
+    def test_balance_at_starts_from_stored_balance(self):
+        """
+        Тест: суммируются только операции после ближайшей операции с сохраненным балансом
+        """
+        # Баланс последней заполненной операции не совпадает с суммой истории до нее:
+        # если бы история суммировалась целиком, ответ был бы 1500
+        Transaction.objects.create(
+            to_user=self.merchant,
+            account=self.merchant,
+            amount_kopecks=500,
+            transaction_type=Transaction.TransactionType.DEPOSIT,
+            balance_after_kopecks=7000
+        )
+        self.transfer(1000)
+
+        self.client.force_authenticate(user=self.merchant)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('get_balance_at'),
+                {'ts': (timezone.now() + timedelta(seconds=1)).isoformat()}
+            )
+
+        self.assertEqual(response.data['balance_kopecks'], 8000)
+
+
+@override_settings(BALANCE_WRITE_MODE='optimistic', BALANCE_OPTIMISTIC_RETRIES=2)
+class OptimisticWriteModeTest(TestCase):
+    """
+    Тесты оптимистичного режима изменения балансов
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.balance1 = UserBalance.objects.create(user=self.user1, balance_kopecks=10000)
+
+    def test_save_increments_version(self):
+        """
+        Тест: любое сохранение баланса меняет версию
+        """
+        self.balance1.balance_kopecks = 5000
+        self.balance1.save()
+
+        self.balance1.refresh_from_db()
+        self.assertEqual(self.balance1.version, 1)
+
+    def test_deposit_and_transfer(self):
+        """
+        Тест: пополнение и перевод без блокировок меняют баланс и версию
+        """
+        deposit(self.user1, 500)
+        result = transfer(self.user1, self.user2, 3000)
+
+        self.balance1.refresh_from_db()
+        self.assertEqual(self.balance1.balance_kopecks, 7500)
+        self.assertEqual(self.balance1.version, 2)
+        self.assertEqual(result['recipient_new_balance_kopecks'], 3000)
+        self.assertEqual(
+            Transaction.objects.get(id=result['transaction_ids'][0]).balance_after_kopecks, 7500
+        )
+
+    def test_stale_version_conflicts(self):
+        """
+        Тест: изменение по устаревшей версии отклоняется
+        """
+        stale = UserBalance.objects.get(pk=self.balance1.pk)
+        compare_and_set(self.balance1, 100)
+
+        with self.assertRaises(VersionConflict):
+            compare_and_set(stale, 100)
+
+        self.balance1.refresh_from_db()
+        self.assertEqual(self.balance1.balance_kopecks, 10100)
+
+    def test_conflict_is_retried(self):
+        """
+        Тест: конфликт повторяется, пока не будет исчерпан лимит попыток
+        """
+        calls = []
+
+        def operation():
+            calls.append(1)
+            if len(calls) < 3:
+                raise VersionConflict()
+            return 'ok'
+
+        self.assertEqual(with_retries(operation), 'ok')
+
+        def always_conflicts():
+            calls.append(1)
+            raise VersionConflict()
+
+        calls.clear()
+        with self.assertRaises(VersionConflict):
+            with_retries(always_conflicts)
+        self.assertEqual(len(calls), 3)
+
+    def test_persistent_conflict_returns_409(self):
+        """
+        Тест: неразрешенный конфликт возвращает 409 и не меняет баланс
+        """
+        client = APIClient()
+        client.force_authenticate(user=self.user1)
+
+        with mock.patch('wallet.services.compare_and_set', side_effect=VersionConflict()):
+            response = client.post(reverse('deposit_balance'), {'amount_kopecks': 500}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.balance1.refresh_from_db()
+        self.assertEqual(self.balance1.balance_kopecks, 10000)
+
+
+class AccountActivityTest(TestCase):
+    """
+    Тесты счетчиков операций счета
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        UserBalance.objects.create(user=self.user1, balance_kopecks=0)
+
+    def assertActivity(self, user, count, deposited, sent, received):
+        activity = UserBalance.objects.get(user=user).get_activity()
+        self.assertEqual(
+            (activity['transaction_count'], activity['total_deposited_kopecks'],
+             activity['total_sent_kopecks'], activity['total_received_kopecks']),
+            (count, deposited, sent, received)
+        )
+        last = Transaction.objects.filter(account=user).order_by('-id').first()
+        self.assertEqual(activity['last_transaction_id'], last.id)
+        self.assertEqual(activity['last_transaction_at'], last.created_at)
+
+    def test_deposit_and_transfer(self):
+        """
+        Тест: операции обновляют счетчики обоих счетов
+        """
+        deposit(self.user1, 5000)
+        transfer(self.user1, self.user2, 1200)
+        transfer(self.user1, self.user2, 300)
+
+        self.assertActivity(self.user1, 3, 5000, 1500, 0)
+        self.assertActivity(self.user2, 2, 0, 0, 1500)
+
+    @override_settings(BALANCE_WRITE_MODE='optimistic')
+    def test_optimistic_mode(self):
+        """
+        Тест: счетчики обновляются и без блокировок
+        """
+        deposit(self.user1, 5000)
+        transfer(self.user1, self.user2, 1000)
+
+        self.assertActivity(self.user1, 2, 5000, 1000, 0)
+        self.assertActivity(self.user2, 1, 0, 0, 1000)
+
+    def test_hot_account_counts_in_slots(self):
+        """
+        Тест: зачисления на горячий счет учитываются в слотах, сводка их складывает
+        """
+        with transaction.atomic():
+            configure_shards(UserBalance.objects.get(user=self.user1), 4)
+        deposit(self.user1, 700)
+        deposit(self.user1, 300)
+
+        self.assertEqual(UserBalance.objects.get(user=self.user1).transaction_count, 0)
+        self.assertActivity(self.user1, 2, 1000, 0, 0)
+
+        with transaction.atomic():
+            configure_shards(UserBalance.objects.get(user=self.user1), 0)
+        self.assertEqual(UserBalance.objects.get(user=self.user1).transaction_count, 2)
+        self.assertActivity(self.user1, 2, 1000, 0, 0)
+
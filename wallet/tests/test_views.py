@@ -4,7 +4,11 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from unittest.mock import patch
-from wallet.models import UserBalance, Transaction
+from datetime import timedelta
+from django.utils import timezone
+from django.db.models import QuerySet
+from wallet.models import LedgerSnapshot, UserBalance, Transaction
+from wallet.services import deposit, transfer
 
 
 class BaseAPITestCase(TestCase):
@@ -80,6 +84,157 @@ class GetBalanceViewTest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+    def test_get_balance_existing_without_write(self):
+        """
+        Тест: существующий баланс читается без get_or_create, который идет в основную базу
+        """
+        UserBalance.objects.create(user=self.user1, balance_kopecks=100)
+
+        with patch.object(QuerySet, 'get_or_create') as get_or_create:
+            response = self.client.get(reverse('get_balance'))
+
+        self.assertEqual(response.data['balance_rubles'], 1.0)
+        get_or_create.assert_not_called()
+
+
+class GetSummaryViewTest(BaseAPITestCase):
+    """
+    Тесты для получения сводки по счету
+    """
+
+    def test_summary(self):
+        """
+        Тест: сводка возвращает счетчики операций счета
+        """
+        deposit(self.user1, 10000)
+        transfer(self.user1, self.user2, 2550)
+
+        response = self.client.get(reverse('get_summary'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'user1')
+        self.assertEqual(response.data['balance_rubles'], 74.5)
+        self.assertEqual(response.data['transaction_count'], 2)
+        self.assertEqual(response.data['total_deposited_rubles'], 100.0)
+        self.assertEqual(response.data['total_sent_rubles'], 25.5)
+        self.assertEqual(response.data['total_received_rubles'], 0.0)
+        self.assertEqual(
+            response.data['last_transaction_id'], Transaction.objects.filter(account=self.user1).latest('id').id
+        )
+
+    def test_summary_new_user(self):
+        """
+        Тест: у нового пользователя сводка пустая
+        """
+        response = self.client.get(reverse('get_summary'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transaction_count'], 0)
+        self.assertIsNone(response.data['last_transaction_id'])
+
+
+class GetBalanceAtViewTest(BaseAPITestCase):
+    """
+    Тесты для view получения баланса на момент времени
+    """
+
+    def test_get_balance_at_uses_last_entry_before_ts(self):
+        """
+        Тест выбора последней операции не позднее ts
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 1000})
+        first = Transaction.objects.get(account=self.user1)
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 2500})
+        
+        Transaction.objects.filter(pk=first.pk).update(created_at=first.created_at - timedelta(days=1))
+        ts = first.created_at - timedelta(hours=1)
+        
+        response = self.client.get(reverse('get_balance_at'), {'ts': ts.isoformat()})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance_kopecks'], 1000)
+        self.assertEqual(response.data['balance_rubles'], 10.0)
+        self.assertEqual(response.data['transaction_id'], first.pk)
+
+    def test_get_balance_at_current(self):
+        """
+        Тест баланса на текущий момент после пополнения
+        """
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 1000})
+        self.client.post(reverse('deposit_balance'), {'amount_kopecks': 2500})
+        
+        response = self.client.get(reverse('get_balance_at'), {'ts': timezone.now().isoformat()})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance_kopecks'], 3500)
+
+    def test_get_balance_at_before_history(self):
+        """
+        Тест нулевого баланса до первой операции
+        """
+        response = self.client.get(reverse('get_balance_at'), {'ts': '2000-01-01T00:00:00'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance_kopecks'], 0)
+        self.assertIsNone(response.data['transaction_id'])
+
+    def test_get_balance_at_archived_history(self):
+        """
+        Тест баланса по итогам архива и ответа 410 для заархивированного периода
+        """
+        archived_before = timezone.now() - timedelta(days=30)
+        LedgerSnapshot.objects.create(
+            account=self.user1,
+            archived_before=archived_before,
+            net_kopecks=4200,
+            transaction_count=3,
+            balance_after_kopecks=4200
+        )
+        
+        response = self.client.get(reverse('get_balance_at'), {'ts': timezone.now().isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance_kopecks'], 4200)
+        
+        ts = (archived_before - timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('get_balance_at'), {'ts': ts})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_get_balance_at_archived_without_stored_balance(self):
+        """
+        Тест баланса по сумме архива, если последняя операция архива без balance_after
+        """
+        LedgerSnapshot.objects.create(
+            account=self.user1,
+            archived_before=timezone.now() - timedelta(days=30),
+            net_kopecks=4200,
+            transaction_count=3,
+            balance_after_kopecks=None
+        )
+
+        response = self.client.get(reverse('get_balance_at'), {'ts': timezone.now().isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance_kopecks'], 4200)
+
+    def test_get_balance_at_invalid_ts(self):
+        """
+        Тест некорректного параметра ts
+        """
+        response = self.client.get(reverse('get_balance_at'), {'ts': 'yesterday'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+    def test_get_balance_at_impossible_date(self):
+        """
+        Тест ts в формате ISO 8601 с несуществующей датой
+        """
+        response = self.client.get(reverse('get_balance_at'), {'ts': '2024-13-45T00:00:00'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+
 class DepositBalanceViewTest(BaseAPITestCase):
     """
     Тесты для view пополнения баланса
@@ -307,6 +462,27 @@ class TransferMoneyViewTest(TransactionTestCase):
         self.assertEqual(outgoing.amount_kopecks, 3000)
         self.assertEqual(incoming.amount_kopecks, 3000)
 
+    def test_transfer_money_records_balance_after(self):
+        """
+        Тест записи баланса после операции для обеих сторон перевода
+        """
+        UserBalance.objects.create(user=self.user1, balance_kopecks=10000)
+        UserBalance.objects.create(user=self.user2, balance_kopecks=500)
+        
+        url = reverse('transfer_money')
+        data = {'recipient_id': self.user2.id, 'amount_kopecks': 3000}
+        response = self.client.post(url, data)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        outgoing = Transaction.objects.get(transaction_type=Transaction.TransactionType.TRANSFER_OUT)
+        incoming = Transaction.objects.get(transaction_type=Transaction.TransactionType.TRANSFER_IN)
+        
+        self.assertEqual(outgoing.account, self.user1)
+        self.assertEqual(outgoing.balance_after_kopecks, 7000)
+        self.assertEqual(incoming.account, self.user2)
+        self.assertEqual(incoming.balance_after_kopecks, 3500)
+
     def test_transfer_money_zero_balance_sender(self):
         """
         Тест перевода при нулевом балансе отправителя
@@ -430,4 +606,126 @@ class GetTransactionsViewTest(BaseAPITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) 
\ No newline at end of file
+        self.assertEqual(len(response.data), 2) 
+
+    def test_get_transactions_search(self):
+        """
+        Тест: параметр q отбирает операции по описанию только среди своих
+        """
+        Transaction.objects.create(
+            to_user=self.user1,
+            amount_kopecks=1000,
+            transaction_type=Transaction.TransactionType.DEPOSIT,
+            description='Пополнение с карты'
+        )
+        Transaction.objects.create(
+            to_user=self.user1,
+            amount_kopecks=2000,
+            transaction_type=Transaction.TransactionType.DEPOSIT,
+            description='Возврат'
+        )
+        Transaction.objects.create(
+            to_user=self.user2,
+            amount_kopecks=3000,
+            transaction_type=Transaction.TransactionType.DEPOSIT,
+            description='Пополнение с карты'
+        )
+
+        url = reverse('get_transactions')
+        response = self.client.get(url, {'q': 'карты'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['amount_rubles'] for item in response.data], [10.0])
+        self.assertEqual(len(self.client.get(url).data), 2)
+
+class GetTransactionsDeltaViewTest(BaseAPITestCase):
+    """
+    Тесты для синхронизации истории по отметке since_id / since_ts
+    """
+
+    def setUp(self):
+        """
+        Настройка тестовых данных
+        """
+        super().setUp()
+        self.t1 = Transaction.objects.create(
+            to_user=self.user1,
+            amount_kopecks=1000,
+            transaction_type=Transaction.TransactionType.DEPOSIT
+        )
+        Transaction.objects.create(
+            to_user=self.user2,
+            amount_kopecks=5000,
+            transaction_type=Transaction.TransactionType.DEPOSIT
+        )
+        self.t2 = Transaction.objects.create(
+            from_user=self.user1,
+            to_user=self.user2,
+            amount_kopecks=500,
+            transaction_type=Transaction.TransactionType.TRANSFER_OUT
+        )
+        self.t3 = Transaction.objects.create(
+            from_user=self.user2,
+            to_user=self.user1,
+            amount_kopecks=300,
+            transaction_type=Transaction.TransactionType.TRANSFER_IN
+        )
+
+    def test_since_id_returns_newer_in_ascending_order(self):
+        """
+        Тест: возвращаются только операции пользователя новее since_id по возрастанию
+        """
+        response = self.client.get(reverse('get_transactions'), {'since_id': self.t1.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.t2.id, self.t3.id])
+        self.assertEqual(response.data['next_since_id'], self.t3.id)
+        self.assertFalse(response.data['has_more'])
+
+    def test_since_id_up_to_date(self):
+        """
+        Тест: при актуальной отметке ответ пустой, отметка не меняется
+        """
+        response = self.client.get(reverse('get_transactions'), {'since_id': self.t3.id})
+
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['next_since_id'], self.t3.id)
+
+    def test_since_id_pages_with_limit(self):
+        """
+        Тест: limit ограничивает пачку, has_more сообщает о продолжении
+        """
+        response = self.client.get(reverse('get_transactions'), {'since_id': 0, 'limit': 2})
+
+        self.assertEqual([row['id'] for row in response.data['results']], [self.t1.id, self.t2.id])
+        self.assertTrue(response.data['has_more'])
+
+        response = self.client.get(
+            reverse('get_transactions'), {'since_id': response.data['next_since_id'], 'limit': 2}
+        )
+        self.assertEqual([row['id'] for row in response.data['results']], [self.t3.id])
+        self.assertFalse(response.data['has_more'])
+
+    def test_since_ts(self):
+        """
+        Тест: since_ts возвращает операции, созданные позже момента
+        """
+        Transaction.objects.filter(pk=self.t1.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+        response = self.client.get(
+            reverse('get_transactions'), {'since_ts': (timezone.now() - timedelta(days=1)).isoformat()}
+        )
+
+        self.assertEqual([row['id'] for row in response.data['results']], [self.t2.id, self.t3.id])
+        self.assertEqual(response.data['next_since_id'], self.t3.id)
+
+    def test_invalid_params(self):
+        """
+        Тест: некорректные отметки отклоняются
+        """
+        for params in (
+            {'since_id': 'abc'}, {'since_id': -1}, {'since_id': 1, 'limit': 0}, {'since_ts': 'вчера'},
+            {'since_ts': '2024-13-45T00:00:00'},
+        ):
+            response = self.client.get(reverse('get_transactions'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -3,7 +3,11 @@ from . import views
 
 urlpatterns = [
     path('balance/', views.get_balance, name='get_balance'),
+    path('balance/at/', views.get_balance_at, name='get_balance_at'),
+    path('summary/', views.get_summary, name='get_summary'),
     path('deposit/', views.deposit_balance, name='deposit_balance'),
     path('transfer/', views.transfer_money, name='transfer_money'),
     path('transactions/', views.get_transactions, name='get_transactions'),
+    path('events/', views.balance_events, name='balance_events'),
+    path('metrics/', views.get_metrics, name='get_metrics'),
 ] 
\ No newline at end of file
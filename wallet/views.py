@@ -1,23 +1,37 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from rest_framework import status
+from rest_framework import exceptions, status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import logging
 from django.contrib.auth import logout
-from django.http import JsonResponse, HttpResponseRedirect
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import resolve_url
 
-from .models import UserBalance, Transaction
+from .authentication import basic_auth_cache, invalidate_user_tokens, token_cache
+from .coalescing import coalesce, reads
+from .events import balance_changed, broker, event_stream, next_message
+from .models import LedgerSnapshot, UserBalance, Transaction
+from .reconciliation import SIGNED_AMOUNT
+from .search import search_transactions
+from .group_commit import committer, deposit, transfer
+from .outbox import backlog_stats
+from .services import InsufficientFunds, VersionConflict
 from .serializers import (
-    BalanceSerializer, DepositSerializer, 
+    AccountSummarySerializer, BalanceSerializer, DepositSerializer, 
     TransferSerializer, TransactionSerializer
 )
 
@@ -26,6 +40,9 @@ transaction_logger = logging.getLogger('wallet.transactions')
 security_logger = logging.getLogger('wallet.security')
 auth_logger = logging.getLogger('wallet.auth')
 
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -36,20 +53,27 @@ def get_balance(request):
     try:
         logger.info(f"Запрос баланса пользователя: {request.user.username} (ID: {request.user.id})")
         
-        user_balance, created = UserBalance.objects.get_or_create(user=request.user)
-        
-        if created:
-            logger.info(f"Создан новый баланс для пользователя {request.user.username}: 0.00 руб")
-            transaction_logger.info(f"BALANCE_CREATED | user={request.user.username} | balance=0.00")
+        def load_balance():
+            # Чтение идет в реплику; get_or_create пишет в основную базу, поэтому
+            # нужен только новому пользователю или при отставании реплики
+            user_balance = UserBalance.objects.filter(user=request.user).first()
+            if user_balance is None:
+                user_balance, created = UserBalance.objects.get_or_create(user=request.user)
+
+                if created:
+                    logger.info(f"Создан новый баланс для пользователя {request.user.username}: 0.00 руб")
+                    transaction_logger.info(f"BALANCE_CREATED | user={request.user.username} | balance=0.00")
+
+            return BalanceSerializer(user_balance).data
+
+        data = coalesce(request, 'balance', load_balance)
         
-        balance_rubles = float(user_balance.get_balance_rubles())
+        balance_rubles = data['balance_rubles']
         logger.debug(f"Текущий баланс пользователя {request.user.username}: {balance_rubles} руб")
         
-        serializer = BalanceSerializer(user_balance)
-        
         transaction_logger.info(f"BALANCE_VIEW | user={request.user.username} | balance={balance_rubles}")
         
-        return Response(serializer.data)
+        return Response(data)
         
     except Exception as e:
         logger.error(f"Ошибка при получении баланса пользователя {request.user.username}: {str(e)}")
@@ -60,6 +84,142 @@ def get_balance(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_summary(request):
+    """
+    Сводка по счету: баланс, количество операций, суммы пополнений, исходящих
+    и входящих переводов и последняя операция. Все значения читаются
+    из счетчиков UserBalance (и слотов горячего счета) без агрегации по истории
+    """
+    try:
+        logger.info(f"Запрос сводки по счету пользователя: {request.user.username}")
+
+        def load_summary():
+            user_balance = UserBalance.objects.select_related('user').filter(user=request.user).first()
+            if user_balance is None:
+                user_balance, created = UserBalance.objects.select_related('user').get_or_create(user=request.user)
+            return AccountSummarySerializer(user_balance).data
+
+        data = coalesce(request, 'summary', load_summary)
+
+        transaction_logger.info(
+            f"SUMMARY_VIEW | user={request.user.username} | count={data['transaction_count']}"
+        )
+        return Response(data)
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении сводки по счету пользователя {request.user.username}: {str(e)}")
+        security_logger.error(f"SUMMARY_ERROR | user={request.user.username} | error={str(e)}")
+        return Response(
+            {'error': 'Ошибка при получении сводки по счету'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+def snapshot_balance(snapshot):
+    """
+    Баланс счета на конец заархивированной истории. Если последняя
+    операция архива была записана без баланса (горячий счет), баланс
+    равен сумме всех операций архива
+    """
+    if snapshot is None:
+        return 0
+    if snapshot.balance_after_kopecks is not None:
+        return snapshot.balance_after_kopecks
+    return snapshot.net_kopecks
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_balance_at(request):
+    """
+    Получение баланса пользователя на указанный момент времени (?ts=ISO 8601)
+
+    Баланс берется из поля balance_after_kopecks последней операции счета
+    не позднее ts - один поиск по индексу (account, created_at).
+    Для моментов до начала живой истории используются итоги архива.
+    """
+    raw_ts = request.query_params.get('ts')
+    try:
+        ts = parse_datetime(raw_ts) if raw_ts else None
+    except ValueError:
+        # Строка в формате ISO 8601, но с несуществующей датой (2024-13-45)
+        ts = None
+    if ts is None:
+        logger.warning(f"Некорректный параметр ts от пользователя {request.user.username}: {raw_ts}")
+        return Response(
+            {'error': 'Параметр ts обязателен и должен быть в формате ISO 8601'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+
+    try:
+        logger.info(f"Запрос баланса пользователя {request.user.username} на момент {ts.isoformat()}")
+
+        last_entry = Transaction.objects.filter(
+            account=request.user,
+            created_at__lte=ts
+        ).order_by('-created_at', '-id').values('id', 'created_at', 'balance_after_kopecks').first()
+
+        if last_entry and last_entry['balance_after_kopecks'] is None:
+            # Операции горячего счета записываются без баланса до заполнения backfill_balance_after:
+            # баланс берется у ближайшей более ранней операции с балансом, и к нему добавляются
+            # только операции после нее, а не вся история счета
+            history = Transaction.objects.filter(account=request.user).filter(
+                Q(created_at__lt=last_entry['created_at'])
+                | Q(created_at=last_entry['created_at'], id__lte=last_entry['id'])
+            )
+            anchor = history.filter(balance_after_kopecks__isnull=False).order_by(
+                '-created_at', '-id'
+            ).values('id', 'created_at', 'balance_after_kopecks').first()
+            if anchor:
+                start_kopecks = anchor['balance_after_kopecks']
+                history = history.filter(
+                    Q(created_at__gt=anchor['created_at'])
+                    | Q(created_at=anchor['created_at'], id__gt=anchor['id'])
+                )
+            else:
+                start_kopecks = snapshot_balance(LedgerSnapshot.objects.filter(account=request.user).first())
+            balance_kopecks = start_kopecks + (history.aggregate(total=Sum(SIGNED_AMOUNT))['total'] or 0)
+        elif last_entry:
+            balance_kopecks = last_entry['balance_after_kopecks']
+        else:
+            # Более ранняя история могла быть выгружена в архив
+            snapshot = LedgerSnapshot.objects.filter(account=request.user).first()
+            if snapshot is None:
+                balance_kopecks = 0
+            elif ts >= snapshot.archived_before:
+                balance_kopecks = snapshot_balance(snapshot)
+            else:
+                return Response(
+                    {'error': 'История операций на этот момент перенесена в архив'},
+                    status=status.HTTP_410_GONE
+                )
+
+        transaction_logger.info(
+            f"BALANCE_AT_VIEW | user={request.user.username} | ts={ts.isoformat()} | "
+            f"balance={float(balance_kopecks / 100)}"
+        )
+
+        return Response({
+            'username': request.user.username,
+            'ts': ts,
+            'balance_kopecks': balance_kopecks,
+            'balance_rubles': float(balance_kopecks / 100),
+            'transaction_id': last_entry['id'] if last_entry else None,
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении баланса на момент времени для {request.user.username}: {str(e)}")
+        security_logger.error(f"BALANCE_AT_ERROR | user={request.user.username} | error={str(e)}")
+        return Response(
+            {'error': 'Ошибка при получении баланса'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def deposit_balance(request):
@@ -120,42 +280,37 @@ def deposit_balance(request):
     amount_rubles = float(amount_kopecks / 100)
     
     try:
-        with transaction.atomic():
-            logger.debug(f"Начало транзакции пополнения для {request.user.username} на {amount_rubles} руб")
-            
-            user_balance, created = UserBalance.objects.select_for_update().get_or_create(
-                user=request.user
-            )
-            
-            old_balance = user_balance.balance_kopecks
-            old_balance_rubles = float(old_balance / 100)
-            
-            user_balance.balance_kopecks += amount_kopecks
-            user_balance.save()
-            
-            new_balance_rubles = float(user_balance.get_balance_rubles())
-            
-            # Создание записи транзакции
-            transaction_record = Transaction.objects.create(
-                to_user=request.user,
-                amount_kopecks=amount_kopecks,
-                transaction_type=Transaction.TransactionType.DEPOSIT,
-                description=f"Пополнение баланса на {amount_kopecks} копеек"
-            )
-            
-            logger.info(f"Успешное пополнение баланса пользователя {request.user.username}: {amount_rubles} руб")
-            transaction_logger.info(
-                f"DEPOSIT_SUCCESS | user={request.user.username} | amount={amount_rubles} | "
-                f"old_balance={old_balance_rubles} | new_balance={new_balance_rubles} | "
-                f"transaction_id={transaction_record.id}"
-            )
+        logger.debug(f"Начало транзакции пополнения для {request.user.username} на {amount_rubles} руб")
+        
+        result = deposit(request.user, amount_kopecks)
+        
+        old_balance_rubles = float(result['old_balance_kopecks'] / 100)
+        new_balance_rubles = float(result['new_balance_kopecks'] / 100)
+        
+        logger.info(f"Успешное пополнение баланса пользователя {request.user.username}: {amount_rubles} руб")
+        transaction_logger.info(
+            f"DEPOSIT_SUCCESS | user={request.user.username} | amount={amount_rubles} | "
+            f"old_balance={old_balance_rubles} | new_balance={new_balance_rubles} | "
+            f"transaction_id={result['transaction_ids'][0]} | amount_kopecks={amount_kopecks} | "
+            f"old_balance_kopecks={result['old_balance_kopecks']} | new_balance_kopecks={result['new_balance_kopecks']}"
+        )
+        
+        balance_changed(request.user.id, result['new_balance_kopecks'])
+
+        return Response({
+            'message': 'Баланс успешно пополнен',
+            'deposited_amount_rubles': amount_rubles,
+            'deposited_amount_kopecks': amount_kopecks,
+            'new_balance_rubles': new_balance_rubles
+        }, status=status.HTTP_200_OK)
             
-            return Response({
-                'message': 'Баланс успешно пополнен',
-                'deposited_amount_rubles': amount_rubles,
-                'deposited_amount_kopecks': amount_kopecks,
-                'new_balance_rubles': new_balance_rubles
-            }, status=status.HTTP_200_OK)
+    except VersionConflict:
+        logger.warning(f"Конфликт версий при пополнении баланса пользователя {request.user.username}")
+        security_logger.warning(f"DEPOSIT_CONFLICT | user={request.user.username} | amount={amount_rubles}")
+        return Response(
+            {'error': 'Баланс одновременно изменяется другой операцией, повторите запрос'},
+            status=status.HTTP_409_CONFLICT
+        )
             
     except Exception as e:
         logger.error(f"Ошибка при пополнении баланса пользователя {request.user.username}: {str(e)}")
@@ -194,7 +349,7 @@ def transfer_money(request):
             return Response({
                 'description': 'Перевод денег другому пользователю',
                 'current_balance_rubles': float(user_balance.get_balance_rubles()),
-                'current_balance_kopecks': user_balance.balance_kopecks,
+                'current_balance_kopecks': user_balance.get_total_kopecks(),
                 'example': {
                     'recipient_id': sample_recipients[0]['id'] if sample_recipients else 2,
                     'amount_kopecks': 5000,
@@ -252,74 +407,52 @@ def transfer_money(request):
                 'error': 'Нельзя переводить деньги самому себе'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        with transaction.atomic():
-            logger.debug(f"Начало транзакции перевода от {request.user.username} к {recipient.username}")
-            
-            sender_balance, created = UserBalance.objects.select_for_update().get_or_create(
-                user=request.user
-            )
-            
-            if sender_balance.balance_kopecks < amount_kopecks:
-                insufficient_amount = float(sender_balance.balance_kopecks / 100)
-                logger.warning(
-                    f"Недостаточно средств для перевода: {request.user.username} "
-                    f"(нужно: {amount_rubles}, есть: {insufficient_amount})"
-                )
-                security_logger.warning(
-                    f"INSUFFICIENT_FUNDS | sender={request.user.username} | recipient={recipient.username} | "
-                    f"required={amount_rubles} | available={insufficient_amount}"
-                )
-                return Response({
-                    'error': 'Недостаточно средств на балансе'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            recipient_balance, created = UserBalance.objects.select_for_update().get_or_create(
-                user=recipient
-            )
-            
-            sender_old_balance_rubles = float(sender_balance.balance_kopecks / 100)
-            recipient_old_balance_rubles = float(recipient_balance.balance_kopecks / 100)
-            
-            sender_balance.balance_kopecks -= amount_kopecks
-            recipient_balance.balance_kopecks += amount_kopecks
-            
-            sender_balance.save()
-            recipient_balance.save()
-            
-            sender_new_balance_rubles = float(sender_balance.get_balance_rubles())
-            recipient_new_balance_rubles = float(recipient_balance.get_balance_rubles())
-            
-            transfer_out = Transaction.objects.create(
-                from_user=request.user,
-                to_user=recipient,
-                amount_kopecks=amount_kopecks,
-                transaction_type=Transaction.TransactionType.TRANSFER_OUT,
-                description=f"Перевод {amount_kopecks} копеек пользователю {recipient.username}"
-            )
-            
-            transfer_in = Transaction.objects.create(
-                from_user=request.user,
-                to_user=recipient,
-                amount_kopecks=amount_kopecks,
-                transaction_type=Transaction.TransactionType.TRANSFER_IN,
-                description=f"Получен перевод {amount_kopecks} копеек от пользователя {request.user.username}"
+        logger.debug(f"Начало транзакции перевода от {request.user.username} к {recipient.username}")
+        
+        try:
+            result = transfer(request.user, recipient, amount_kopecks)
+        except InsufficientFunds as e:
+            insufficient_amount = float(e.available_kopecks / 100)
+            logger.warning(
+                f"Недостаточно средств для перевода: {request.user.username} "
+                f"(нужно: {amount_rubles}, есть: {insufficient_amount})"
             )
-            
-            logger.info(f"Успешный перевод: {request.user.username} -> {recipient.username} ({amount_rubles} руб)")
-            transaction_logger.info(
-                f"TRANSFER_SUCCESS | sender={request.user.username} | recipient={recipient.username} | "
-                f"amount={amount_rubles} | sender_old_balance={sender_old_balance_rubles} | "
-                f"sender_new_balance={sender_new_balance_rubles} | recipient_old_balance={recipient_old_balance_rubles} | "
-                f"recipient_new_balance={recipient_new_balance_rubles} | "
-                f"out_transaction_id={transfer_out.id} | in_transaction_id={transfer_in.id}"
+            security_logger.warning(
+                f"INSUFFICIENT_FUNDS | sender={request.user.username} | recipient={recipient.username} | "
+                f"required={amount_rubles} | available={insufficient_amount}"
             )
-            
             return Response({
-                'message': 'Перевод выполнен успешно',
-                'recipient_username': recipient.username,
-                'amount_rubles': amount_rubles,
-                'new_balance_rubles': sender_new_balance_rubles
-            }, status=status.HTTP_200_OK)
+                'error': 'Недостаточно средств на балансе'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        sender_old_balance_rubles = float(result['sender_old_balance_kopecks'] / 100)
+        sender_new_balance_rubles = float(result['sender_new_balance_kopecks'] / 100)
+        recipient_old_balance_rubles = float(result['recipient_old_balance_kopecks'] / 100)
+        recipient_new_balance_rubles = float(result['recipient_new_balance_kopecks'] / 100)
+        out_transaction_id, in_transaction_id = result['transaction_ids']
+        
+        logger.info(f"Успешный перевод: {request.user.username} -> {recipient.username} ({amount_rubles} руб)")
+        transaction_logger.info(
+            f"TRANSFER_SUCCESS | sender={request.user.username} | recipient={recipient.username} | "
+            f"amount={amount_rubles} | sender_old_balance={sender_old_balance_rubles} | "
+            f"sender_new_balance={sender_new_balance_rubles} | recipient_old_balance={recipient_old_balance_rubles} | "
+            f"recipient_new_balance={recipient_new_balance_rubles} | "
+            f"out_transaction_id={out_transaction_id} | in_transaction_id={in_transaction_id} | "
+            f"amount_kopecks={amount_kopecks} | sender_old_balance_kopecks={result['sender_old_balance_kopecks']} | "
+            f"sender_new_balance_kopecks={result['sender_new_balance_kopecks']} | "
+            f"recipient_old_balance_kopecks={result['recipient_old_balance_kopecks']} | "
+            f"recipient_new_balance_kopecks={result['recipient_new_balance_kopecks']}"
+        )
+        
+        balance_changed(request.user.id, result['sender_new_balance_kopecks'])
+        balance_changed(recipient.id, result['recipient_new_balance_kopecks'])
+
+        return Response({
+            'message': 'Перевод выполнен успешно',
+            'recipient_username': recipient.username,
+            'amount_rubles': amount_rubles,
+            'new_balance_rubles': sender_new_balance_rubles
+        }, status=status.HTTP_200_OK)
             
     except User.DoesNotExist:
         logger.warning(f"Попытка перевода несуществующему пользователю (ID: {recipient_id}) от {request.user.username}")
@@ -331,6 +464,16 @@ def transfer_money(request):
             'error': 'Пользователь-получатель не найден'
         }, status=status.HTTP_404_NOT_FOUND)
         
+    except VersionConflict:
+        logger.warning(f"Конфликт версий при переводе от {request.user.username}")
+        security_logger.warning(
+            f"TRANSFER_CONFLICT | sender={request.user.username} | recipient_id={recipient_id} | amount={amount_rubles}"
+        )
+        return Response(
+            {'error': 'Баланс одновременно изменяется другой операцией, повторите запрос'},
+            status=status.HTTP_409_CONFLICT
+        )
+        
     except Exception as e:
         logger.error(f"Ошибка при переводе от {request.user.username}: {str(e)}")
         security_logger.error(
@@ -347,23 +490,37 @@ def transfer_money(request):
 @permission_classes([IsAuthenticated])
 def get_transactions(request):
     """
-    Получение истории транзакций пользователя
+    Получение истории транзакций пользователя.
+    С параметром since_id или since_ts - только операции новее отметки (см. get_transactions_delta),
+    с параметром q - только операции, в описании которых встречаются слова q
     """
+    if 'since_id' in request.query_params or 'since_ts' in request.query_params:
+        return get_transactions_delta(request)
+
+    search = request.query_params.get('q', '').strip()
+
     try:
         logger.info(f"Запрос истории транзакций пользователя: {request.user.username}")
         
-        transactions = Transaction.objects.filter(
-            Q(from_user=request.user) | Q(to_user=request.user)
-        ).order_by('-created_at')
+        def load_transactions():
+            transactions = Transaction.objects.filter(
+                Q(from_user=request.user) | Q(to_user=request.user)
+            ).order_by('-created_at')
+            if search:
+                transactions = search_transactions(transactions, search)
+            return TransactionSerializer(transactions, many=True).data
+
+        data = coalesce(request, 'transactions', load_transactions)
         
-        transaction_count = transactions.count()
+        transaction_count = len(data)
         logger.debug(f"Найдено {transaction_count} транзакций для пользователя {request.user.username}")
         
-        serializer = TransactionSerializer(transactions, many=True)
-        
-        transaction_logger.info(f"TRANSACTIONS_VIEW | user={request.user.username} | count={transaction_count}")
+        search_field = f" | q={search}" if search else ""
+        transaction_logger.info(
+            f"TRANSACTIONS_VIEW | user={request.user.username} | count={transaction_count}{search_field}"
+        )
         
-        return Response(serializer.data)
+        return Response(data)
         
     except Exception as e:
         logger.error(f"Ошибка при получении транзакций пользователя {request.user.username}: {str(e)}")
@@ -374,6 +531,163 @@ def get_transactions(request):
         )
 
 
+def transaction_ids_since(user, since_id, limit):
+    """
+    id операций пользователя больше since_id по возрастанию.
+    Две половины UNION читают только индексы (from_user, id) и (to_user, id),
+    поэтому пустой ответ стоит двух коротких проб индекса.
+    """
+    outgoing = Transaction.objects.filter(from_user=user, id__gt=since_id).order_by().values('id')
+    incoming = Transaction.objects.filter(to_user=user, id__gt=since_id).order_by().values('id')
+    return list(outgoing.union(incoming).order_by('id').values_list('id', flat=True)[:limit])
+
+
+def get_transactions_delta(request):
+    """
+    Операции пользователя новее отметки в порядке возрастания id:
+    ?since_id=<id> или ?since_ts=<ISO 8601>, ?limit=<1..SYNC_MAX_LIMIT>.
+    Клиент передает полученный next_since_id в следующий запрос; при has_more
+    запрос повторяется сразу. id выдаются до коммита, поэтому операция
+    с меньшим id может стать видимой позже - клиентам, которым это важно,
+    стоит периодически перечитывать историю целиком.
+    """
+    params = request.query_params
+    try:
+        limit = min(int(params.get('limit', SYNC_DEFAULT_LIMIT)), SYNC_MAX_LIMIT)
+        since_id = int(params['since_id']) if 'since_id' in params else None
+        if limit < 1 or (since_id is not None and since_id < 0):
+            raise ValueError
+    except ValueError:
+        logger.warning(f"Некорректные параметры синхронизации от пользователя {request.user.username}: {params.dict()}")
+        return Response(
+            {'error': 'Параметры since_id и limit должны быть неотрицательными целыми числами'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    since_ts = None
+    if since_id is None:
+        try:
+            since_ts = parse_datetime(params['since_ts'])
+        except ValueError:
+            since_ts = None
+        if since_ts is None:
+            logger.warning(f"Некорректный параметр since_ts от пользователя {request.user.username}: {params['since_ts']}")
+            return Response(
+                {'error': 'Параметр since_ts должен быть в формате ISO 8601'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(since_ts):
+            since_ts = timezone.make_aware(since_ts)
+
+    try:
+        def load_delta():
+            if since_id is not None:
+                ids = transaction_ids_since(request.user, since_id, limit + 1)
+                has_more = len(ids) > limit
+                rows = list(
+                    Transaction.objects.filter(id__in=ids[:limit])
+                    .select_related('from_user', 'to_user').order_by('id')
+                )
+            else:
+                rows = list(
+                    Transaction.objects.filter(
+                        Q(from_user=request.user) | Q(to_user=request.user),
+                        created_at__gt=since_ts
+                    ).select_related('from_user', 'to_user').order_by('id')[:limit + 1]
+                )
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+            return {
+                'results': TransactionSerializer(rows, many=True).data,
+                'next_since_id': rows[-1].id if rows else since_id,
+                'has_more': has_more,
+            }
+
+        data = coalesce(request, 'transactions_delta', load_delta)
+
+        transaction_logger.info(
+            f"TRANSACTIONS_SYNC | user={request.user.username} | "
+            f"since_id={since_id} | since_ts={params.get('since_ts')} | count={len(data['results'])}"
+        )
+        return Response(data)
+
+    except Exception as e:
+        logger.error(f"Ошибка при синхронизации транзакций пользователя {request.user.username}: {str(e)}")
+        security_logger.error(f"TRANSACTIONS_ERROR | user={request.user.username} | error={str(e)}")
+        return Response(
+            {'error': 'Ошибка при получении истории транзакций'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+def authenticate_events_request(request):
+    """
+    Аутентификация классами DRF для асинхронного представления без @api_view
+    """
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+async def balance_events(request):
+    """
+    Уведомления об изменении баланса пользователя.
+    По умолчанию - поток server-sent events (только под ASGI), соединение
+    закрывается через STREAM_SECONDS и переоткрывается клиентом;
+    ?mode=poll - long-poll: одно сообщение или 204 через timeout секунд.
+    После (пере)подключения клиенту стоит один раз прочитать баланс:
+    изменения между соединениями не хранятся.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Метод "{request.method}" не разрешен.'}, status=405)
+
+    user = await sync_to_async(authenticate_events_request)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+
+    if request.GET.get('mode') == 'poll':
+        try:
+            timeout = float(request.GET['timeout']) if 'timeout' in request.GET else None
+        except ValueError:
+            return JsonResponse({'error': 'Параметр timeout должен быть числом'}, status=400)
+
+        message = await next_message(user.id, timeout)
+        if message is None:
+            return HttpResponse(status=204)
+        return JsonResponse(message)
+
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Поток событий доступен только под ASGI, используйте mode=poll'}, status=400)
+
+    logger.debug(f"Открыт поток событий пользователя {user.username}")
+    response = StreamingHttpResponse(event_stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_metrics(request):
+    """
+    Метрики процесса: объединение запросов на чтение, кэши аутентификации,
+    групповая фиксация, очередь outbox и подписки на события
+    """
+    return Response({
+        'coalescing': reads.stats(),
+        'token_auth_cache': token_cache.stats(),
+        'basic_auth_cache': basic_auth_cache.stats(),
+        'group_commit': committer.stats(),
+        'outbox': backlog_stats(),
+        'events': broker.stats(),
+    })
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CustomLogoutView(View):
     """
@@ -387,6 +701,7 @@ class CustomLogoutView(View):
         username = request.user.username if was_authenticated else 'anonymous'
         
         if was_authenticated:
+            invalidate_user_tokens(request.user.pk)
             logout(request)
             logger.info(f"Пользователь {username} успешно вышел из системы")
             message = 'Вы успешно вышли из системы'